@@ -0,0 +1,242 @@
+import asyncio
+import json
+import os
+from metrics import ERRORS, FILTER_UPDATES
+
+FILTER_UPDATE_INTERVAL = float(os.getenv("FILTER_UPDATE_INTERVAL", "0.5"))
+EQUALIZER_BANDS = 15
+
+##############################################
+# STATO DEI FILTRI AUDIO
+##############################################
+# Ogni player ha un FilterState (equalizer a 15 bande, timescale, passa-basso,
+# volume del filtro). Lo stato e' immutabile: replace() ne restituisce una
+# copia modificata. L'op "filters" di Lavalink sostituisce tutti i filtri
+# attivi, quindi il payload contiene sempre lo stato completo (i filtri ai
+# valori neutri vengono omessi).
+
+class FilterState:
+    __slots__ = ("equalizer", "timescale", "low_pass", "volume")
+
+    def __init__(self, equalizer=None, timescale=None, low_pass=None, volume=1.0):
+        gains = [0.0] * EQUALIZER_BANDS
+        for band, gain in (equalizer or ()):
+            if 0 <= band < EQUALIZER_BANDS:
+                gains[band] = max(-0.25, min(1.0, float(gain)))
+        self.equalizer = tuple(gains)
+        # timescale: (speed, pitch, rate); low_pass: smoothing
+        self.timescale = tuple(float(v) for v in timescale) if timescale else None
+        self.low_pass = float(low_pass) if low_pass else None
+        self.volume = max(0.0, min(5.0, float(volume)))
+
+    def replace(self, **changes) -> "FilterState":
+        values = {
+            "equalizer": self.bands(),
+            "timescale": self.timescale,
+            "low_pass": self.low_pass,
+            "volume": self.volume
+        }
+        values.update(changes)
+        return FilterState(**values)
+
+    def bands(self) -> list:
+        return [(band, gain) for band, gain in enumerate(self.equalizer) if gain]
+
+    def is_neutral(self) -> bool:
+        return self == NEUTRAL
+
+    def payload(self) -> dict:
+        payload = {}
+        if self.volume != 1.0:
+            payload["volume"] = self.volume
+        if any(self.equalizer):
+            payload["equalizer"] = [{"band": band, "gain": gain} for band, gain in enumerate(self.equalizer)]
+        if self.timescale is not None:
+            speed, pitch, rate = self.timescale
+            payload["timescale"] = {"speed": speed, "pitch": pitch, "rate": rate}
+        if self.low_pass is not None:
+            payload["lowPass"] = {"smoothing": self.low_pass}
+        return payload
+
+    def to_dict(self) -> dict:
+        # formato degli snapshot delle sessioni (player_sessions.py)
+        return {
+            "equalizer": self.bands(),
+            "timescale": list(self.timescale) if self.timescale else None,
+            "low_pass": self.low_pass,
+            "volume": self.volume
+        }
+
+    @classmethod
+    def from_dict(cls, data: dict | None) -> "FilterState":
+        if not data:
+            return NEUTRAL
+        return cls(
+            equalizer=[tuple(band) for band in data.get("equalizer") or ()],
+            timescale=data.get("timescale"),
+            low_pass=data.get("low_pass"),
+            volume=data.get("volume", 1.0)
+        )
+
+    def _key(self):
+        return (self.equalizer, self.timescale, self.low_pass, self.volume)
+
+    def __eq__(self, other):
+        return isinstance(other, FilterState) and self._key() == other._key()
+
+    def __hash__(self):
+        return hash(self._key())
+
+NEUTRAL = FilterState()
+
+##############################################
+# PRESET
+##############################################
+PRESETS = {
+    "flat": NEUTRAL,
+    "bassboost": FilterState(equalizer=[
+        (0, 0.5), (1, 0.45), (2, 0.40), (3, 0.30), (4, 0.20), (5, 0.00), (6, -0.10),
+        (7, -0.20), (8, -0.30), (9, -0.20), (10, -0.10)
+    ]),
+    "nightcore": FilterState(timescale=(1.2, 1.2, 1.0)),
+    "vaporwave": FilterState(timescale=(0.85, 0.8, 1.0), low_pass=20.0),
+    "soft": FilterState(low_pass=20.0),
+    "treble": FilterState(equalizer=[(10, 0.1), (11, 0.2), (12, 0.3), (13, 0.35), (14, 0.4)])
+}
+
+PRESET_LABELS = {
+    "flat": "Nessun filtro",
+    "bassboost": "Bass boost",
+    "nightcore": "Nightcore",
+    "vaporwave": "Vaporwave",
+    "soft": "Morbido (passa-basso)",
+    "treble": "Alti potenziati"
+}
+
+def preset(name: str) -> FilterState:
+    try:
+        return PRESETS[name]
+    except KeyError:
+        raise ValueError(f"Preset sconosciuto: {name}") from None
+
+##############################################
+# INVIO DEI FILTRI A LAVALINK
+##############################################
+# Il modo di inviare un payload sul websocket del nodo dipende dalla versione
+# di wavelink: viene risolto una volta per websocket e tenuto in cache sul
+# nodo. Si ricontrolla solo che il websocket sia ancora lo stesso.
+
+_WEBSOCKET_ATTRS = ("_websocket", "_ws", "ws")
+
+class _Transport:
+    __slots__ = ("attr", "websocket", "send")
+
+    def __init__(self, attr, websocket, send):
+        self.attr = attr
+        self.websocket = websocket
+        self.send = send
+
+def _resolve_transport(node) -> _Transport | None:
+    for attr in _WEBSOCKET_ATTRS:
+        ws = getattr(node, attr, None)
+        if ws is None:
+            continue
+        if hasattr(ws, "send_json"):
+            return _Transport(attr, ws, ws.send_json)
+        if hasattr(ws, "send_str"):
+            return _Transport(attr, ws, lambda payload, ws=ws: ws.send_str(json.dumps(payload)))
+        if hasattr(ws, "send"):
+            # wavelink 1.x: Websocket.send(**data)
+            return _Transport(attr, ws, lambda payload, ws=ws: ws.send(**payload))
+    return None
+
+def node_transport(node) -> _Transport | None:
+    transport = getattr(node, "_filter_transport", None)
+    if transport is not None and getattr(node, transport.attr, None) is transport.websocket:
+        return transport
+    transport = _resolve_transport(node)
+    if transport is not None:
+        node._filter_transport = transport
+    return transport
+
+async def send_filters(player, payload: dict):
+    transport = node_transport(player.node)
+    if transport is None:
+        raise RuntimeError(f"nessun websocket disponibile sul nodo {getattr(player.node, 'identifier', '?')}")
+    await transport.send({"op": "filters", "guildId": str(player.guild.id), **payload})
+
+##############################################
+# AGGIORNAMENTO DEI FILTRI DI UN PLAYER
+##############################################
+# Come per il messaggio di controllo (now_playing.py): le modifiche
+# ravvicinate vengono unite, si invia al massimo un payload ogni
+# FILTER_UPDATE_INTERVAL secondi e nulla se lo stato e' identico a quello gia'
+# applicato sul nodo.
+
+class FilterController:
+    def __init__(self, player, interval: float = FILTER_UPDATE_INTERVAL):
+        self.player = player
+        self.interval = interval
+        self.state = NEUTRAL
+        self._applied = NEUTRAL
+        self._last_send = None
+        self._task = None
+
+    def set(self, state: FilterState) -> asyncio.Task:
+        # il task restituito termina quando lo stato e' stato inviato (True) o
+        # l'invio e' fallito (False)
+        self.state = state
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+        return self._task
+
+    def update(self, **changes) -> asyncio.Task:
+        return self.set(self.state.replace(**changes))
+
+    def apply_preset(self, name: str) -> asyncio.Task:
+        return self.set(preset(name))
+
+    def reset(self):
+        # nuovo nodo o nuova connessione: sul nodo non c'e' nessun filtro
+        self.cancel()
+        self._applied = NEUTRAL
+        self._last_send = None
+
+    def restore(self) -> asyncio.Task | None:
+        self.reset()
+        if self.state.is_neutral():
+            return None
+        return self.set(self.state)
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        while self.state != self._applied:
+            if self._last_send is not None:
+                delay = self._last_send + self.interval - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            if not await self.flush():
+                return self.state == self._applied
+        return True
+
+    async def flush(self) -> bool:
+        state = self.state
+        if state == self._applied:
+            FILTER_UPDATES.inc(result="unchanged")
+            return False
+        self._last_send = asyncio.get_running_loop().time()
+        try:
+            await send_filters(self.player, state.payload())
+        except Exception as e:
+            FILTER_UPDATES.inc(result="error")
+            ERRORS.inc(source="filters")
+            print(f"Errore nell'invio dei filtri della gilda {self.player.guild.id}: {e}")
+            return False
+        self._applied = state
+        FILTER_UPDATES.inc(result="sent")
+        return True
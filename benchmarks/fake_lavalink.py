@@ -0,0 +1,155 @@
+import asyncio
+import base64
+import hashlib
+import json
+import random
+from urllib.parse import parse_qs, urlparse
+from aiohttp import WSMsgType, web
+from track_codec import decode_track, encode_track
+
+##############################################
+# NODO LAVALINK FINTO (protocollo v3)
+##############################################
+# Risponde a /loadtracks con risultati costruiti dalla query (sempre gli
+# stessi per la stessa query), accetta il websocket del client e conta le
+# operazioni ricevute (play, stop, volume, filters...). La latenza di ogni
+# risposta REST e' configurabile, con un jitter opzionale.
+# Le tracce sono codificate nel formato binario vero di Lavalink (track_codec),
+# quindi il bot le decodifica in locale come farebbe con un nodo reale.
+
+def fake_video_id(seed: str) -> str:
+    digest = hashlib.sha1(seed.encode("utf-8")).digest()
+    return base64.urlsafe_b64encode(digest).decode("ascii")[:11]
+
+def fake_track(video_id: str) -> dict:
+    info = {
+        "identifier": video_id,
+        "isSeekable": True,
+        "author": "Artista di prova",
+        "length": 180000 + int(video_id.encode("utf-8").hex()[:4], 16) % 120000,
+        "isStream": False,
+        "position": 0,
+        "title": f"Brano di prova {video_id}",
+        "uri": f"https://www.youtube.com/watch?v={video_id}",
+        "sourceName": "youtube"
+    }
+    return {"track": encode_track(info), "info": info}
+
+def _video_id_from(identifier: str) -> str | None:
+    parsed = urlparse(identifier)
+    if parsed.netloc.endswith("youtu.be"):
+        return parsed.path.lstrip("/")[:11] or None
+    ids = parse_qs(parsed.query).get("v")
+    return ids[0] if ids else None
+
+class FakeLavalink:
+    def __init__(self, host="127.0.0.1", port=0, password="benchmark", latency=0.02, jitter=0.0,
+                 miss_rate=0.0, search_results=5, seed=0):
+        self.host = host
+        self.port = port
+        self.password = password
+        self.latency = latency
+        self.jitter = jitter
+        self.miss_rate = miss_rate
+        self.search_results = search_results
+        self.random = random.Random(seed)
+        self.requests = 0
+        self.ops = {}
+        self.sockets = set()
+        self._runner = None
+
+    async def _delay(self):
+        delay = self.latency + (self.random.uniform(0, self.jitter) if self.jitter else 0.0)
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    def _authorized(self, request):
+        return request.headers.get("Authorization") == self.password
+
+    async def load_tracks(self, request):
+        if not self._authorized(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        self.requests += 1
+        await self._delay()
+        identifier = request.query.get("identifier", "")
+        if self.miss_rate and self.random.random() < self.miss_rate:
+            return web.json_response({"loadType": "NO_MATCHES", "playlistInfo": {}, "tracks": []})
+
+        if identifier.startswith(("ytsearch:", "ytmsearch:", "scsearch:")):
+            query = identifier.split(":", 1)[1]
+            tracks = [fake_track(fake_video_id(f"{query}#{i}")) for i in range(self.search_results)]
+            return web.json_response({"loadType": "SEARCH_RESULT", "playlistInfo": {}, "tracks": tracks})
+
+        video_id = _video_id_from(identifier) or fake_video_id(identifier)
+        return web.json_response({"loadType": "TRACK_LOADED", "playlistInfo": {}, "tracks": [fake_track(video_id)]})
+
+    async def decode_track(self, request):
+        if not self._authorized(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        self.requests += 1
+        await self._delay()
+        encoded = request.query.get("track") or request.query.get("encodedTrack", "")
+        return web.json_response(decode_track(encoded))
+
+    async def decode_tracks(self, request):
+        if not self._authorized(request):
+            return web.json_response({"error": "Unauthorized"}, status=401)
+        self.requests += 1
+        await self._delay()
+        encoded = await request.json()
+        return web.json_response([
+            {"track": item, "info": decode_track(item)} for item in encoded
+        ])
+
+    async def websocket(self, request):
+        if not self._authorized(request):
+            return web.Response(status=401)
+        ws = web.WebSocketResponse()
+        await ws.prepare(request)
+        self.sockets.add(ws)
+        try:
+            async for message in ws:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                op = json.loads(message.data).get("op")
+                self.ops[op] = self.ops.get(op, 0) + 1
+        finally:
+            self.sockets.discard(ws)
+        return ws
+
+    async def send_stats(self, players=0, system_load=0.1, lavalink_load=0.05):
+        payload = {
+            "op": "stats",
+            "players": players,
+            "playingPlayers": players,
+            "uptime": 1000,
+            "memory": {"free": 1, "used": 1, "allocated": 2, "reservable": 4},
+            "cpu": {"cores": 4, "systemLoad": system_load, "lavalinkLoad": lavalink_load},
+            "frameStats": {"sent": 3000, "nulled": 0, "deficit": 0}
+        }
+        for ws in list(self.sockets):
+            await ws.send_json(payload)
+
+    async def start(self):
+        app = web.Application()
+        app.router.add_get("/", self.websocket)
+        app.router.add_get("/loadtracks", self.load_tracks)
+        app.router.add_get("/decodetrack", self.decode_track)
+        app.router.add_post("/decodetracks", self.decode_tracks)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        if not self.port:
+            self.port = self._runner.addresses[0][1]
+        return self
+
+    async def stop(self):
+        for ws in list(self.sockets):
+            await ws.close()
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+    def node_config(self, identifier="nodo-bench") -> dict:
+        return {"identifier": identifier, "host": self.host, "port": self.port, "password": self.password}
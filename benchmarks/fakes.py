@@ -0,0 +1,183 @@
+import asyncio
+import itertools
+from types import SimpleNamespace
+import discord
+
+##############################################
+# OGGETTI DISCORD FINTI
+##############################################
+# Quanto basta di Interaction, Guild, canale vocale e messaggi perche' i
+# comandi e le callback del bot girino senza gateway ne' API di Discord.
+# Ogni chiamata "HTTP" (risposte, followup, edit) attende discord_latency.
+# FakeInteraction e' una vera discord.Interaction (con created_at datetime),
+# cosi' @traced di tracing.py misura anche i comandi lanciati dal benchmark.
+
+_ids = itertools.count(10_000)
+
+def next_id() -> int:
+    return next(_ids)
+
+class FakeClient:
+    def __init__(self):
+        self.user = SimpleNamespace(id=next_id(), name="SonoraBench")
+        self.shard_count = 1
+        self.events = {}
+        self._connection = SimpleNamespace(_remove_voice_client=lambda key: None)
+
+    @property
+    def loop(self):
+        return asyncio.get_running_loop()
+
+    def is_closed(self):
+        return False
+
+    def dispatch(self, event, *args, **kwargs):
+        self.events[event] = self.events.get(event, 0) + 1
+
+class FakeMessage:
+    def __init__(self, latency: float, content=None, embed=None, view=None):
+        self.id = next_id()
+        self.latency = latency
+        self.content = content
+        self.embeds = [embed] if embed is not None else []
+        self.view = view
+        self.edits = 0
+        self.deleted = False
+
+    async def edit(self, **fields):
+        await asyncio.sleep(self.latency)
+        self.edits += 1
+        if fields.get("embed") is not None:
+            self.embeds = [fields["embed"]]
+        if "view" in fields:
+            self.view = fields["view"]
+        return self
+
+    async def delete(self):
+        await asyncio.sleep(self.latency)
+        self.deleted = True
+
+class FakeUser:
+    def __init__(self, voice_channel=None):
+        self.id = next_id()
+        self.name = f"utente-{self.id}"
+        self.avatar = None
+        self.display_avatar = SimpleNamespace(url="https://cdn.discordapp.com/embed/avatars/0.png")
+        self.voice = SimpleNamespace(channel=voice_channel) if voice_channel is not None else None
+
+    def __str__(self):
+        return self.name
+
+class FakeGuild:
+    def __init__(self, client):
+        self.id = next_id()
+        self.client = client
+        self.voice_client = None
+        self.voice_state_changes = 0
+
+    async def change_voice_state(self, *, channel, self_mute=False, self_deaf=False):
+        self.voice_state_changes += 1
+        if channel is None:
+            self.voice_client = None
+
+class FakeVoiceChannel:
+    # durata dell'handshake vocale di una nuova connessione (s)
+    handshake_latency = 0.0
+
+    def __init__(self, guild):
+        self.id = next_id()
+        self.guild = guild
+        self.name = f"vocale-{self.id}"
+
+    def _get_voice_client_key(self):
+        return self.guild.id, "guild_id"
+
+    async def connect(self, *, timeout=60.0, reconnect=True, cls=None, self_deaf=False, self_mute=False):
+        # come discord.VoiceChannel.connect, ma senza gateway vocale
+        await asyncio.sleep(self.handshake_latency)
+        voice = cls(self.guild.client, self)
+        self.guild.voice_client = voice
+        await voice.connect(timeout=timeout, reconnect=reconnect, self_deaf=self_deaf, self_mute=self_mute)
+        return voice
+
+class FakeResponse:
+    def __init__(self, interaction, latency: float):
+        # _parent come in discord.InteractionResponse: gli hook di tracing lo usano
+        self._parent = interaction
+        self.latency = latency
+        self._done = False
+        self.first_response_at = None
+        self.kind = None
+
+    def is_done(self):
+        return self._done
+
+    async def _respond(self, kind):
+        if self._done:
+            raise RuntimeError("Interazione gia' risposta")
+        self.first_response_at = asyncio.get_running_loop().time()
+        self.kind = kind
+        self._done = True
+        await asyncio.sleep(self.latency)
+
+    async def defer(self, *, ephemeral=False, thinking=False):
+        await self._respond("defer")
+
+    async def send_message(self, content=None, *, embed=None, view=None, ephemeral=False, **kwargs):
+        await self._respond("send_message")
+        self._parent.sent.append(FakeMessage(self.latency, content, embed, view))
+
+    async def edit_message(self, *, embed=None, view=None, **kwargs):
+        await self._respond("edit_message")
+        if self._parent.message is not None:
+            self._parent.message.embeds = [embed] if embed is not None else self._parent.message.embeds
+            self._parent.message.view = view
+
+    async def send_modal(self, modal):
+        await self._respond("send_modal")
+
+class FakeFollowup:
+    def __init__(self, interaction, latency: float):
+        self._interaction = interaction
+        self.latency = latency
+
+    async def send(self, content=None, *, embed=None, view=None, ephemeral=False, **kwargs):
+        await asyncio.sleep(self.latency)
+        message = FakeMessage(self.latency, content, embed, view)
+        self._interaction.sent.append(message)
+        return message
+
+class FakeInteraction(discord.Interaction):
+    # discord.Interaction legge questi campi dal payload e dallo stato del
+    # client: qui diventano semplici attributi dell'istanza
+    guild = None
+    channel_id = None
+    command = None
+    response = None
+    followup = None
+    created_at = None
+
+    def __init__(self, guild, user, latency: float = 0.05, message=None):
+        self.id = next_id()
+        self.guild = guild
+        self.guild_id = guild.id
+        self.channel_id = next_id()
+        self.user = user
+        self.message = message
+        self.sent = []
+        self.created_at = discord.utils.utcnow()
+        self.started_at = asyncio.get_running_loop().time()
+        self.response = FakeResponse(self, latency)
+        self.followup = FakeFollowup(self, latency)
+
+    @property
+    def time_to_first_response(self):
+        if self.response.first_response_at is None:
+            return None
+        return self.response.first_response_at - self.started_at
+
+def make_guild(client):
+    guild = FakeGuild(client)
+    channel = FakeVoiceChannel(guild)
+    user = FakeUser(channel)
+    return guild, channel, user
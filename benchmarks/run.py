@@ -0,0 +1,451 @@
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+##############################################
+# BENCHMARK OFFLINE DI SONORABOT
+##############################################
+# Avvia un nodo Lavalink finto in locale, sostituisce Discord con gli oggetti
+# di fakes.py e misura i percorsi caldi del bot:
+#   playlist_import  -> get_playlist_tracks e /play con una playlist YouTube
+#   skips            -> MusicControls.skip e on_wavelink_track_end su tante gilde insieme
+#   mutations        -> funzioni di playlist_manager su entrambi i backend
+#   saved_playlist   -> riproduzione di una playlist salvata (ex PlayButton.callback)
+#   stop_replay      -> /play dopo Stop e da un altro canale (connessione vocale riusata)
+#
+# Uso: python benchmarks/run.py [--scenario ...] [--output risultati.json]
+#      [--baseline vecchi.json --tolerance 0.25]
+# Con --baseline il processo esce con codice 1 se un p99 peggiora oltre la
+# tolleranza, cosi' puo' girare prima di un deploy.
+
+SCENARIOS = ("playlist_import", "skips", "mutations", "saved_playlist", "stop_replay")
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark offline di SonoraBot")
+    parser.add_argument("--scenario", choices=SCENARIOS + ("all",), default="all")
+    parser.add_argument("--lavalink-latency", type=float, default=0.02, help="latenza REST del Lavalink finto (s)")
+    parser.add_argument("--lavalink-jitter", type=float, default=0.01, help="jitter massimo aggiunto alla latenza (s)")
+    parser.add_argument("--discord-latency", type=float, default=0.05, help="latenza delle chiamate a Discord (s)")
+    parser.add_argument("--voice-latency", type=float, default=0.3, help="durata dell'handshake di una nuova connessione vocale (s)")
+    parser.add_argument("--extract-latency", type=float, default=0.5, help="durata di un'estrazione yt-dlp finta (s)")
+    parser.add_argument("--miss-rate", type=float, default=0.0, help="frazione di ricerche senza risultato")
+    parser.add_argument("--tracks", type=int, default=200, help="brani per playlist")
+    parser.add_argument("--guilds", type=int, default=50, help="gilde che saltano brani in contemporanea")
+    parser.add_argument("--rounds", type=int, default=5, help="giri di skip/fine brano per gilda")
+    parser.add_argument("--mutations", type=int, default=1000, help="operazioni sulle playlist per backend")
+    parser.add_argument("--iterations", type=int, default=3, help="ripetizioni degli scenari di import")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="salva i risultati in JSON")
+    parser.add_argument("--baseline", help="confronta con un JSON salvato in precedenza")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="peggioramento massimo accettato del p99")
+    return parser.parse_args(argv)
+
+def prepare_environment(workdir):
+    # tutti i file del bot (database, cache, log) finiscono nella cartella temporanea
+    os.environ.setdefault("DISCORD_TOKEN", "benchmark")
+    os.environ["PLAYLIST_BACKEND"] = "sqlite"
+    os.environ["PLAYLIST_DB"] = os.path.join(workdir, "playlists.db")
+    os.environ["TRACK_CACHE_DB"] = os.path.join(workdir, "track_cache.db")
+    os.environ["PLAYER_SESSIONS_DB"] = os.path.join(workdir, "player_sessions.db")
+    os.environ["SLOW_INTERACTION_LOG"] = os.path.join(workdir, "slow_interactions.jsonl")
+    os.environ.pop("METRICS_PORT", None)
+    os.environ.pop("LAVALINK_NODES", None)
+    os.chdir(workdir)
+    sys.path.insert(0, ROOT)
+    sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+##############################################
+# RACCOLTA DEI TEMPI
+##############################################
+def percentile(values, p):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(0, math.ceil(p / 100 * len(ordered)) - 1)
+    return ordered[rank]
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+        self.windows = {}
+
+    async def measure(self, name, coro):
+        start = time.perf_counter()
+        try:
+            return await coro
+        finally:
+            end = time.perf_counter()
+            self.samples.setdefault(name, []).append(end - start)
+            first, last = self.windows.get(name, (start, end))
+            self.windows[name] = (min(first, start), max(last, end))
+
+    def add(self, name, value):
+        self.samples.setdefault(name, []).append(value)
+
+    def results(self) -> dict:
+        results = {}
+        for name, values in self.samples.items():
+            # misure concorrenti: conta la finestra; sequenziali ma alternate: la somma
+            window = self.windows.get(name)
+            elapsed = min(window[1] - window[0], sum(values)) if window else sum(values)
+            results[name] = {
+                "n": len(values),
+                "throughput": len(values) / elapsed if elapsed > 0 else 0.0,
+                "p50": percentile(values, 50),
+                "p99": percentile(values, 99),
+                "max": max(values)
+            }
+        return results
+
+def print_report(results):
+    width = max([len(name) for name in results] + [10])
+    print(f"\n{'scenario'.ljust(width)}  {'n':>6}  {'op/s':>9}  {'p50 ms':>9}  {'p99 ms':>9}  {'max ms':>9}")
+    for name, r in results.items():
+        print(
+            f"{name.ljust(width)}  {r['n']:>6}  {r['throughput']:>9.1f}  "
+            f"{r['p50'] * 1000:>9.2f}  {r['p99'] * 1000:>9.2f}  {r['max'] * 1000:>9.2f}"
+        )
+
+def compare(results, baseline, tolerance) -> list[str]:
+    regressions = []
+    for name, old in baseline.items():
+        new = results.get(name)
+        if new is None or old["p99"] <= 0:
+            continue
+        change = (new["p99"] - old["p99"]) / old["p99"]
+        if change > tolerance:
+            regressions.append(f"{name}: p99 {old['p99'] * 1000:.2f} ms -> {new['p99'] * 1000:.2f} ms (+{change:.0%})")
+    return regressions
+
+##############################################
+# SERVIZI FINTI
+##############################################
+class FakeExtractionService:
+    # prende il posto del pool yt-dlp: restituisce playlist generate al volo
+    def __init__(self, latency, tracks):
+        self.latency = latency
+        self.tracks = tracks
+
+    async def extract(self, query, guild_id=None, timeout=None):
+        from fake_lavalink import fake_video_id
+        await asyncio.sleep(self.latency)
+        return {
+            "_type": "playlist",
+            "entries": [{"id": fake_video_id(f"{query}#{i}")} for i in range(self.tracks)]
+        }
+
+    def stats(self):
+        return {"queue_depth": 0, "running": 0}
+
+class Context:
+    def __init__(self, args, workdir):
+        self.args = args
+        self.workdir = workdir
+        self.random = random.Random(args.seed)
+        self.recorder = Recorder()
+        self.client = None
+        self.lavalink = None
+        self.node = None
+
+async def start_backend(ctx):
+    import extraction
+    from fake_lavalink import FakeLavalink
+    from fakes import FakeClient, FakeResponse
+    from node_pool import all_nodes, connect_nodes, node_is_available
+    from playlist_manager import init_store
+    from track_cache import init_track_cache
+    from tracing import install_response_hooks
+
+    args = ctx.args
+    extraction._service = FakeExtractionService(args.extract_latency, args.tracks)
+    ctx.lavalink = await FakeLavalink(
+        latency=args.lavalink_latency, jitter=args.lavalink_jitter, miss_rate=args.miss_rate, seed=args.seed
+    ).start()
+    ctx.client = FakeClient()
+    # le risposte finte passano dagli stessi hook di @traced
+    install_response_hooks(FakeResponse)
+    await init_store()
+    await init_track_cache()
+    await connect_nodes(ctx.client, [ctx.lavalink.node_config()])
+
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + 10
+    while loop.time() < deadline:
+        ready = [node for node in all_nodes() if node_is_available(node)]
+        if ready:
+            ctx.node = ready[0]
+            return
+        await asyncio.sleep(0.05)
+    raise RuntimeError("Il nodo Lavalink finto non si e' connesso.")
+
+async def new_player(ctx, channel):
+    import bot
+    from node_pool import player_factory
+    return await channel.connect(cls=player_factory(bot.CustomPlayer, ctx.node))
+
+async def wait_loaders(player):
+    if player.loader_tasks:
+        await asyncio.gather(*list(player.loader_tasks), return_exceptions=True)
+
+##############################################
+# SCENARI
+##############################################
+async def scenario_playlist_import(ctx):
+    import bot
+    from fakes import FakeInteraction, make_guild
+    from playlist_manager import get_playlist_tracks
+
+    rec = ctx.recorder
+    args = ctx.args
+    for i in range(args.iterations):
+        url = f"https://www.youtube.com/playlist?list=BENCH{args.seed}x{i}"
+        tracks = await rec.measure("get_playlist_tracks (cache fredda)", get_playlist_tracks(url))
+        rec.add("brani risolti per playlist", len(tracks or []))
+        await rec.measure("get_playlist_tracks (cache calda)", get_playlist_tracks(url))
+
+    for i in range(args.iterations):
+        url = f"https://www.youtube.com/playlist?list=PLAY{args.seed}x{i}"
+        guild, channel, user = make_guild(ctx.client)
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        await rec.measure("/play playlist (fino al primo brano)", bot.play.callback(interaction, url))
+        rec.add("/play playlist: prima risposta", interaction.time_to_first_response or 0.0)
+        player = guild.voice_client
+        await rec.measure("/play playlist (import completo)", wait_loaders(player))
+        await player.disconnect(force=True)
+
+async def scenario_skips(ctx):
+    import bot
+    from fakes import FakeInteraction, FakeMessage, make_guild
+
+    rec = ctx.recorder
+    args = ctx.args
+    base = await bot.get_track("benchmark skip")
+    tracks = [await bot.get_track(f"benchmark skip {i}") or base for i in range(args.rounds * 2 + 2)]
+
+    guilds = []
+    for _ in range(args.guilds):
+        guild, channel, user = make_guild(ctx.client)
+        player = await new_player(ctx, channel)
+        player.queue.extend(tracks[1:])
+        await player.play(tracks[0])
+        player.current = tracks[0]
+        message = FakeMessage(args.discord_latency)
+        player.set_control_message(message, player.card.render(tracks[0], player.volume), None)
+        guilds.append((guild, user, player))
+
+    async def skip(guild, user, player):
+        interaction = FakeInteraction(guild, user, args.discord_latency, message=player.control_message)
+        view = bot.player_controls(player)
+        await rec.measure("MusicControls.skip", view.skip.callback(interaction))
+        rec.add("MusicControls.skip: prima risposta", interaction.time_to_first_response or 0.0)
+        # Lavalink notifica la fine del brano sostituito
+        await rec.measure("on_wavelink_track_end (REPLACED)",
+                          bot.on_wavelink_track_end(player, player.current, "REPLACED"))
+
+    async def track_end(player):
+        await rec.measure("on_wavelink_track_end (FINISHED)",
+                          bot.on_wavelink_track_end(player, player.current, "FINISHED"))
+
+    for _ in range(args.rounds):
+        await asyncio.gather(*(skip(*g) for g in guilds))
+        await asyncio.gather(*(track_end(player) for _, _, player in guilds))
+
+    edits = sum(player.control_message.edits for _, _, player in guilds if player.control_message)
+    print(f"✏️ Modifiche ai messaggi di controllo: {edits} per {args.guilds * args.rounds * 2} cambi di brano")
+    for _, _, player in guilds:
+        await player.disconnect(force=True)
+
+async def scenario_mutations(ctx):
+    import playlist_manager
+    from playlist_store import JsonPlaylistStore, SqlitePlaylistStore
+
+    rec = ctx.recorder
+    args = ctx.args
+    rnd = ctx.random
+    previous = playlist_manager._store
+
+    for backend in ("sqlite", "json"):
+        folder = os.path.join(ctx.workdir, f"mutations-{backend}")
+        os.makedirs(folder, exist_ok=True)
+        if backend == "sqlite":
+            store = SqlitePlaylistStore(os.path.join(folder, "playlists.db"))
+        else:
+            store = JsonPlaylistStore(os.path.join(folder, "playlists.json"))
+        playlist_manager._store = store
+        await store.start()
+
+        users = [1000 + i for i in range(20)]
+        names = {}
+        counter = 0
+
+        def pick_playlist():
+            owner = rnd.choice(users)
+            return owner, rnd.choice(names[owner]) if names.get(owner) else None
+
+        for _ in range(args.mutations):
+            counter += 1
+            roll = rnd.random()
+            owner, name = pick_playlist()
+            track = {"title": f"Brano {counter}", "url": f"https://www.youtube.com/watch?v=m{counter:010d}"}
+            if name is None or roll < 0.1:
+                name = f"Playlist {counter}"
+                names.setdefault(owner, []).append(name)
+                await rec.measure(f"{backend}: add_track_to_playlist (nuova)", playlist_manager.add_track_to_playlist(
+                    owner, name, track, rnd.random() < 0.5, True))
+            elif roll < 0.5:
+                await rec.measure(f"{backend}: add_track_to_playlist", playlist_manager.add_track_to_playlist(
+                    owner, name, track, rnd.random() < 0.5))
+            elif roll < 0.55:
+                new_name = f"{name} bis"
+                result = await rec.measure(f"{backend}: rename_playlist",
+                                           playlist_manager.rename_playlist(owner, name, new_name))
+                if result == "renamed":
+                    names[owner][names[owner].index(name)] = new_name
+            elif roll < 0.6:
+                page, _ = await playlist_manager.list_playlist_tracks(owner, name, limit=1)
+                if page:
+                    await rec.measure(f"{backend}: remove_track_from_playlist",
+                                      playlist_manager.remove_track_from_playlist(owner, name, page[0]["url"]))
+            elif roll < 0.62:
+                await rec.measure(f"{backend}: clear_playlist", playlist_manager.clear_playlist(owner, name))
+            elif roll < 0.64:
+                if await rec.measure(f"{backend}: delete_playlist", playlist_manager.delete_playlist(owner, name)):
+                    names[owner].remove(name)
+            elif roll < 0.8:
+                await rec.measure(f"{backend}: list_available_playlists", playlist_manager.list_available_playlists(
+                    owner, None, 0, 10, rnd.choice([None, "popular", "recent"])))
+            elif roll < 0.9:
+                await rec.measure(f"{backend}: get_playlist", playlist_manager.get_playlist(owner, name))
+            else:
+                await rec.measure(f"{backend}: record_playlist_play", playlist_manager.record_playlist_play(owner, name))
+
+        if backend == "json":
+            await rec.measure("json: flush", store.run(store.flush))
+        await asyncio.get_running_loop().run_in_executor(None, store.close)
+
+    playlist_manager._store = previous
+
+async def scenario_saved_playlist(ctx):
+    import bot
+    from fakes import FakeInteraction, make_guild
+    from playlist_manager import add_track_to_playlist, get_playlist
+
+    rec = ctx.recorder
+    args = ctx.args
+    for i in range(args.iterations):
+        guild, channel, user = make_guild(ctx.client)
+        name = f"Bench salvata {i}"
+        for n in range(args.tracks):
+            await add_track_to_playlist(user.id, name, {
+                "title": f"Brano {n}", "url": f"https://www.youtube.com/watch?v=s{i:03d}{n:07d}"
+            }, True, True)
+        summary = await get_playlist(user.id, name)
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        await rec.measure("play_saved_playlist (fino al primo brano)", bot.play_saved_playlist(interaction, summary))
+        rec.add("play_saved_playlist: prima risposta", interaction.time_to_first_response or 0.0)
+        player = guild.voice_client
+        await rec.measure("play_saved_playlist (import completo)", wait_loaders(player))
+        await player.disconnect(force=True)
+
+        # seconda riproduzione: i brani ora hanno la stringa encoded, nessuna richiesta a Lavalink
+        guild, channel, user = make_guild(ctx.client)
+        summary = await get_playlist(summary["owner_id"], name)
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        requests = ctx.lavalink.requests
+        await rec.measure("play_saved_playlist codificata (fino al primo brano)", bot.play_saved_playlist(interaction, summary))
+        player = guild.voice_client
+        await rec.measure("play_saved_playlist codificata (import completo)", wait_loaders(player))
+        rec.add("play_saved_playlist codificata: richieste REST", ctx.lavalink.requests - requests)
+        await player.disconnect(force=True)
+
+async def scenario_stop_replay(ctx):
+    import bot
+    from fakes import FakeInteraction, FakeVoiceChannel, make_guild
+
+    rec = ctx.recorder
+    args = ctx.args
+    FakeVoiceChannel.handshake_latency = args.voice_latency
+    for i in range(args.iterations):
+        guild, channel, user = make_guild(ctx.client)
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        await rec.measure("/play (nuova connessione)", bot.play.callback(interaction, f"benchmark replay {i}"))
+        player = guild.voice_client
+
+        stop = FakeInteraction(guild, user, args.discord_latency, message=player.control_message)
+        await rec.measure("MusicControls.stop", bot.player_controls(player).stop.callback(stop))
+
+        # /play subito dopo Stop: la connessione parcheggiata viene ripresa
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        await rec.measure("/play dopo Stop", bot.play.callback(interaction, f"benchmark replay {i}"))
+
+        # l'utente cambia canale e nessuno ascolta piu' nel vecchio: il player
+        # viene spostato, non riconnesso
+        other = FakeVoiceChannel(guild)
+        user.voice.channel = other
+        interaction = FakeInteraction(guild, user, args.discord_latency)
+        await rec.measure("/play da un altro canale", bot.play.callback(interaction, f"benchmark replay {i}"))
+        rec.add("connessioni vocali per 3 /play", guild.voice_state_changes)
+        await guild.voice_client.disconnect(force=True)
+    FakeVoiceChannel.handshake_latency = 0.0
+
+RUNNERS = {
+    "playlist_import": scenario_playlist_import,
+    "skips": scenario_skips,
+    "mutations": scenario_mutations,
+    "saved_playlist": scenario_saved_playlist,
+    "stop_replay": scenario_stop_replay
+}
+
+async def run(args, workdir):
+    ctx = Context(args, workdir)
+    await start_backend(ctx)
+    try:
+        selected = SCENARIOS if args.scenario == "all" else (args.scenario,)
+        for name in selected:
+            print(f"▶️ Scenario {name}…")
+            await RUNNERS[name](ctx)
+    finally:
+        await ctx.lavalink.stop()
+    print(f"📡 Lavalink finto: {ctx.lavalink.requests} richieste REST, operazioni websocket {ctx.lavalink.ops}")
+    return ctx.recorder.results()
+
+def main(argv=None):
+    args = parse_args(argv)
+    output = os.path.abspath(args.output) if args.output else None
+    baseline = os.path.abspath(args.baseline) if args.baseline else None
+    workdir = tempfile.mkdtemp(prefix="sonora-bench-")
+    cwd = os.getcwd()
+    try:
+        prepare_environment(workdir)
+        results = asyncio.run(run(args, workdir))
+    finally:
+        os.chdir(cwd)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(results)
+    if output:
+        with open(output, "w") as f:
+            json.dump(results, f, indent=4)
+        print(f"\n💾 Risultati salvati in {output}")
+    if baseline:
+        with open(baseline, "r") as f:
+            regressions = compare(results, json.load(f), args.tolerance)
+        if regressions:
+            print("\n❌ Regressioni rispetto al riferimento:")
+            for line in regressions:
+                print(f"  - {line}")
+            return 1
+        print("\n✅ Nessuna regressione rispetto al riferimento.")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
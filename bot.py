@@ -1,29 +1,49 @@
+from startup import startup_timer, sync_command_tree
 import os
 import discord
 from discord.ext import commands
 from discord import app_commands
 import wavelink
-import json
 from dotenv import load_dotenv
 from playlist_manager import (
-    get_user_playlists, 
-    get_user_playlists_full, 
+    init_store,
+    get_playlist,
+    list_user_playlists,
+    list_available_playlists,
+    list_playlist_tracks,
+    record_playlist_play,
+    iter_playlist_tracks,
+    song_from_track,
+    backfill_encoded_tracks,
     add_track_to_playlist, 
-    load_playlists, 
-    save_playlists, 
-    get_available_playlists,
-    get_playlist_tracks
+    clear_playlist,
+    rename_playlist,
+    delete_playlist,
+    remove_track_from_playlist,
+    extract_playlist_entries
 )
-import yt_dlp as youtube_dl 
-import re
+from track_resolver import RESOLVE_TIMEOUT, VIDEO_ID_REGEX, iter_resolved, resolve_query, resolve_url
+from track_cache import init_track_cache
+from track_queue import TrackQueue
+from now_playing import ControlMessageRenderer, NowPlayingCard, track_template
+from extraction import EXTRACT_TIMEOUT
+from metrics import CONTROL_EDIT_SECONDS, ERRORS, PLAYLIST_LOAD_SECONDS, TRACK_END_REASONS, TRACK_LOOKUP_SECONDS, start_metrics_server, timed
+from tracing import install_response_hooks, traced
+from node_pool import all_nodes, connect_nodes, find_player, load_node_configs, monitor_nodes, node_is_available, node_players, pick_node, player_factory, player_position
+from idle_reaper import VOICE_KEEPALIVE, IdleReaper
+from voice_pool import VoicePool
+from sharding import SHARD_COUNT, SHARD_IDS, format_shard_ids, is_primary, owns_guild
+from player_sessions import get_session_store, init_session_store, snapshot_loop, unpack_track
+from audio_filters import PRESET_LABELS, FilterController, FilterState
 import asyncio
+import time
+from abc import ABC, abstractmethod
 
 load_dotenv()
+startup_timer.mark("import moduli")
 
 DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
-LAVALINK_HOST = os.getenv("LAVALINK_HOST")
-LAVALINK_PORT = int(os.getenv("LAVALINK_PORT"))
-LAVALINK_PASSWORD = os.getenv("LAVALINK_PASSWORD")
+LAVALINK_NODES = load_node_configs()
 
 if DISCORD_TOKEN is None:
     raise ValueError("Il token del bot non è stato trovato nel file .env")
@@ -32,201 +52,450 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.voice_states = True
 
-bot = commands.Bot(command_prefix='/', intents=intents)
+if SHARD_COUNT:
+    # SHARD_IDS limita gli shard di questo processo (vedi launcher.py)
+    bot = commands.AutoShardedBot(command_prefix='/', intents=intents, shard_count=SHARD_COUNT, shard_ids=SHARD_IDS)
+else:
+    bot = commands.Bot(command_prefix='/', intents=intents)
 tree = bot.tree
-
-VIDEO_ID_REGEX = re.compile(r"(?:v=|youtu\.be/)([A-Za-z0-9_-]{11})")
+install_response_hooks()
 
 ##############################################
 # FUNZIONI PER LA GESTIONE DEI BRANI
 ##############################################
+@timed(TRACK_LOOKUP_SECONDS)
 async def get_track(query: str) -> wavelink.YouTubeTrack | None:
-    match = VIDEO_ID_REGEX.search(query)
-    if match:
-        video_id = match.group(1)
-        url = f"https://www.youtube.com/watch?v={video_id}"
-        track = await wavelink.YouTubeTrack.search(url, return_first=True)
-        return track  
-
-    return await wavelink.YouTubeTrack.search(query, return_first=True)
+    if VIDEO_ID_REGEX.search(query):
+        return await resolve_url(query)
 
-async def ensure_player_connected(interaction: discord.Interaction) -> wavelink.Player:
+    return await resolve_query(query)
 
-    node = wavelink.NodePool.get_node()
-    player: wavelink.Player = node.get_player(interaction.guild)
-
-    if not player:
-        player = await interaction.user.voice.channel.connect(cls=CustomPlayer)
-    elif not player.is_connected():
-        await player.connect(channel=interaction.user.voice.channel)
+async def connect_player(channel) -> wavelink.Player:
+    return await channel.connect(cls=player_factory(CustomPlayer, pick_node()))
 
+async def ensure_player_connected(interaction: discord.Interaction) -> wavelink.Player:
+    # riusa la connessione gia' aperta nella gilda (anche parcheggiata) o ne apre una nuova
+    player = await voice_pool.acquire(interaction.user.voice.channel, find_player(interaction.guild))
+    reaper.refresh(player, activity=True)
     return player
 
 ##############################################
 # EVENTI DEL BOT
 ##############################################
+node_monitor_task = None
+snapshot_task = None
+backfill_task = None
+services_task = None
+sessions_resumed = False
+ready_once = False
+
+@bot.event
+async def setup_hook():
+    global services_task
+    startup_timer.mark("login")
+    # store, cache, metriche e nodi Lavalink si preparano mentre il gateway si connette
+    services_task = asyncio.create_task(prepare_services())
+    # le quattro varianti si creano subito; stessi custom_id per tutte, quindi
+    # basta registrarne una come view persistente
+    for loop_active in (False, True):
+        for paused in (False, True):
+            control_view(loop_active, paused)
+    bot.add_view(control_view())
+
+async def timed_step(name, coro):
+    with startup_timer.phase(name):
+        return await coro
+
+async def prepare_services():
+    await asyncio.gather(
+        timed_step("store playlist", init_store()),
+        timed_step("cache brani", init_track_cache()),
+        timed_step("sessioni player", init_session_store()),
+        timed_step("server metriche", start_metrics_server())
+    )
+    if not LAVALINK_NODES:
+        print("❌ Nessun nodo Lavalink configurato (LAVALINK_NODES o LAVALINK_HOST).")
+    await timed_step("creazione nodi Lavalink", connect_nodes(bot, LAVALINK_NODES))
+
+async def wait_for_services(interaction: discord.Interaction = None) -> bool:
+    # comandi e pulsanti persistenti arrivano appena il gateway e' connesso,
+    # anche prima che prepare_services abbia aperto store e cache
+    if services_task is not None and not services_task.done():
+        await asyncio.wait({services_task})
+    return True
+
+tree.interaction_check = wait_for_services
+
 @bot.event
 async def on_ready():
+    global node_monitor_task, ready_once
     print(f'{bot.user} pronto!')
-    await tree.sync()
-
     activity = discord.Activity(
         type=discord.ActivityType.listening,
         name="🎶 la musica degli utenti"
     )
     await bot.change_presence(status=discord.Status.online, activity=activity)
-
-    try:
-        wavelink.NodePool.get_node()
-    except wavelink.ZeroConnectedNodes:
-        try:
-            await wavelink.NodePool.create_node(
-                bot=bot,
-                host=LAVALINK_HOST,
-                port=LAVALINK_PORT,
-                password=LAVALINK_PASSWORD
-            )
-            print("⌛ Nodo Lavalink in creazione, attendo conferma di connessione…")
-        except Exception as e:
-            print(f"❌ Errore nel creare il nodo Lavalink: {e}")
-    else:
-        print("ℹ️ Nodo Lavalink già presente nel pool, presumo sia connesso.")
+    if ready_once:
+        # nuova sessione del gateway: servizi e comandi sono gia' pronti
+        return
+    ready_once = True
+    startup_timer.mark("gateway")
+
+    await services_task
+    if is_primary():
+        await timed_step("comandi slash", sync_command_tree(tree, bot.application_id))
+    if SHARD_COUNT:
+        print(f"🧩 Shard {format_shard_ids(bot.shard_ids or range(SHARD_COUNT))} di {SHARD_COUNT}")
+    if node_monitor_task is None:
+        node_monitor_task = asyncio.create_task(monitor_nodes())
+    startup_timer.report()
 
 @bot.event
 async def on_wavelink_node_ready(node):
-    print(f"✅ Nodo Lavalink connesso! ({node.host}:{node.port})")
+    global sessions_resumed, snapshot_task, backfill_task
+    print(f"✅ Nodo Lavalink {node.identifier} connesso! ({node.host}:{node.port})")
+    if not sessions_resumed:
+        # al primo nodo disponibile si riprendono le sessioni salvate prima del riavvio;
+        # il nodo puo' essere pronto prima del gateway, che serve per gilde e canali
+        sessions_resumed = True
+        print(f"⏱️ Primo nodo Lavalink pronto a {startup_timer.elapsed():.2f}s dall'avvio.")
+        await bot.wait_until_ready()
+        await resume_sessions()
+        snapshot_task = asyncio.create_task(snapshot_loop(custom_players, bot.is_closed))
+        if is_primary():
+            backfill_task = asyncio.create_task(backfill_encoded_tracks())
+
+##############################################
+# RIPRESA DELLE SESSIONI DOPO UN RIAVVIO
+##############################################
+# Gli snapshot di player_sessions contengono i brani gia' codificati da
+# Lavalink: il player si ricollega al canale vocale e riparte dalla posizione
+# salvata senza nessuna ricerca. Le gilde senza piu' ascoltatori nel canale
+# vengono saltate (e il loro snapshot scartato al salvataggio successivo).
+
+def custom_players() -> list:
+    return [p for node in all_nodes() for p in node_players(node) if isinstance(p, CustomPlayer)]
+
+async def resume_sessions():
+    sessions = await get_session_store().load(owns=owns_guild)
+    resumed = 0
+    for guild_id, data in sessions.items():
+        try:
+            resumed += await resume_session(guild_id, data)
+        except Exception as e:
+            ERRORS.inc(source="resume")
+            print(f"Errore nella ripresa della sessione della gilda {guild_id}: {e}")
+    if sessions:
+        print(f"⏯️ Riprese {resumed} sessioni su {len(sessions)}.")
+
+async def resume_session(guild_id: int, data: dict) -> bool:
+    guild = bot.get_guild(guild_id)
+    channel = guild.get_channel(data["channel_id"]) if guild is not None else None
+    if channel is None or find_player(guild) is not None:
+        return False
+    if not any(not member.bot for member in getattr(channel, "members", ())):
+        return False
+
+    node = next(
+        (n for n in all_nodes() if n.identifier == data.get("node") and node_is_available(n)),
+        None
+    ) or pick_node()
+    player = await channel.connect(cls=player_factory(CustomPlayer, node))
+
+    current = unpack_track(data["current"], guild)
+    player.queue.extend(unpack_track(entry, guild) for entry in data["queue"])
+    player.loop = data["loop"]
+    await player.play(current, start=int(data["position"] * 1000))
+    player.current = current
+    await player.set_volume(data["volume"])
+    if data["paused"]:
+        await player.set_pause(True)
+        player._custom_paused = True
+    if data.get("filters"):
+        player.filters.set(FilterState.from_dict(data["filters"]))
+    elif data.get("equalizer"):
+        # snapshot salvati prima dei filtri completi
+        player.filters.set(FilterState(equalizer=[tuple(band) for band in data["equalizer"]]))
+
+    reaper.refresh(player)
+
+    if data.get("message"):
+        channel_id, message_id = data["message"]
+        text_channel = guild.get_channel_or_thread(channel_id)
+        if text_channel is not None:
+            # nessuna fetch: il vecchio pannello viene solo modificato
+            message = text_channel.get_partial_message(message_id)
+            player.set_control_message(message)
+            embed = player.card.render(current, player.volume, queue=queue_counter_text(player) if player.queue else None)
+            player.renderer.update(embed=embed, view=player_controls(player))
+    return True
 
 ##############################################
 # COMANDO /playplaylist - Riproduzione Playlist
 ##############################################
 @tree.command(name="playplaylist", description="Scegli una delle playlist visibili da ascoltare")
+@traced
 async def playplaylist(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    playlists = get_available_playlists(interaction.user.id)
-    if not playlists:
+    view = PlaylistSelectView(interaction.user.id)
+    if not await view.load():
         return await interaction.followup.send("❌ Non ci sono playlist disponibili!", ephemeral=True)
+    await interaction.followup.send(embed=view.build_embed(), view=view, ephemeral=True)
 
-    embed = discord.Embed(
-        title="🎷 Le Playlist Disponibili",
-        description="Clicca su una playlist per iniziare l'ascolto",
-        color=discord.Color.purple()
+##############################################
+# BROWSER PAGINATO (playlist e brani)
+##############################################
+# Menu a tendina + pagina precedente/successiva + ricerca. Ogni pagina viene
+# letta dallo store solo quando serve, quindi non ci sono limiti al numero di
+# playlist o di brani (Discord accetta al massimo 25 componenti/campi).
+BROWSER_PAGE_SIZE = 10
+PLAYLIST_SORTS = [
+    ("popular", "🔥 Più ascoltate"),
+    ("recent", "🕒 Più recenti"),
+    ("name", "🔤 Nome")
+]
+
+def describe_playlist(pl) -> tuple[str, str]:
+    stato = "🌐 Pubblica" if pl.get("is_public", False) else "🔒 Privata"
+    return pl["name"], f"{stato} - {pl.get('track_count', 0)} brani - {pl.get('play_count', 0)} ascolti"
+
+class PaginatedBrowserView(discord.ui.View, ABC):
+    title = None
+    description = None
+    color = discord.Color.blurple()
+    placeholder = "Seleziona un elemento"
+    field_prefix = "📁 "
+    sorts = []
+
+    def __init__(self, user_id, page_size: int = BROWSER_PAGE_SIZE):
+        super().__init__(timeout=60)
+        self.user_id = user_id
+        self.page_size = min(page_size, 25)
+        self.page = 0
+        self.query = None
+        self.sort_index = 0
+        self.items = []
+        self.total = 0
+        self.select = discord.ui.Select(placeholder=self.placeholder, min_values=1, max_values=1, row=0)
+        self.select.callback = self.on_select
+        self.add_item(self.select)
+        if self.sorts:
+            self.sort_button = discord.ui.Button(label=self.sorts[0][1], style=discord.ButtonStyle.secondary, row=1)
+            self.sort_button.callback = self.next_sort
+            self.add_item(self.sort_button)
+
+    @property
+    def sort(self):
+        return self.sorts[self.sort_index][0] if self.sorts else None
+
+    @property
+    def pages(self) -> int:
+        return max(1, -(-self.total // self.page_size))
+
+    # da implementare in ogni browser: pagina di elementi, testo della
+    # opzione del menu, azione alla scelta
+    @abstractmethod
+    async def fetch_page(self, query, offset, limit):
+        ...
+
+    @abstractmethod
+    def describe_item(self, item) -> tuple[str, str | None]:
+        ...
+
+    @abstractmethod
+    async def on_pick(self, interaction: discord.Interaction, item):
+        ...
+
+    async def load(self) -> int:
+        self.items, self.total = await self.fetch_page(self.query, self.page * self.page_size, self.page_size)
+        if not self.items and self.page > 0:
+            # la pagina non esiste piu' (elementi eliminati nel frattempo)
+            self.page = self.pages - 1
+            self.items, self.total = await self.fetch_page(self.query, self.page * self.page_size, self.page_size)
+
+        options = []
+        for index, item in enumerate(self.items):
+            label, description = self.describe_item(item)
+            options.append(discord.SelectOption(
+                label=label[:100] or "Sconosciuto",
+                description=description[:100] if description else None,
+                value=str(index)
+            ))
+        self.select.options = options or [discord.SelectOption(label="Nessun risultato", value="-1")]
+        self.select.disabled = not options
+        self.previous_page.disabled = self.page == 0
+        self.next_page.disabled = self.page >= self.pages - 1
+        return self.total
+
+    def build_embed(self) -> discord.Embed:
+        embed = discord.Embed(title=self.title, description=self.description, color=self.color)
+        for item in self.items:
+            label, description = self.describe_item(item)
+            embed.add_field(name=f"{self.field_prefix}{label}"[:256], value=description or "\u200b", inline=False)
+        footer = f"Pagina {self.page + 1}/{self.pages} - {self.total} risultati"
+        if self.query:
+            footer += f" - filtro: \"{self.query}\""
+        embed.set_footer(text=footer)
+        return embed
+
+    async def refresh(self, interaction: discord.Interaction):
+        await self.load()
+        await interaction.response.edit_message(embed=self.build_embed(), view=self)
+
+    @traced
+    async def next_sort(self, interaction: discord.Interaction):
+        self.sort_index = (self.sort_index + 1) % len(self.sorts)
+        self.sort_button.label = self.sorts[self.sort_index][1]
+        self.page = 0
+        await self.refresh(interaction)
+
+    @traced
+    async def on_select(self, interaction: discord.Interaction):
+        index = int(self.select.values[0])
+        if not 0 <= index < len(self.items):
+            return await interaction.response.send_message("Errore: elemento non trovato.", ephemeral=True)
+        await self.on_pick(interaction, self.items[index])
+
+    @discord.ui.button(label="◀️", style=discord.ButtonStyle.secondary, row=1)
+    @traced
+    async def previous_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = max(0, self.page - 1)
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="▶️", style=discord.ButtonStyle.secondary, row=1)
+    @traced
+    async def next_page(self, interaction: discord.Interaction, button: discord.ui.Button):
+        self.page = min(self.pages - 1, self.page + 1)
+        await self.refresh(interaction)
+
+    @discord.ui.button(label="🔎 Cerca", style=discord.ButtonStyle.blurple, row=1)
+    @traced
+    async def search(self, interaction: discord.Interaction, button: discord.ui.Button):
+        await interaction.response.send_modal(BrowserSearchModal(self))
+
+class BrowserSearchModal(discord.ui.Modal, title="🔎 Cerca"):
+    testo = discord.ui.TextInput(
+        label="Testo da cercare",
+        placeholder="Lascia vuoto per vedere tutto",
+        required=False,
+        max_length=100
     )
-    for pl in playlists:
-        stato = "🌐 Pubblica" if pl.get("is_public", False) else "🔒 Privata"
-        embed.add_field(name=f"📁 {pl['name']}", value=f"{stato} - {len(pl['tracks'])} brani", inline=False)
 
-    view = PlaylistSelectView(playlists, interaction.user.id)
-    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
+    def __init__(self, browser):
+        super().__init__()
+        self.browser = browser
+
+    @traced
+    async def on_submit(self, interaction: discord.Interaction):
+        self.browser.query = self.testo.value.strip() or None
+        self.browser.page = 0
+        await self.browser.refresh(interaction)
 
 ##############################################
 # VIEW PER LA SELEZIONE DELLA PLAYLIST
 ##############################################
-class PlaylistSelectView(discord.ui.View):
-    def __init__(self, playlists, user_id):
-        super().__init__(timeout=60)
-        for pl in playlists:
-            self.add_item(PlayButton(pl, user_id))
+class PlaylistSelectView(PaginatedBrowserView):
+    title = "🎷 Le Playlist Disponibili"
+    description = "Scegli una playlist dal menu per iniziare l'ascolto"
+    color = discord.Color.purple()
+    placeholder = "▶️ Scegli la playlist da ascoltare"
+    sorts = PLAYLIST_SORTS
 
+    async def fetch_page(self, query, offset, limit):
+        return await list_available_playlists(self.user_id, query, offset, limit, self.sort)
 
-class PlayButton(discord.ui.Button):
-    def __init__(self, playlist, user_id):
-        super().__init__(label=playlist["name"], style=discord.ButtonStyle.green)
-        self.playlist = playlist
-        self.user_id = user_id
+    def describe_item(self, item):
+        return describe_playlist(item)
 
-    async def callback(self, interaction: discord.Interaction):
-        if not interaction.user.voice or not interaction.user.voice.channel:
-            return await interaction.response.send_message("🔇 Devi essere in un canale vocale!", ephemeral=True)
-
-        player = await ensure_player_connected(interaction)
-
-        tracks_to_add = []
-        for song in self.playlist.get("tracks", []):
-            track = await wavelink.YouTubeTrack.search(song["url"], return_first=True)
-            if track:
-                tracks_to_add.append(track)
-
-        if not tracks_to_add:
-            return await interaction.response.send_message("❌ Playlist vuota!", ephemeral=True)
-
-        if (not player.is_playing() or player.stopped) and not player.control_message:
-            first = tracks_to_add[0]
-            first.requester = interaction.user
-            await player.play(first)
-            player.current = first
-
-            for t in tracks_to_add[1:]:
-                t.requester = interaction.user
-            player.queue.extend(tracks_to_add[1:])
-
-            secs = int(first.length)
-            m, s = divmod(secs, 60)
-            vol = player.volume
-
-            embed = discord.Embed(
-                title=f"▶️ Playlist: {self.playlist['name']}",
-                description=f"[{first.title}]({first.uri})",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=first.thumbnail or "https://via.placeholder.com/150")
-            embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-            embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-            embed.add_field(name="🎧 Brani in coda", value=str(len(player.queue)), inline=True)
-            embed.set_footer(text=f"Richiesto da {first.requester}",
-                             icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
+    async def on_pick(self, interaction: discord.Interaction, item):
+        await play_saved_playlist(interaction, item)
 
-            msg = await interaction.response.send_message(embed=embed, view=MusicControls(first, interaction.guild, loop_active=player.loop))
-            player.control_message = await interaction.original_response()
+async def play_saved_playlist(interaction: discord.Interaction, summary):
+    if not interaction.user.voice or not interaction.user.voice.channel:
+        return await interaction.response.send_message("🔇 Devi essere in un canale vocale!", ephemeral=True)
 
-        else:
-            for t in tracks_to_add:
-                t.requester = interaction.user
-                player.queue.append(t)
-            await interaction.response.send_message(
-                f"✅ Playlist **{self.playlist['name']}** aggiunta in coda con {len(tracks_to_add)} brani.",
-                ephemeral=True
-            )
+    # Risposta immediata: la risoluzione dei brani avviene dopo
+    await interaction.response.defer()
+    playlist = await get_playlist(summary["owner_id"], summary["name"])
+    if playlist is None:
+        return await interaction.followup.send("❌ Playlist non trovata.", ephemeral=True)
+    player = await ensure_player_connected(interaction)
+
+    urls = [song["url"] for song in playlist.get("tracks", []) if song.get("url")]
+    if not urls:
+        return await interaction.followup.send("❌ Playlist vuota!", ephemeral=True)
+    await record_playlist_play(playlist["owner_id"], playlist["name"])
+
+    # brani salvati con la stringa encoded: decodificati in locale, senza ricerche
+    started = time.perf_counter()
+    resolved = iter_playlist_tracks(playlist)
+    failed = []
+
+    if (not player.is_playing() or player.stopped or player.current is None) and not player.control_message:
+        first = None
+        async for index, url, track, error in resolved:
+            if track is not None:
+                first = track
+                break
+            failed.append((index, url, error))
+        if first is None:
+            await resolved.aclose()
+            return await interaction.followup.send("❌ Playlist vuota!", ephemeral=True)
+
+        PLAYLIST_LOAD_SECONDS.observe(time.perf_counter() - started, source="saved", phase="first_track")
+        first.requester = interaction.user
+        await player.play(first)
+        player.current = first
+        player.start_loader(
+            enqueue_remaining(player, resolved, interaction, failed, source="saved", started=started), len(urls) - index - 1
+        )
+
+        embed = player.card.render(
+            first, player.volume, title=f"▶️ Playlist: {playlist['name']}", queue=queue_counter_text(player)
+        )
+        view = player_controls(player)
+        msg = await interaction.followup.send(embed=embed, view=view)
+        player.set_control_message(msg, embed, view)
+
+    else:
+        player.start_loader(enqueue_remaining(player, resolved, interaction, failed, source="saved", started=started), len(urls))
+        await interaction.followup.send(
+            f"✅ Playlist **{playlist['name']}**: {len(urls)} brani in aggiunta alla coda.",
+            ephemeral=True
+        )
 
 ##############################################
 # COMANDO /gestisciplaylist - Gestione Playlist
 ##############################################
 @tree.command(name="gestisciplaylist", description="Gestisci le tue playlist e quelle pubbliche")
+@traced
 async def gestisci_playlist(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    playlists = get_available_playlists(interaction.user.id)
-    if not playlists:
+    view = GestisciPlaylistView(interaction.user.id)
+    if not await view.load():
         return await interaction.followup.send("❌ Non ci sono playlist disponibili!", ephemeral=True)
-    embed = discord.Embed(
-        title="🎛️ Gestione Playlist",
-        description="Clicca su una playlist per gestirla:",
-        color=discord.Color.blurple()
-    )
-    for pl in playlists:
-        stato = "🌐 Pubblica" if pl.get("is_public", False) else "🔒 Privata"
-        embed.add_field(name=f"📁 {pl['name']}", value=f"{stato} - {len(pl['tracks'])} brani", inline=False)
-    view = GestisciPlaylistView(playlists, interaction.user.id)
-    await interaction.followup.send(embed=embed, view=view, ephemeral=True)
-
-class GestisciPlaylistView(discord.ui.View):
-    def __init__(self, playlists, user_id):
-        super().__init__(timeout=60)
-        for pl in playlists:
-            self.add_item(GestisciPlaylistButton(pl, user_id))
+    await interaction.followup.send(embed=view.build_embed(), view=view, ephemeral=True)
 
-class GestisciPlaylistButton(discord.ui.Button):
-    def __init__(self, playlist, user_id):
-        super().__init__(label=playlist["name"], style=discord.ButtonStyle.green)
-        self.playlist = playlist
-        self.user_id = user_id
+class GestisciPlaylistView(PaginatedBrowserView):
+    title = "🎛️ Gestione Playlist"
+    description = "Scegli una playlist dal menu per gestirla:"
+    placeholder = "⚙️ Scegli la playlist da gestire"
+    sorts = PLAYLIST_SORTS[1:] + PLAYLIST_SORTS[:1]
 
-    async def callback(self, interaction: discord.Interaction):
-        owner_id = int(self.playlist.get("owner_id", self.user_id))
-        is_public = self.playlist.get("is_public", False)
+    async def fetch_page(self, query, offset, limit):
+        return await list_available_playlists(self.user_id, query, offset, limit, self.sort)
+
+    def describe_item(self, item):
+        return describe_playlist(item)
+
+    async def on_pick(self, interaction: discord.Interaction, item):
+        owner_id = int(item.get("owner_id", self.user_id))
+        is_public = item.get("is_public", False)
         if (not is_public) and (interaction.user.id != owner_id):
             return await interaction.response.send_message("❌ Non sei il proprietario e la playlist è privata.", ephemeral=True)
-        manage_view = ManagePlaylistView(self.playlist, interaction.user)
+        manage_view = ManagePlaylistView(item, interaction.user)
         await interaction.response.send_message(
-            f"⚙️ Gestisci la playlist **{self.playlist['name']}**",
+            f"⚙️ Gestisci la playlist **{item['name']}**",
             view=manage_view,
             ephemeral=True
         )
@@ -250,18 +519,12 @@ class ClearPlaylistButton(discord.ui.Button):
         self.playlist = playlist
         self.user = user
 
+    @traced
     async def callback(self, interaction: discord.Interaction):
         if (not self.playlist.get("is_public", False)) and (interaction.user.id != int(self.playlist.get("owner_id", self.user.id))):
             return await interaction.response.send_message("❌ Non sei il proprietario di questa playlist.", ephemeral=True)
-        self.playlist["tracks"] = []
-        data = load_playlists()
-        owner_key = str(self.playlist.get("owner_id", self.user.id))
-        user_playlists = data.get(owner_key, [])
-        for pl in user_playlists:
-            if pl["name"].lower() == self.playlist["name"].lower():
-                pl.update(self.playlist)
-                break
-        save_playlists(data)
+        self.playlist["track_count"] = 0
+        await clear_playlist(self.playlist.get("owner_id", self.user.id), self.playlist["name"])
         await interaction.response.send_message("🗑️ Playlist svuotata!", ephemeral=True)
 
 class RenamePlaylistButton(discord.ui.Button):
@@ -270,6 +533,7 @@ class RenamePlaylistButton(discord.ui.Button):
         self.playlist = playlist
         self.user = user
 
+    @traced
     async def callback(self, interaction: discord.Interaction):
         if (not self.playlist.get("is_public", False)) and (interaction.user.id != int(self.playlist.get("owner_id", self.user.id))):
             return await interaction.response.send_message("❌ Non sei il proprietario di questa playlist.", ephemeral=True)
@@ -281,14 +545,11 @@ class DeletePlaylistButton(discord.ui.Button):
         self.playlist = playlist
         self.user = user
 
+    @traced
     async def callback(self, interaction: discord.Interaction):
         if (not self.playlist.get("is_public", False)) and (interaction.user.id != int(self.playlist.get("owner_id", self.user.id))):
             return await interaction.response.send_message("❌ Non sei il proprietario di questa playlist.", ephemeral=True)
-        data = load_playlists()
-        owner_key = str(self.playlist.get("owner_id", self.user.id))
-        user_playlists = data.get(owner_key, [])
-        data[owner_key] = [pl for pl in user_playlists if pl["name"].lower() != self.playlist["name"].lower()]
-        save_playlists(data)
+        await delete_playlist(self.playlist.get("owner_id", self.user.id), self.playlist["name"])
         await interaction.response.send_message("🚫 Playlist eliminata con successo!", ephemeral=True)
 
 class RemoveTrackMenuButton(discord.ui.Button):
@@ -297,47 +558,49 @@ class RemoveTrackMenuButton(discord.ui.Button):
         self.playlist = playlist
         self.user = user
 
+    @traced
     async def callback(self, interaction: discord.Interaction):
-        if not self.playlist.get("tracks"):
+        if not self.playlist.get("track_count"):
             return await interaction.response.send_message("❌ La playlist è vuota.", ephemeral=True)
         if (not self.playlist.get("is_public", False)) and (interaction.user.id != int(self.playlist.get("owner_id", self.user.id))):
             return await interaction.response.send_message("❌ Non sei il proprietario di questa playlist.", ephemeral=True)
         view = RemoveTrackView(self.playlist, self.user)
-        await interaction.response.send_message("Seleziona il brano da rimuovere:", view=view, ephemeral=True)
+        await view.load()
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
+
+class RemoveTrackView(PaginatedBrowserView):
+    title = "➖ Rimuovi Brano"
+    description = "Seleziona il brano da rimuovere:"
+    color = discord.Color.red()
+    placeholder = "➖ Scegli il brano da rimuovere"
+    field_prefix = ""
 
-class RemoveTrackView(discord.ui.View):
     def __init__(self, playlist, user):
-        super().__init__(timeout=60)
-        self.playlist = playlist
-        self.user = user
-        for index, track in enumerate(self.playlist.get("tracks", [])):
-            title = track.get("title", "Sconosciuto")
-            title = (title[:25] + "...") if len(title) > 28 else title
-            self.add_item(RemoveTrackButton(title, index, playlist, user))
-
-class RemoveTrackButton(discord.ui.Button):
-    def __init__(self, title, index, playlist, user):
-        super().__init__(label=title, style=discord.ButtonStyle.red)
-        self.index = index
+        super().__init__(user.id)
         self.playlist = playlist
         self.user = user
 
-    async def callback(self, interaction: discord.Interaction):
+    async def fetch_page(self, query, offset, limit):
+        return await list_playlist_tracks(
+            self.playlist.get("owner_id", self.user.id), self.playlist["name"], query, offset, limit
+        )
+
+    def describe_item(self, item):
+        return f"{item['index'] + 1}. {item.get('title') or 'Sconosciuto'}", None
+
+    async def on_pick(self, interaction: discord.Interaction, item):
         if (not self.playlist.get("is_public", False)) and (interaction.user.id != int(self.playlist.get("owner_id", self.user.id))):
             return await interaction.response.send_message("❌ Non sei il proprietario di questa playlist.", ephemeral=True)
-        try:
-            removed = self.playlist["tracks"].pop(self.index)
-        except IndexError:
+        removed = await remove_track_from_playlist(
+            self.playlist.get("owner_id", self.user.id),
+            self.playlist["name"],
+            item.get("url")
+        )
+        if removed is None:
             return await interaction.response.send_message("Errore: brano non trovato.", ephemeral=True)
-        data = load_playlists()
-        owner_key = str(self.playlist.get("owner_id", self.user.id))
-        user_playlists = data.get(owner_key, [])
-        for pl in user_playlists:
-            if pl["name"].lower() == self.playlist["name"].lower():
-                pl.update(self.playlist)
-                break
-        save_playlists(data)
-        await interaction.response.send_message(f"✅ Rimosso il brano '{removed.get('title', 'Sconosciuto')}' dalla playlist.", ephemeral=True)
+        self.playlist["track_count"] = max(0, self.playlist.get("track_count", 1) - 1)
+        await self.refresh(interaction)
+        await interaction.followup.send(f"✅ Rimosso il brano '{removed.get('title', 'Sconosciuto')}' dalla playlist.", ephemeral=True)
 
 class RenamePlaylistModal(discord.ui.Modal, title="✏️ Rinomina Playlist"):
     def __init__(self, playlist):
@@ -350,17 +613,20 @@ class RenamePlaylistModal(discord.ui.Modal, title="✏️ Rinomina Playlist"):
         )
         self.add_item(self.new_name)
 
+    @traced
     async def on_submit(self, interaction: discord.Interaction):
         old_name = self.playlist["name"]
+        result = await rename_playlist(
+            self.playlist.get("owner_id", interaction.user.id),
+            old_name,
+            self.new_name.value
+        )
+        if result == "exists":
+            return await interaction.response.send_message("❌ Esiste già una playlist con questo nome.", ephemeral=True)
+        if result != "renamed":
+            # eliminata o rinominata da qualcun altro nel frattempo
+            return await interaction.response.send_message("❌ Playlist non trovata.", ephemeral=True)
         self.playlist["name"] = self.new_name.value
-        data = load_playlists()
-        owner_key = str(self.playlist.get("owner_id", interaction.user.id))
-        user_playlists = data.get(owner_key, [])
-        for pl in user_playlists:
-            if pl["name"] == old_name:
-                pl["name"] = self.new_name.value
-                break
-        save_playlists(data)
         await interaction.response.send_message(f"✅ Playlist rinominata in **{self.new_name.value}**", ephemeral=True)
 
 ##############################################
@@ -368,6 +634,7 @@ class RenamePlaylistModal(discord.ui.Modal, title="✏️ Rinomina Playlist"):
 ##############################################
 @tree.command(name="play", description="Riproduci una canzone o playlist YouTube")
 @app_commands.describe(query="Link o titolo")
+@traced
 async def play(interaction: discord.Interaction, query: str):
     await interaction.response.defer()
 
@@ -377,37 +644,52 @@ async def play(interaction: discord.Interaction, query: str):
     player = await ensure_player_connected(interaction)
 
     if "list=" in query:
-        tracks = await get_playlist_tracks(query)
-        if not tracks:
+        started = time.perf_counter()
+        # L'estrazione gira come loader del player: Stop o disconnessione la
+        # annullano. Oltre la scadenza del token dell'interazione (15 minuti)
+        # non si potrebbe piu' rispondere, quindi il timeout si ferma prima.
+        remaining = (interaction.expires_at - discord.utils.utcnow()).total_seconds() - 5
+        extraction = player.start_loader(
+            extract_playlist_entries(query, interaction.guild.id, timeout=max(0, min(EXTRACT_TIMEOUT, remaining)))
+        )
+        try:
+            await asyncio.wait({extraction})
+        except asyncio.CancelledError:
+            extraction.cancel()
+            raise
+        if extraction.cancelled():
+            return await interaction.followup.send("❌ Caricamento della playlist annullato.", ephemeral=True)
+        urls = extraction.result()
+        if not urls:
+            return await interaction.followup.send("❌ Nessuna playlist trovata.", ephemeral=True)
+
+        # Il primo brano parte appena risolto, gli altri riempiono la coda in background
+        resolved = iter_resolved(urls)
+        failed = []
+        first = None
+        async for index, url, track, error in resolved:
+            if track is not None:
+                first = track
+                break
+            failed.append((index, url, error))
+        if first is None:
+            await resolved.aclose()
             return await interaction.followup.send("❌ Nessuna playlist trovata.", ephemeral=True)
 
-        first = tracks.pop(0)
+        PLAYLIST_LOAD_SECONDS.observe(time.perf_counter() - started, source="youtube", phase="first_track")
         first.requester = interaction.user
         await player.play(first)
         player.current = first
-
-        for t in tracks:
-            t.requester = interaction.user
-        player.queue.extend(tracks)
-
-        secs = int(first.length)
-        m, s = divmod(secs, 60)
-        vol = player.volume
-
-        embed = discord.Embed(
-            title="🎶 Ora in riproduzione (Playlist)",
-            description=f"[{first.title}]({first.uri})",
-            color=discord.Color.green()
+        player.start_loader(
+            enqueue_remaining(player, resolved, interaction, failed, source="youtube", started=started), len(urls) - index - 1
         )
-        embed.set_thumbnail(url=first.thumbnail or "https://via.placeholder.com/150")
-        embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-        embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-        embed.add_field(name="📑 Brani in coda", value=str(len(player.queue)), inline=True)
-        embed.set_footer(text=f"Richiesto da {first.requester}",
-                         icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
 
-        msg = await interaction.followup.send(embed=embed, view=MusicControls(first, interaction.guild, loop_active=player.loop))
-        player.control_message = msg
+        embed = player.card.render(
+            first, player.volume, title="🎶 Ora in riproduzione (Playlist)", queue=queue_counter_text(player)
+        )
+        view = player_controls(player)
+        msg = await interaction.followup.send(embed=embed, view=view)
+        player.set_control_message(msg, embed, view)
 
     else:
         track = await get_track(query)
@@ -416,110 +698,238 @@ async def play(interaction: discord.Interaction, query: str):
 
         track.requester = interaction.user
 
-        if (not player.is_playing() or player.stopped) and not player.control_message:
+        if (not player.is_playing() or player.stopped or player.current is None) and not player.control_message:
             await player.play(track)
             player.current = track
 
-            secs = int(track.length)
-            m, s = divmod(secs, 60)
-            vol = player.volume
-
-            embed = discord.Embed(
-                title="🎶 Ora in riproduzione",
-                description=f"[{track.title}]({track.uri})",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=track.thumbnail or "https://via.placeholder.com/150")
-            embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-            embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-            embed.set_footer(text=f"Richiesto da {track.requester}",
-                             icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
-
-            msg = await interaction.followup.send(embed=embed, view=MusicControls(track, interaction.guild, loop_active=player.loop))
-            player.control_message = msg
+            embed = player.card.render(track, player.volume)
+            view = player_controls(player)
+            msg = await interaction.followup.send(embed=embed, view=view)
+            player.set_control_message(msg, embed, view)
         else:
-            player.queue.append(track)
+            player.queue.push(track)
             return await interaction.followup.send(f"✅ **{track.title}** aggiunto alla coda.", ephemeral=True)
 
+QUEUE_COUNTER_INTERVAL = 2.0
+
+async def update_control_message(player, message, **fields):
+    # il messaggio cliccato puo' essere un vecchio pannello: lo si modifica direttamente
+    if player.control_message and message is not None and message.id == player.control_message.id:
+        player.renderer.update(**fields)
+        return
+    try:
+        with CONTROL_EDIT_SECONDS.time():
+            await message.edit(**fields)
+    except discord.HTTPException as e:
+        ERRORS.inc(source="control_edit")
+        print(f"Errore nell'aggiornamento del messaggio: {e}")
+
+def queue_counter_text(player) -> str:
+    text = str(len(player.queue))
+    pending = max(0, player.pending_tracks)
+    if pending:
+        text += f" (+{pending} in caricamento)"
+    return text
+
+def refresh_queue_counter(player):
+    if player.control_message and player.card.set_queue(queue_counter_text(player)):
+        player.renderer.update(embed=player.card.embed)
+
+async def enqueue_remaining(player, resolved, interaction: discord.Interaction, failed: list, *, source: str, started: float):
+    # il conteggio dei brani in arrivo e' quello passato a player.start_loader
+    loop = asyncio.get_running_loop()
+    last_refresh = loop.time()
+    try:
+        async for index, url, track, error in resolved:
+            if player.stopped or not player.is_connected():
+                break
+            player.track_loaded()
+            if track is None:
+                failed.append((index, url, error))
+                continue
+            track.requester = interaction.user
+            player.queue.push(track)
+            player.queue_changed.set()
+            if loop.time() - last_refresh >= QUEUE_COUNTER_INTERVAL:
+                last_refresh = loop.time()
+                refresh_queue_counter(player)
+    finally:
+        await resolved.aclose()
+
+    if player.stopped or not player.is_connected():
+        return
+    PLAYLIST_LOAD_SECONDS.observe(time.perf_counter() - started, source=source, phase="complete")
+    refresh_queue_counter(player)
+
+    if failed:
+        print(f"⚠️ {len(failed)} brani non risolti: " + ", ".join(f"#{i + 1} ({err})" for i, _, err in failed[:10]))
+        try:
+            await interaction.followup.send(
+                f"⚠️ {len(failed)} brani della playlist non sono stati caricati.",
+                ephemeral=True
+            )
+        except discord.HTTPException as e:
+            print(f"Errore nell'invio del riepilogo della playlist: {e}")
+
 ##############################################
 # CLASSE CUSTOMPLAYER (Estensione di wavelink.Player)
 ##############################################
 class CustomPlayer(wavelink.Player):
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
-        self.queue = []
+        self.queue = TrackQueue()
         self.current = None
         self.stopped = False
         self._custom_paused = False
+        self.parked = False
+        self.track_started = None
         self.control_message = None 
         self.loop = False
+        # task del loader -> brani che deve ancora mettere in coda
+        self.loader_tasks = {}
+        self.queue_changed = asyncio.Event()
+        self.prefetch_task = None
+        self.filters = FilterController(self)
+        self.renderer = ControlMessageRenderer(self)
+        self.card = NowPlayingCard()
+
+    def set_control_message(self, message, embed=None, view=None):
+        self.control_message = message
+        if message is None:
+            self.renderer.reset()
+            self.card.reset()
+        else:
+            self.renderer.attach(message, embed, view)
+
+    def schedule_prefetch(self):
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+        self.prefetch_task = asyncio.create_task(prefetch_next(self))
+
+    @property
+    def pending_tracks(self) -> int:
+        return sum(self.loader_tasks.values())
+
+    def start_loader(self, coro, pending: int = 0):
+        # ogni loader tiene il proprio conteggio: un task cancellato (anche
+        # prima di partire) toglie esattamente i brani che aveva annunciato
+        task = asyncio.create_task(coro)
+        self.loader_tasks[task] = pending
+        task.add_done_callback(self._loader_done)
+        return task
+
+    def track_loaded(self):
+        # chiamato dal loader per ogni brano risolto (in coda o fallito)
+        task = asyncio.current_task()
+        if self.loader_tasks.get(task):
+            self.loader_tasks[task] -= 1
+
+    def _loader_done(self, task):
+        self.loader_tasks.pop(task, None)
+        self.queue_changed.set()
+
+    def cancel_loaders(self):
+        for task in list(self.loader_tasks):
+            task.cancel()
+        self.loader_tasks.clear()
+        self.queue_changed.set()
+        self.renderer.cancel()
+        if self.prefetch_task is not None:
+            self.prefetch_task.cancel()
+            self.prefetch_task = None
+
+    async def play(self, source, replace=True, start=0, end=0):
+        result = await super().play(source, replace=replace, start=start, end=end)
+        if result is not None:
+            # (istante, posizione iniziale): vedi node_pool.player_position
+            self.track_started = (time.monotonic(), start / 1000)
+        return result
 
     async def connect(self, *, timeout=60.0, reconnect=True, self_deaf=False, self_mute=False):
         self.stopped = False
         self._custom_paused = False
-        return await super().connect(timeout=timeout, reconnect=reconnect)
+        result = await super().connect(timeout=timeout, reconnect=reconnect)
+        # riconnessione dello stesso player: i filtri scelti vengono riapplicati
+        self.filters.restore()
+        return result
 
     async def stop(self):
+        self.cancel_loaders()
         await super().stop()
         self.stopped = True
         self._custom_paused = False
 
-    async def set_equalizer(self, equalizer_settings: list):
-        payload = {
-            "op": "filters",
-            "guildId": str(self.guild.id),
-            "equalizer": [{"band": band, "gain": gain} for band, gain in equalizer_settings]
-        }
-        ws = (
-            getattr(self.node, '_ws', None)
-            or getattr(self.node, '_websocket', None)
-            or getattr(self.node, 'ws', None)
-        )
-        if ws is None:
-            return payload
-        try:
-            if hasattr(ws, 'send_json'):
-                await ws.send_json(payload)
-                return payload
-        except Exception as e:
-            print("Errore invio con send_json:", e)
-        try:
-            if hasattr(ws, 'send_str'):
-                await ws.send_str(json.dumps(payload))
-                return payload
-        except Exception as e:
-            print("Errore invio con send_str:", e)
-        try:
-            if hasattr(ws, 'websocket') and hasattr(ws.websocket, 'send'):
-                await ws.websocket.send(json.dumps(payload))
-                return payload
-        except Exception as e:
-            print("Errore invio con ws.websocket.send:", e)
-        return payload
+    async def disconnect(self, *, force=False):
+        self.cancel_loaders()
+        self.filters.reset()
+        reaper.forget(self.guild.id)
+        voice_pool.forget(self.guild.id)
+        if not self.client.is_closed():
+            # alla chiusura del bot lo snapshot resta, per riprendere al riavvio
+            await get_session_store().forget(self.guild.id)
+        return await super().disconnect(force=force)
+
+    async def park(self):
+        # fine della musica senza lasciare il canale (vedi voice_pool.py):
+        # volume e filtri restano quelli scelti, coda e loop ripartono da zero
+        loaders = list(self.loader_tasks)
+        self.loop = False
+        if self._custom_paused:
+            await self.set_pause(False)
+        await self.stop()
+        # i loader cancellati chiudono i loro generatori prima del parcheggio
+        await asyncio.gather(*loaders, return_exceptions=True)
+        self.queue.clear()
+        self.current = None
+        self.parked = True
+
+    def unpark(self):
+        # il player riusato riparte come uno nuovo (a parte volume e filtri)
+        self.parked = False
+        self.stopped = False
+        self._custom_paused = False
+        self.skip_manual = False
+        self.loader_tasks.clear()
+        self.queue_changed = asyncio.Event()
+
+    async def restore_filters(self):
+        # dopo uno spostamento di nodo: il nuovo nodo non ha filtri attivi
+        task = self.filters.restore()
+        if task is not None:
+            await task
 
 ##############################################
 # VIEW DEI CONTROLLI MUSICALI
 ##############################################
+# La view non ha stato: ogni callback legge il player della gilda al momento
+# del click. Ne esiste una sola istanza per combinazione loop/pausa (cambia
+# solo l'aspetto dei pulsanti), creata in setup_hook e riusata per tutti i
+# messaggi; quella predefinita viene registrata con bot.add_view all'avvio,
+# cosi' i pulsanti funzionano anche dopo un riavvio.
 class MusicControls(discord.ui.View):
-    def __init__(self, track, guild, loop_active: bool = False):
+    def __init__(self, loop_active: bool = False, paused: bool = False):
         super().__init__(timeout=None)
-        self.track = track
-        self.guild = guild
         self.loop_active = loop_active
-        for child in self.children:
-            if isinstance(child, discord.ui.Button) and child.custom_id == "toggle_loop":
-                if self.loop_active:
-                    child.label = "🔁 Loop Attivato"
-                    child.style = discord.ButtonStyle.primary
-                else:
-                    child.label = "🔁 Loop"
-                    child.style = discord.ButtonStyle.secondary
-                break
+        self.paused = paused
+        if paused:
+            self.toggle_pause.label = "▶️ Riprendi"
+        if loop_active:
+            self.toggle_loop.label = "🔁 Loop Attivato"
+            self.toggle_loop.style = discord.ButtonStyle.primary
+
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        return await wait_for_services(interaction)
+
+    def _refresh(self, components):
+        # discord.py aggiorna la view dai MESSAGE_UPDATE del gateway: l'istanza
+        # e' condivisa tra tutti i messaggi di tutte le gilde, quindi il suo
+        # aspetto resta quello della variante e non segue un singolo messaggio
+        pass
 
     @discord.ui.button(label="⏸️ Pausa", style=discord.ButtonStyle.grey, custom_id="toggle_pause")
+    @traced
     async def toggle_pause(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
@@ -527,7 +937,6 @@ class MusicControls(discord.ui.View):
             try:
                 await player.set_pause(False)
                 player._custom_paused = False
-                button.label = "⏸️ Pausa"
                 msg = "La canzone è stata ripresa!"
             except Exception as e:
                 return await interaction.response.send_message(f"Errore nel riprendere la canzone: {e}", ephemeral=True)
@@ -535,62 +944,59 @@ class MusicControls(discord.ui.View):
             try:
                 await player.set_pause(True)
                 player._custom_paused = True
-                button.label = "▶️ Riprendi"
                 msg = "La canzone è stata messa in pausa!"
             except Exception as e:
                 return await interaction.response.send_message(f"Errore nel mettere in pausa: {e}", ephemeral=True)
-        await interaction.message.edit(view=self)
+        reaper.refresh(player, activity=True)
+        await update_control_message(player, interaction.message, view=player_controls(player))
         return await interaction.response.send_message(msg, ephemeral=True)
 
     @discord.ui.button(label="🔁 Loop", style=discord.ButtonStyle.secondary, custom_id="toggle_loop")
+    @traced
     async def toggle_loop(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
         player.loop = not player.loop
-        self.loop_active = player.loop
-        if player.loop:
-            button.label = "🔁 Loop Attivato"
-            button.style = discord.ButtonStyle.primary
-            status = "attivato"
-        else:
-            button.label = "🔁 Loop"
-            button.style = discord.ButtonStyle.secondary
-            status = "disattivato"
+        status = "attivato" if player.loop else "disattivato"
 
         await interaction.response.send_message(f"🔁 Loop {status}.", ephemeral=True)
-        await interaction.message.edit(view=self)
+        await update_control_message(player, interaction.message, view=player_controls(player))
 
     @discord.ui.button(label="⏹️ Stop", style=discord.ButtonStyle.danger, custom_id="stop_track")
+    @traced
     async def stop(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             msg = "Il player non è attivo."
         elif player.stopped:
             msg = "La canzone è già stata fermata."
         else:
-            if player._custom_paused:
-                await player.set_pause(False)
-                player._custom_paused = False
-            await player.stop()
-            await player.disconnect(force=True)
             try:
                 await interaction.message.delete()
             except Exception as e:
                 print(f"Errore nella cancellazione del messaggio: {e}")
-            msg = "Canzone fermata e bot disconnesso dal canale vocale."
+            if player.control_message and player.control_message.id == interaction.message.id:
+                player.set_control_message(None)
+            if await park_player(player):
+                msg = "Canzone fermata. Il bot resta nel canale vocale ancora per poco: usa /play per ripartire subito."
+            else:
+                if player._custom_paused:
+                    await player.set_pause(False)
+                    player._custom_paused = False
+                await player.stop()
+                await player.disconnect(force=True)
+                msg = "Canzone fermata e bot disconnesso dal canale vocale."
         if not interaction.response.is_done():
             return await interaction.response.send_message(msg, ephemeral=True)
         else:
             return await interaction.followup.send(msg, ephemeral=True)
 
     @discord.ui.button(label="⏭️ Skip", style=discord.ButtonStyle.primary, custom_id="skip_track")
+    @traced
     async def skip(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
         if player.stopped:
@@ -599,100 +1005,78 @@ class MusicControls(discord.ui.View):
             return await interaction.response.send_message("Non ci sono altri brani in coda da saltare.", ephemeral=True)
         try:
             player.skip_manual = True
-            next_track = player.queue.pop(0)
+            next_track = player.queue.pop()
             await player.play(next_track)
             player.current = next_track
 
-            secs = int(next_track.length)
-            m, s = divmod(secs, 60)
-            vol = player.volume
-
-            new_embed = discord.Embed(
-                title="🎶 Ora in riproduzione",
-                description=f"[{next_track.title}]({next_track.uri})",
-                color=discord.Color.green()
-            )
-            new_embed.set_thumbnail(url=next_track.thumbnail or "https://via.placeholder.com/150")
-            new_embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-            new_embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-            new_embed.set_footer(
-                text=f"Richiesto da {interaction.user}",
-                icon_url=interaction.user.avatar.url if interaction.user.avatar else None
-            )
-
-            await interaction.response.edit_message(embed=new_embed, view=MusicControls(next_track, interaction.guild, loop_active=player.loop))
+            new_embed = player.card.render(next_track, player.volume)
+            view = player_controls(player)
+            await interaction.response.edit_message(embed=new_embed, view=view)
+            if player.control_message and interaction.message.id == player.control_message.id:
+                player.renderer.attach(player.control_message, new_embed, view)
         except Exception as e:
             await interaction.response.send_message(f"Errore nel saltare il brano: {e}", ephemeral=True)
 
     @discord.ui.button(label="🔊 Volume +", style=discord.ButtonStyle.grey, custom_id="volume_up")
+    @traced
     async def volume_up(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
         new_vol = min(100, player.volume + 10)
         await player.set_volume(new_vol)
 
-        track = player.current
-        secs = int(track.length)
-        m, s = divmod(secs, 60)
-        embed = discord.Embed(
-            title="🎶 Ora in riproduzione",
-            description=f"[{track.title}]({track.uri})",
-            color=discord.Color.green()
-        )
-        embed.set_thumbnail(url=get_thumbnail(track))
-        embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-        embed.add_field(name="🔊 Volume", value=f"{new_vol}%", inline=True)
-        embed.set_footer(text=f"Richiesto da {track.requester}",
-                         icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
-
-        if player.control_message:
-            await player.control_message.edit(embed=embed, view=self)
+        if player.control_message and player.current is not None:
+            embed = player.card.render(player.current, new_vol)
+            player.renderer.update(embed=embed, view=player_controls(player))
         await interaction.response.send_message(f"Volume aumentato a {new_vol}%", ephemeral=True)
 
 
     @discord.ui.button(label="🔉 Volume -", style=discord.ButtonStyle.grey, custom_id="volume_down")
+    @traced
     async def volume_down(self, interaction: discord.Interaction, button: discord.ui.Button):
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
         new_vol = max(1, player.volume - 10)
         await player.set_volume(new_vol)
 
-        track = player.current
-        secs = int(track.length)
-        m, s = divmod(secs, 60)
-        embed = discord.Embed(
-            title="🎶 Ora in riproduzione",
-            description=f"[{track.title}]({track.uri})",
-            color=discord.Color.green()
-        )
-        embed.set_thumbnail(url=get_thumbnail(track))
-        embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-        embed.add_field(name="🔊 Volume", value=f"{new_vol}%", inline=True)
-        embed.set_footer(text=f"Richiesto da {track.requester}",
-                         icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
-
-        if player.control_message:
-            await player.control_message.edit(embed=embed, view=self)
+        if player.control_message and player.current is not None:
+            embed = player.card.render(player.current, new_vol)
+            player.renderer.update(embed=embed, view=player_controls(player))
         await interaction.response.send_message(f"Volume diminuito a {new_vol}%", ephemeral=True)
 
     @discord.ui.button(label="🔧 Volume Manuale", style=discord.ButtonStyle.blurple, custom_id="volume_manual")
+    @traced
     async def volume_manual(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_modal(VolumeModal())
 
     @discord.ui.button(label="➕ Aggiungi alla Playlist", style=discord.ButtonStyle.green, custom_id="add_to_playlist")
+    @traced
     async def add_to_playlist(self, interaction: discord.Interaction, button: discord.ui.Button):
-        view = PlaylistChoiceView(self.track)
+        player = find_player(interaction.guild)
+        if not player or player.current is None:
+            return await interaction.response.send_message("Nessun brano in riproduzione.", ephemeral=True)
+        view = PlaylistChoiceView(player.current)
         if not interaction.response.is_done():
             return await interaction.response.send_message("📂 Scegli cosa fare con questa canzone:", view=view, ephemeral=True)
         else:
             return await interaction.followup.send("📂 Scegli cosa fare con questa canzone:", view=view, ephemeral=True)
 
+_control_views = {}
+
+def control_view(loop_active: bool = False, paused: bool = False) -> MusicControls:
+    key = (loop_active, paused)
+    view = _control_views.get(key)
+    if view is None:
+        view = _control_views[key] = MusicControls(loop_active, paused)
+    return view
+
+def player_controls(player) -> MusicControls:
+    return control_view(player.loop, player._custom_paused)
+
 class VolumeModal(discord.ui.Modal, title="Imposta Volume Manuale"):
     volume = discord.ui.TextInput(
         label="Inserisci il volume (1-100)",
@@ -700,6 +1084,7 @@ class VolumeModal(discord.ui.Modal, title="Imposta Volume Manuale"):
         required=True
     )
 
+    @traced
     async def on_submit(self, interaction: discord.Interaction):
         try:
             vol = int(self.volume.value)
@@ -708,29 +1093,16 @@ class VolumeModal(discord.ui.Modal, title="Imposta Volume Manuale"):
         if not 1 <= vol <= 100:
             return await interaction.response.send_message("Inserisci un numero tra 1 e 100.", ephemeral=True)
 
-        node = wavelink.NodePool.get_node()
-        player = node.get_player(interaction.guild)
+        player = find_player(interaction.guild)
         if not player:
             return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
         await player.set_volume(vol)
 
         track = player.current
-        secs = int(track.length)
-        m, s = divmod(secs, 60)
-        embed = discord.Embed(
-            title="🎶 Ora in riproduzione",
-            description=f"[{track.title}]({track.uri})",
-            color=discord.Color.green()
-        )
-        embed.set_thumbnail(url=get_thumbnail(track))
-        embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-        embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-        embed.set_footer(text=f"Richiesto da {track.requester}",
-                         icon_url=interaction.user.avatar.url if interaction.user.avatar else None)
-
-        if player.control_message:
-            await player.control_message.edit(embed=embed, view=MusicControls(track, interaction.guild, loop_active=player.loop))
+        if player.control_message and track is not None:
+            embed = player.card.render(track, vol)
+            player.renderer.update(embed=embed, view=player_controls(player))
 
         await interaction.response.send_message(f"Volume impostato a {vol}", ephemeral=True)
 
@@ -743,16 +1115,17 @@ class PlaylistChoiceView(discord.ui.View):
         self.track = track
 
     @discord.ui.button(label="📁 Nuova Playlist", style=discord.ButtonStyle.blurple, custom_id="create_new_playlist")
+    @traced
     async def create_new(self, interaction: discord.Interaction, button: discord.ui.Button):
         await interaction.response.send_modal(NewPlaylistModal(self.track))
 
     @discord.ui.button(label="📂 Esistente", style=discord.ButtonStyle.green, custom_id="add_existing_playlist")
+    @traced
     async def add_existing(self, interaction: discord.Interaction, button: discord.ui.Button):
-        playlists = get_user_playlists(interaction.user.id)
-        if not playlists:
+        view = ExistingPlaylistsView(self.track, interaction.user.id)
+        if not await view.load():
             return await interaction.response.send_message("❌ Non hai playlist, creane una prima!", ephemeral=True)
-        view = ExistingPlaylistsView(self.track, playlists)
-        await interaction.response.send_message("📚 Seleziona una playlist:", view=view, ephemeral=True)
+        await interaction.response.send_message(embed=view.build_embed(), view=view, ephemeral=True)
 
 class NewPlaylistModal(discord.ui.Modal, title="🎵 Nuova Playlist"):
     nome = discord.ui.TextInput(label="Nome Playlist", placeholder="Es: Chill Vibes", required=True)
@@ -760,45 +1133,110 @@ class NewPlaylistModal(discord.ui.Modal, title="🎵 Nuova Playlist"):
     def __init__(self, track):
         super().__init__()
         self.track = track
+    @traced
     async def on_submit(self, interaction: discord.Interaction):
         is_public = self.visibile.value.strip().casefold() in ["sì", "si", "Si", "Sì"]
-        add_track_to_playlist(
+        await add_track_to_playlist(
             interaction.user.id,
             self.nome.value,
-            {"title": self.track.title, "url": self.track.uri},
+            song_from_track(self.track),
             is_public=is_public,
             create_if_missing=True
         )
         return await interaction.response.send_message(f"✅ Canzone aggiunta alla nuova playlist **{self.nome.value}**!", ephemeral=True)
 
-class ExistingPlaylistsView(discord.ui.View):
-    def __init__(self, track, playlists):
-        super().__init__(timeout=60)
-        self.track = track
-        for pl in playlists:
-            self.add_item(PlaylistButton(pl, self.track))
+class ExistingPlaylistsView(PaginatedBrowserView):
+    title = "📚 Seleziona una playlist"
+    placeholder = "📂 Scegli la playlist"
 
-class PlaylistButton(discord.ui.Button):
-    def __init__(self, playlist, track):
-        super().__init__(label=playlist["name"], style=discord.ButtonStyle.grey)
-        self.playlist = playlist
+    def __init__(self, track, user_id):
+        super().__init__(user_id)
         self.track = track
-    async def callback(self, interaction: discord.Interaction):
-        for song in self.playlist.get("tracks", []):
-            if song.get("url") == self.track.uri:
-                return await interaction.response.send_message("❌ Questa canzone è già presente nella playlist.", ephemeral=True)
-        add_track_to_playlist(
+
+    async def fetch_page(self, query, offset, limit):
+        return await list_user_playlists(self.user_id, query, offset, limit)
+
+    def describe_item(self, item):
+        return describe_playlist(item)
+
+    async def on_pick(self, interaction: discord.Interaction, item):
+        # add_track imposta anche la visibilita': si conserva quella attuale
+        result = await add_track_to_playlist(
             interaction.user.id,
-            self.playlist["name"],
-            {"title": self.track.title, "url": self.track.uri}
+            item["name"],
+            song_from_track(self.track),
+            is_public=item.get("is_public", False)
         )
-        return await interaction.response.send_message(f"✅ Aggiunto a **{self.playlist['name']}**!", ephemeral=True)
+        if result == "duplicate":
+            return await interaction.response.send_message("❌ Questa canzone è già presente nella playlist.", ephemeral=True)
+        return await interaction.response.send_message(f"✅ Aggiunto a **{item['name']}**!", ephemeral=True)
+
+##############################################
+# COMANDO /coda - Riordina o sfoltisce la coda del player
+##############################################
+@tree.command(name="coda", description="Mescola, sposta o rimuovi brani dalla coda")
+@app_commands.describe(azione="Operazione sulla coda", da="Posizione iniziale (da 1)", a="Posizione finale (da 1)")
+@app_commands.choices(azione=[
+    app_commands.Choice(name="Mescola", value="shuffle"),
+    app_commands.Choice(name="Sposta un brano (da -> a)", value="move"),
+    app_commands.Choice(name="Rimuovi le posizioni da..a", value="remove_range"),
+    app_commands.Choice(name="Rimuovi i doppioni", value="dedupe"),
+    app_commands.Choice(name="Rimuovi i miei brani", value="remove_by_requester"),
+])
+@traced
+async def coda(interaction: discord.Interaction, azione: app_commands.Choice[str], da: int = None, a: int = None):
+    player = find_player(interaction.guild)
+    if not player or not player.queue:
+        return await interaction.response.send_message("❌ La coda è vuota.", ephemeral=True)
+
+    queue = player.queue
+    size = len(queue)
+    if azione.value in ("move", "remove_range"):
+        if da is None or a is None or not (1 <= da <= size and 1 <= a <= size):
+            return await interaction.response.send_message(
+                f"❌ Indica `da` e `a` tra 1 e {size}.", ephemeral=True)
+
+    if azione.value == "shuffle":
+        queue.shuffle()
+        text = f"🔀 Coda mescolata ({size} brani)."
+    elif azione.value == "move":
+        track = queue.move(da - 1, a - 1)
+        text = f"↕️ **{track.title}** spostato in posizione {a}."
+    elif azione.value == "remove_range":
+        removed = queue.remove_range(min(da, a) - 1, max(da, a))
+        text = f"🗑️ Rimossi {len(removed)} brani dalla coda."
+    elif azione.value == "dedupe":
+        text = f"🧹 Rimossi {queue.dedupe()} doppioni dalla coda."
+    else:
+        removed = queue.remove_by_requester(interaction.user.id)
+        text = f"🗑️ Rimossi {len(removed)} tuoi brani dalla coda."
+
+    await interaction.response.send_message(text, ephemeral=True)
+    refresh_queue_counter(player)
+
+##############################################
+# COMANDO PER I FILTRI AUDIO
+##############################################
+@tree.command(name="filtro", description="Applica un filtro audio al player")
+@app_commands.describe(preset="Filtro da applicare")
+@app_commands.choices(preset=[app_commands.Choice(name=label, value=name) for name, label in PRESET_LABELS.items()])
+@traced
+async def audio_filter(interaction: discord.Interaction, preset: app_commands.Choice[str]):
+    player = find_player(interaction.guild)
+    if not player:
+        return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
+
+    reaper.refresh(player, activity=True)
+    # l'invio e' limitato nel tempo: la risposta non aspetta Lavalink
+    player.filters.apply_preset(preset.value)
+    return await interaction.response.send_message(f"🎛️ Filtro impostato: **{preset.name}**.", ephemeral=True)
 
 ##############################################
 # COMANDO SEGRETO PER VOLUME MASSIMO CON BASS BOOST
 ##############################################
 @tree.command(name="secretvolume", description="Funzione segreta per impostare il volume a 500 con bass boost (richiede una chiave segreta)")
 @app_commands.describe(secret_key="Chiave segreta per abilitare il volume massimo")
+@traced
 async def secret_volume(interaction: discord.Interaction, secret_key: str):
     CHIAVE_SEGRETA = os.getenv("SECRET_KEY")
     if not CHIAVE_SEGRETA:
@@ -813,36 +1251,15 @@ async def secret_volume(interaction: discord.Interaction, secret_key: str):
             ephemeral=True
         )
 
-    node = wavelink.NodePool.get_node()
-    player = node.get_player(interaction.guild)
+    player = find_player(interaction.guild)
     if not player:
         return await interaction.response.send_message("Il player non è attivo.", ephemeral=True)
 
     await player.set_volume(500)
 
-    equalizer_settings = [
-        (0, 0.5),
-        (1, 0.45),
-        (2, 0.40),
-        (3, 0.30),
-        (4, 0.20),
-        (5, 0.00),
-        (6, -0.10),
-        (7, -0.20),
-        (8, -0.30),
-        (9, -0.20),
-        (10, -0.10),
-        (11, 0.00),
-        (12, 0.00),
-        (13, 0.00),
-        (14, 0.00)
-    ]
-
-    try:
-        await player.set_equalizer(equalizer_settings)
+    if await player.filters.apply_preset("bassboost"):
         equalizer_message = "con bass boost potenziato"
-    except Exception as e:
-        print("Errore nell'applicazione dell'equalizer:", e)
+    else:
         equalizer_message = "ma il bass boost non è stato applicato"
 
     return await interaction.response.send_message(
@@ -851,96 +1268,154 @@ async def secret_volume(interaction: discord.Interaction, secret_key: str):
     )
 
 ##############################################
-# EVENTO DI FINE TRACCIA
+# PREFETCH DEL BRANO SUCCESSIVO
 ##############################################
-def get_thumbnail(track: wavelink.Track) -> str:
-    thumbnail = getattr(track, "thumbnail", None)
-    if thumbnail:
-        return thumbnail
-    video_id = None
-    match = re.search(r"(?:v=|youtu\.be/)([a-zA-Z0-9_-]{11})", track.uri)
-    if match:
-        video_id = match.group(1)
-        return f"https://img.youtube.com/vi/{video_id}/0.jpg"
-    return "https://via.placeholder.com/150"
+# Qualche secondo prima della fine del brano si preparano gia' le parti fisse
+# dell'embed del successivo (e si aspetta il loader se la coda e' ancora
+# vuota), cosi' a fine traccia resta da fare solo player.play e la modifica
+# del messaggio passa dal renderer, fuori dal percorso critico.
+PREFETCH_SECONDS = float(os.getenv("PREFETCH_SECONDS", "10"))
+
+async def wait_for_queued_track(player, timeout: float):
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + timeout
+    while not player.queue and player.pending_tracks:
+        player.queue_changed.clear()
+        try:
+            await asyncio.wait_for(player.queue_changed.wait(), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            break
+    return player.queue.peek()
+
+async def prefetch_next(player):
+    track = player.current
+    if track is None:
+        return
+    # non player.position: prima del primo playerUpdate vale l'intera durata
+    remaining = float(track.length) - player_position(player)
+    await asyncio.sleep(max(0.0, remaining - PREFETCH_SECONDS))
+    if player.current is not track or player.loop:
+        return
+    next_track = player.queue.peek()
+    if next_track is None and player.pending_tracks:
+        next_track = await wait_for_queued_track(player, PREFETCH_SECONDS)
+    if next_track is not None:
+        track_template(next_track)
 
+@bot.event
+async def on_wavelink_track_start(player: wavelink.Player, track: wavelink.Track):
+    if not isinstance(player, CustomPlayer):
+        return
+    if player.track_started is not None:
+        # l'avvio effettivo su Lavalink, con la posizione chiesta a play()
+        player.track_started = (time.monotonic(), player.track_started[1])
+    player.schedule_prefetch()
+    reaper.refresh(player)
+
+##############################################
+# EVENTO DI FINE TRACCIA
+##############################################
 @bot.event
 async def on_wavelink_track_end(player: wavelink.Player, track: wavelink.Track, reason):
     if not isinstance(player, CustomPlayer):
         return
+    TRACK_END_REASONS.inc(reason=reason)
+
+    if reason == "STOPPED":
+        # stop() esplicito (Stop o parcheggio): chi l'ha chiamato ha gia' fatto
+        # pulizia, e con un /play arrivato nel frattempo il player e' gia' ripartito
+        return
 
     if getattr(player, "skip_manual", False):
         player.skip_manual = False
         return
 
     if player.loop:
-        if not getattr(player, "cached_thumbnail", None):
-            player.cached_thumbnail = get_thumbnail(track)
         await player.play(track)
 
         if player.control_message:
-            secs = int(track.length)
-            m, s = divmod(secs, 60)
-            vol = player.volume
-
-            embed = discord.Embed(
-                title="🎶 Ora in riproduzione",
-                description=f"[{track.title}]({track.uri})",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=player.cached_thumbnail)
-            embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-            embed.add_field(name="🔊 Volume", value=f"{vol}%", inline=True)
-
-            await player.control_message.edit(
+            # l'evento porta una copia del brano: la card resta quella del brano corrente
+            embed = player.card.render(player.current or track, player.volume)
+            player.renderer.update(
                 embed=embed,
-                view=MusicControls(track, player.guild, loop_active=True)
+                view=player_controls(player)
             )
         return
 
-    player.cached_thumbnail = None
+    if not player.queue and player.pending_tracks:
+        # il loader in background sta ancora risolvendo la playlist
+        await wait_for_queued_track(player, RESOLVE_TIMEOUT)
 
     if player.queue:
-        next_track = player.queue.pop(0)
+        next_track = player.queue.pop()
         try:
-            current_volume = player.volume
             await player.play(next_track)
             player.current = next_track
-            await player.set_volume(current_volume)
-
-            duration_secs = int(next_track.length)
-            m, s = divmod(duration_secs, 60)
-            embed = discord.Embed(
-                title="🎶 Ora in riproduzione",
-                description=f"[{next_track.title}]({next_track.uri})",
-                color=discord.Color.green()
-            )
-            embed.set_thumbnail(url=next_track.thumbnail or "https://via.placeholder.com/150")
-            embed.add_field(name="⏱ Durata", value=f"{m}:{s:02d}", inline=True)
-            embed.add_field(name="🔊 Volume", value=f"{current_volume}%", inline=True)
-            embed.set_footer(
-                text=f"Richiesto da {player.current.requester}",
-                icon_url=getattr(player.current.requester, 'avatar_url', None)
-            )
-
-            if player.control_message:
-                await player.control_message.edit(
-                    embed=embed,
-                    view=MusicControls(next_track, player.guild, loop_active=player.loop)
-                )
         except Exception as e:
+            ERRORS.inc(source="track_end")
             print(f"Errore nel riprodurre il brano successivo: {e}")
-    else:
-        await asyncio.sleep(5)
+            return
+
         if player.control_message:
-            try:
-                await player.control_message.delete()
-            except Exception as e:
-                print(f"Errore nella cancellazione del messaggio di controllo: {e}")
-            finally:
-                player.control_message = None
-        await player.disconnect(force=True)
-        print("La coda è vuota: bot disconnesso automaticamente dalla vocale.")
+            embed = player.card.render(next_track, player.volume)
+            player.renderer.update(embed=embed, view=player_controls(player))
+    else:
+        # coda finita: il pannello si chiude subito, la disconnessione la decide
+        # il reaper dopo IDLE_TIMEOUT (un /play nel frattempo riparte da qui)
+        player.current = None
+        await clear_control_message(player)
+        reaper.refresh(player)
+
+##############################################
+# DISCONNESSIONE DEI PLAYER INATTIVI
+##############################################
+IDLE_MESSAGES = {
+    "idle": "La coda è vuota: bot disconnesso automaticamente dalla vocale.",
+    "paused": "Player in pausa da troppo tempo: bot disconnesso dalla vocale.",
+    "alone": "Nessuno in ascolto nel canale: bot disconnesso dalla vocale.",
+    "parked": "Nessun nuovo brano richiesto: bot disconnesso dalla vocale."
+}
+
+async def clear_control_message(player):
+    if player.control_message:
+        try:
+            await player.control_message.delete()
+        except Exception as e:
+            print(f"Errore nella cancellazione del messaggio di controllo: {e}")
+        finally:
+            player.set_control_message(None)
+
+async def park_player(player) -> bool:
+    # la connessione vocale resta aperta per VOICE_KEEPALIVE secondi
+    if not await voice_pool.park(player):
+        return False
+    await clear_control_message(player)
+    reaper.refresh(player)
+    return True
+
+async def reap_player(player, reason):
+    if reason == "idle" and await park_player(player):
+        print(f"💤 Coda vuota: connessione vocale della gilda {player.guild.id} tenuta pronta per {VOICE_KEEPALIVE:.0f}s.")
+        return
+    await clear_control_message(player)
+    await player.disconnect(force=True)
+    print(f"{IDLE_MESSAGES[reason]} (gilda {player.guild.id})")
+
+reaper = IdleReaper(reap_player)
+voice_pool = VoicePool(connect_player)
+
+@bot.event
+async def on_voice_state_update(member, before, after):
+    player = find_player(member.guild)
+    if not isinstance(player, CustomPlayer):
+        return
+    if member.id == bot.user.id and after.channel is None:
+        reaper.forget(member.guild.id)
+        voice_pool.forget(member.guild.id)
+    elif player.channel in (before.channel, after.channel):
+        # ingresso, uscita, spostamento o cuffie disattivate nel canale del player
+        reaper.refresh(player)
 
 # Avvio del bot
-bot.run(DISCORD_TOKEN)
+if __name__ == "__main__":
+    bot.run(DISCORD_TOKEN)
@@ -0,0 +1,147 @@
+import asyncio
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from metrics import ERRORS, EXTRACTION_SECONDS
+
+EXTRACT_WORKERS = int(os.getenv("EXTRACT_WORKERS", "2"))
+EXTRACT_TIMEOUT = float(os.getenv("EXTRACT_TIMEOUT", "120"))
+
+YDL_OPTS = {
+    'extract_flat': True,
+    'skip_download': True,
+    'quiet': True,
+}
+
+##############################################
+# SERVIZIO DI ESTRAZIONE YT-DLP
+##############################################
+# yt-dlp gira su un pool di thread dedicato (non quello di default del loop).
+# Ogni thread riusa la propria istanza di YoutubeDL. Le richieste in attesa
+# sono divise per gilda e servite a turno, cosi' chi incolla una playlist
+# enorme non blocca le altre gilde. Se chi ha chiesto l'estrazione smette di
+# aspettare (timeout, player fermato o disconnesso, token dell'interazione in
+# scadenza: vedi /play in bot.py), la richiesta non ancora partita viene
+# scartata; quella gia' sul thread finisce ma il risultato viene ignorato.
+
+class _Job:
+    __slots__ = ("query", "future", "queued_at")
+
+    def __init__(self, query, future):
+        self.query = query
+        self.future = future
+        self.queued_at = time.monotonic()
+
+class ExtractionService:
+    def __init__(self, workers: int = EXTRACT_WORKERS, ydl_opts: dict = YDL_OPTS):
+        self.workers = max(1, workers)
+        self.ydl_opts = ydl_opts
+        self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="yt-dlp")
+        self._local = threading.local()
+        self._queues = OrderedDict()
+        self._running = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.total_latency = 0.0
+        self.last_latency = 0.0
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(len(q) for q in self._queues.values())
+
+    @property
+    def running(self) -> int:
+        return self._running
+
+    def stats(self) -> dict:
+        done = self.completed + self.failed
+        return {
+            "queue_depth": self.queue_depth,
+            "running": self._running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "avg_wait": self.total_wait / done if done else 0.0,
+            "avg_latency": self.total_latency / done if done else 0.0,
+            "last_latency": self.last_latency
+        }
+
+    def _ydl(self):
+        ydl = getattr(self._local, "ydl", None)
+        if ydl is None:
+            # import ritardato: yt-dlp e' pesante e serve solo alla prima playlist
+            import yt_dlp as youtube_dl
+            ydl = youtube_dl.YoutubeDL(self.ydl_opts)
+            self._local.ydl = ydl
+        return ydl
+
+    def _extract_sync(self, query):
+        return self._ydl().extract_info(query, download=False)
+
+    async def extract(self, query: str, guild_id=None, timeout: float | None = EXTRACT_TIMEOUT):
+        future = asyncio.get_running_loop().create_future()
+        self._queues.setdefault(guild_id, deque()).append(_Job(query, future))
+        self._pump()
+        try:
+            return await asyncio.wait_for(future, timeout=timeout)
+        except (asyncio.CancelledError, asyncio.TimeoutError):
+            if future.cancelled():
+                self.cancelled += 1
+            raise
+
+    def _next_job(self):
+        # round robin: la gilda servita torna in fondo alla fila
+        while self._queues:
+            guild_id, queue = next(iter(self._queues.items()))
+            job = queue.popleft()
+            if queue:
+                self._queues.move_to_end(guild_id)
+            else:
+                del self._queues[guild_id]
+            if not job.future.done():
+                return job
+        return None
+
+    def _pump(self):
+        loop = asyncio.get_running_loop()
+        while self._running < self.workers:
+            job = self._next_job()
+            if job is None:
+                return
+            self._running += 1
+            started = time.monotonic()
+            self.total_wait += started - job.queued_at
+            work = loop.run_in_executor(self._executor, self._extract_sync, job.query)
+            work.add_done_callback(lambda fut, job=job, started=started: self._finished(job, fut, started))
+
+    def _finished(self, job, work, started):
+        self._running -= 1
+        self.last_latency = time.monotonic() - started
+        self.total_latency += self.last_latency
+        EXTRACTION_SECONDS.observe(self.last_latency)
+        error = work.exception()
+        if error is not None:
+            self.failed += 1
+            ERRORS.inc(source="extraction")
+            if not job.future.done():
+                job.future.set_exception(error)
+        else:
+            self.completed += 1
+            if not job.future.done():
+                job.future.set_result(work.result())
+        self._pump()
+
+    def close(self):
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+_service = None
+
+def get_extraction_service() -> ExtractionService:
+    global _service
+    if _service is None:
+        _service = ExtractionService()
+    return _service
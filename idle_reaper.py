@@ -0,0 +1,134 @@
+import asyncio
+import os
+import time
+from metrics import ERRORS, IDLE_DISCONNECTS
+
+IDLE_TIMEOUT = float(os.getenv("IDLE_TIMEOUT", "5"))
+PAUSED_TIMEOUT = float(os.getenv("PAUSED_TIMEOUT", "600"))
+ALONE_TIMEOUT = float(os.getenv("ALONE_TIMEOUT", "60"))
+VOICE_KEEPALIVE = float(os.getenv("VOICE_KEEPALIVE", "120"))
+
+##############################################
+# DISCONNESSIONE DEI PLAYER INATTIVI
+##############################################
+# Un unico scheduler per tutte le gilde. Per ogni player si annota da quando
+# vale ciascuna condizione di inattivita' (coda finita, pausa, nessun
+# ascoltatore nel canale) e si programma un solo timer con loop.call_later
+# sulla scadenza piu' vicina: nessuna coroutine resta in attesa. Gli eventi
+# (inizio/fine brano, pausa, ingressi e uscite dal canale vocale) chiamano
+# refresh, che ricalcola le condizioni. Un timeout <= 0 disattiva la regola.
+# Un player parcheggiato (voice_pool.py) ha una regola sua, "parked", al
+# posto di "idle".
+
+TIMEOUTS = {
+    "idle": IDLE_TIMEOUT,
+    "paused": PAUSED_TIMEOUT,
+    "alone": ALONE_TIMEOUT,
+    "parked": VOICE_KEEPALIVE
+}
+
+def listener_count(player) -> int:
+    channel = getattr(player, "channel", None)
+    count = 0
+    for member in getattr(channel, "members", ()):
+        voice = member.voice
+        if member.bot or (voice is not None and (voice.deaf or voice.self_deaf)):
+            continue
+        count += 1
+    return count
+
+def idle_conditions(player, listeners: int) -> set:
+    conditions = set()
+    if getattr(player, "parked", False):
+        conditions.add("parked")
+    elif player.stopped or (player.current is None and not player.queue and not player.pending_tracks):
+        conditions.add("idle")
+    if player._custom_paused:
+        conditions.add("paused")
+    if listeners == 0:
+        conditions.add("alone")
+    return conditions
+
+class GuildActivity:
+    __slots__ = ("player", "since", "last_activity", "listeners", "timer")
+
+    def __init__(self, player):
+        self.player = player
+        self.since = {}
+        self.last_activity = time.monotonic()
+        self.listeners = 0
+        self.timer = None
+
+    def deadline(self, timeouts):
+        # (istante, motivo) della prima regola che scade, oppure (None, None)
+        candidates = [(since + timeouts[reason], reason) for reason, since in self.since.items() if timeouts[reason] > 0]
+        return min(candidates) if candidates else (None, None)
+
+class IdleReaper:
+    def __init__(self, on_idle, timeouts=None):
+        # on_idle(player, reason): coroutine che chiude il player
+        self.on_idle = on_idle
+        self.timeouts = dict(TIMEOUTS if timeouts is None else timeouts)
+        self._guilds = {}
+
+    def refresh(self, player, activity: bool = False):
+        guild_id = player.guild.id
+        state = self._guilds.get(guild_id)
+        if state is None or state.player is not player:
+            if state is not None and state.timer is not None:
+                state.timer.cancel()
+            state = self._guilds[guild_id] = GuildActivity(player)
+        now = time.monotonic()
+        if activity:
+            # un comando o un pulsante dell'utente fa ripartire i timer
+            state.last_activity = now
+            state.since.clear()
+        state.listeners = listener_count(player)
+
+        conditions = idle_conditions(player, state.listeners)
+        for reason in list(state.since):
+            if reason not in conditions:
+                del state.since[reason]
+        for reason in conditions:
+            state.since.setdefault(reason, now)
+        self._schedule(guild_id, state)
+
+    def forget(self, guild_id: int):
+        state = self._guilds.pop(guild_id, None)
+        if state is not None and state.timer is not None:
+            state.timer.cancel()
+
+    def _schedule(self, guild_id, state):
+        if state.timer is not None:
+            state.timer.cancel()
+            state.timer = None
+        when, _ = state.deadline(self.timeouts)
+        if when is None:
+            return
+        loop = asyncio.get_running_loop()
+        state.timer = loop.call_later(max(0.0, when - time.monotonic()), self._expired, guild_id)
+
+    def _expired(self, guild_id):
+        state = self._guilds.get(guild_id)
+        if state is None:
+            return
+        state.timer = None
+        asyncio.create_task(self._reap(guild_id, state))
+
+    async def _reap(self, guild_id, state):
+        player = state.player
+        if not player.is_connected():
+            self.forget(guild_id)
+            return
+        # lo stato puo' essere cambiato senza eventi (es. coda riempita): si ricontrolla
+        self.refresh(player)
+        when, reason = state.deadline(self.timeouts)
+        if when is None or when > time.monotonic():
+            return
+        self.forget(guild_id)
+        IDLE_DISCONNECTS.inc(reason=reason)
+        try:
+            await self.on_idle(player, reason)
+        except Exception as e:
+            ERRORS.inc(source="idle_reaper")
+            print(f"Errore nella disconnessione del player inattivo della gilda {guild_id}: {e}")
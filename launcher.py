@@ -0,0 +1,143 @@
+import asyncio
+import os
+import signal
+import sys
+import aiohttp
+from dotenv import load_dotenv
+from sharding import format_shard_ids, shard_ranges
+
+load_dotenv()
+
+DISCORD_TOKEN = os.getenv("DISCORD_TOKEN")
+SHARD_WORKERS = int(os.getenv("SHARD_WORKERS", str(os.cpu_count() or 1)))
+RESTART_DELAY = float(os.getenv("SHARD_RESTART_DELAY", "5"))
+MAX_RESTART_DELAY = 300.0
+IDENTIFY_WINDOW = 5.0
+GATEWAY_URL = "https://discord.com/api/v10/gateway/bot"
+
+##############################################
+# LAUNCHER MULTI-PROCESSO
+##############################################
+# Divide gli shard del gateway in intervalli contigui e avvia un processo
+# bot.py per intervallo (SHARD_COUNT/SHARD_IDS nell'ambiente del figlio).
+# Ogni gilda appartiene a un solo shard, quindi a un solo processo: player,
+# code e messaggi di controllo non vengono mai condivisi. Tra i processi sono
+# condivisi solo i file SQLite (playlist, cache dei brani, sessioni), in
+# modalita' WAL; il backend JSON delle playlist tiene i dati in memoria e non
+# e' utilizzabile con piu' processi. Un processo che termina viene riavviato
+# con un'attesa crescente. Ogni processo rispetta il limite di IDENTIFY solo
+# per i propri shard: all'avvio i processi partono scaglionati, uno slot di
+# IDENTIFY_WINDOW secondi ogni max_concurrency shard che li precedono.
+
+async def gateway_info(token: str) -> tuple[int, int]:
+    # (shard consigliati, max_concurrency degli IDENTIFY)
+    async with aiohttp.ClientSession() as session:
+        async with session.get(GATEWAY_URL, headers={"Authorization": f"Bot {token}"}) as response:
+            response.raise_for_status()
+            data = await response.json()
+    limit = data.get("session_start_limit") or {}
+    return int(data["shards"]), max(1, int(limit.get("max_concurrency", 1)))
+
+def start_delay(shard_ids, max_concurrency: int) -> float:
+    # gli shard prima del primo di questo processo occupano -(-n // c) slot
+    return -(-shard_ids[0] // max_concurrency) * IDENTIFY_WINDOW if shard_ids else 0.0
+
+def worker_env(index: int, shard_ids, shard_count: int) -> dict:
+    env = dict(os.environ)
+    env["SHARD_COUNT"] = str(shard_count)
+    env["SHARD_IDS"] = format_shard_ids(shard_ids)
+    env["SHARD_WORKER"] = str(index)
+    metrics_port = int(env.get("METRICS_PORT", "0") or 0)
+    if metrics_port:
+        # una porta per processo: METRICS_PORT, METRICS_PORT + 1, ...
+        env["METRICS_PORT"] = str(metrics_port + index)
+    return env
+
+class Worker:
+    def __init__(self, index: int, shard_ids, shard_count: int):
+        self.index = index
+        self.shard_ids = shard_ids
+        self.shard_count = shard_count
+        self.process = None
+        self.restarts = 0
+
+    @property
+    def label(self):
+        return f"processo {self.index} (shard {format_shard_ids(self.shard_ids)})"
+
+    async def start(self):
+        self.process = await asyncio.create_subprocess_exec(
+            sys.executable, "bot.py", env=worker_env(self.index, self.shard_ids, self.shard_count)
+        )
+        print(f"▶️ Avviato il {self.label}, pid {self.process.pid}.")
+
+    async def supervise(self, stopping: asyncio.Event, delay: float = 0.0):
+        if delay > 0:
+            print(f"⏳ Il {self.label} parte tra {delay:.0f}s (IDENTIFY scaglionati).")
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+                return
+            except asyncio.TimeoutError:
+                pass
+        while not stopping.is_set():
+            await self.start()
+            started = asyncio.get_running_loop().time()
+            code = await self.process.wait()
+            if stopping.is_set():
+                break
+            # dopo un'ora senza problemi l'attesa torna quella iniziale
+            if asyncio.get_running_loop().time() - started > 3600:
+                self.restarts = 0
+            delay = min(MAX_RESTART_DELAY, RESTART_DELAY * 2 ** self.restarts)
+            self.restarts += 1
+            print(f"⚠️ Il {self.label} è terminato (codice {code}), riavvio tra {delay:.0f}s.")
+            try:
+                await asyncio.wait_for(stopping.wait(), delay)
+            except asyncio.TimeoutError:
+                pass
+
+    def terminate(self):
+        if self.process is not None and self.process.returncode is None:
+            self.process.terminate()
+
+async def main():
+    if DISCORD_TOKEN is None:
+        raise ValueError("Il token del bot non è stato trovato nel file .env")
+    if os.getenv("PLAYLIST_BACKEND", "sqlite").lower() == "json" and SHARD_WORKERS > 1:
+        print("❌ Il backend JSON delle playlist non si può condividere tra processi: usa PLAYLIST_BACKEND=sqlite.")
+        sys.exit(1)
+
+    shard_count = int(os.getenv("SHARD_COUNT", "0"))
+    try:
+        recommended, max_concurrency = await gateway_info(DISCORD_TOKEN)
+    except (aiohttp.ClientError, KeyError, ValueError) as e:
+        if not shard_count:
+            raise
+        print(f"⚠️ /gateway/bot non disponibile ({e}): IDENTIFY a uno alla volta.")
+        recommended, max_concurrency = shard_count, 1
+    shard_count = shard_count or recommended
+    ranges = shard_ranges(shard_count, SHARD_WORKERS)
+    print(f"🧩 {shard_count} shard divisi su {len(ranges)} processi (max_concurrency {max_concurrency}).")
+    workers = [Worker(index, ids, shard_count) for index, ids in enumerate(ranges)]
+
+    stopping = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            # Windows: Ctrl+C arriva comunque ai processi figli
+            pass
+
+    tasks = [
+        asyncio.create_task(worker.supervise(stopping, start_delay(worker.shard_ids, max_concurrency)))
+        for worker in workers
+    ]
+    await stopping.wait()
+    print("⏹️ Arresto dei processi del bot…")
+    for worker in workers:
+        worker.terminate()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,307 @@
+import inspect
+import os
+import sys
+import time
+from contextlib import contextmanager, nullcontext
+from functools import wraps
+
+METRICS_PORT = int(os.getenv("METRICS_PORT", "0"))
+METRICS_HOST = os.getenv("METRICS_HOST", "127.0.0.1")
+ENABLED = METRICS_PORT > 0
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+##############################################
+# METRICHE IN FORMATO PROMETHEUS
+##############################################
+# Contatori, istogrammi e gauge minimi, esposti in formato testo su
+# http://METRICS_HOST:METRICS_PORT/metrics. Con METRICS_PORT non impostata
+# le metriche sono disattivate: i decoratori restituiscono la funzione
+# originale e inc/observe escono subito.
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in pairs) + "}"
+
+def _format_value(value):
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value))
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labelnames=()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        REGISTRY.append(self)
+
+    def _key(self, labels):
+        return tuple(str(labels.get(name, "")) for name in self.labelnames)
+
+    def header(self):
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def __init__(self, name, help, labelnames=()):
+        super().__init__(name, help, labelnames)
+        self.values = {}
+
+    def inc(self, amount=1, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        self.values[key] = self.values.get(key, 0) + amount
+
+    def collect(self):
+        lines = self.header()
+        for key, value in self.values.items():
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets) + (float("inf"),)
+        self.values = {}
+
+    def observe(self, value, **labels):
+        if not ENABLED:
+            return
+        key = self._key(labels)
+        entry = self.values.get(key)
+        if entry is None:
+            entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+        counts = entry[0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+                break
+        entry[1] += value
+        entry[2] += 1
+
+    def time(self, **labels):
+        if not ENABLED:
+            return nullcontext()
+        return self._timer(labels)
+
+    @contextmanager
+    def _timer(self, labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self):
+        lines = self.header()
+        for key, (counts, total, count) in self.values.items():
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                labels = _format_labels(self.labelnames, key, [("le", _format_value(bound))])
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+class Gauge(_Metric):
+    # il valore viene calcolato solo quando Prometheus legge /metrics
+    kind = "gauge"
+
+    def __init__(self, name, help, labelnames=(), function=None):
+        super().__init__(name, help, labelnames)
+        self.function = function
+
+    def collect(self):
+        lines = self.header()
+        if self.function is None:
+            return lines
+        try:
+            values = self.function()
+        except Exception as e:
+            print(f"Errore nel calcolo della metrica {self.name}: {e}")
+            return lines
+        if not isinstance(values, dict):
+            values = {(): values}
+        for key, value in values.items():
+            if value is None:
+                continue
+            key = key if isinstance(key, tuple) else (key,)
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+REGISTRY = []
+
+def render() -> str:
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.collect())
+    return "\n".join(lines) + "\n"
+
+def timed(histogram, **labels):
+    # decoratore per funzioni sincrone e coroutine; no-op se disattivato
+    def decorator(func):
+        if not ENABLED:
+            return func
+        if inspect.iscoroutinefunction(func):
+            @wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                start = time.perf_counter()
+                try:
+                    return await func(*args, **kwargs)
+                finally:
+                    histogram.observe(time.perf_counter() - start, **labels)
+            return async_wrapper
+
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, **labels)
+        return wrapper
+    return decorator
+
+##############################################
+# METRICHE DEL BOT
+##############################################
+TRACK_LOOKUP_SECONDS = Histogram(
+    "sonora_get_track_seconds", "Tempo per risolvere un brano (cache o ricerca Lavalink)."
+)
+PLAYLIST_LOAD_SECONDS = Histogram(
+    "sonora_playlist_load_seconds",
+    "Estrazione e risoluzione di una playlist da /play (youtube) o /playplaylist (saved), fino al primo brano o al caricamento completo.",
+    ["source", "phase"]
+)
+EXTRACTION_SECONDS = Histogram(
+    "sonora_extraction_seconds", "Durata di un'estrazione yt-dlp nel pool dedicato."
+)
+PLAYLIST_SAVE_SECONDS = Histogram(
+    "sonora_playlist_save_seconds", "Tempo di scrittura delle playlist JSON su disco (flush, journal).", ["op"]
+)
+PLAYLIST_STORE_SECONDS = Histogram(
+    "sonora_playlist_store_seconds", "Durata delle operazioni dello store delle playlist, attesa del thread compresa.",
+    ["backend", "op"]
+)
+CONTROL_EDIT_SECONDS = Histogram(
+    "sonora_control_edit_seconds", "Latenza della modifica del messaggio di controllo."
+)
+TRACK_END_REASONS = Counter(
+    "sonora_track_end_total", "Brani terminati, per motivo riportato da Lavalink.", ["reason"]
+)
+ERRORS = Counter(
+    "sonora_errors_total", "Errori gestiti, per punto di origine.", ["source"]
+)
+IDLE_DISCONNECTS = Counter(
+    "sonora_idle_disconnects_total", "Player disconnessi per inattivita', per motivo.", ["reason"]
+)
+VOICE_CONNECTIONS = Counter(
+    "sonora_voice_connections_total",
+    "Eventi delle connessioni vocali (new, reused, moved, reconnected, active, parked, evicted).", ["result"]
+)
+FILTER_UPDATES = Counter(
+    "sonora_filter_updates_total", "Aggiornamenti dei filtri audio, per esito (sent, unchanged, error).", ["result"]
+)
+INTERACTION_FIRST_RESPONSE_SECONDS = Histogram(
+    "sonora_interaction_first_response_seconds", "Tempo tra la creazione di un'interazione (created_at) e la prima risposta.",
+    ["command"], buckets=(0.05, 0.1, 0.25, 0.5, 1.0, 1.5, 2.0, 2.5, 3.0, 5.0, 10.0)
+)
+INTERACTION_LATE = Counter(
+    "sonora_interaction_late_total", "Interazioni che hanno risposto oltre i 3 secondi concessi da Discord.", ["command"]
+)
+
+# node_pool (e quindi wavelink) viene importato solo quando Prometheus legge
+# le gauge: lo store delle playlist usa questo modulo senza dipendere da wavelink.
+
+def _players():
+    from node_pool import all_nodes, node_players
+    return [player for node in all_nodes() for player in node_players(node)]
+
+def _node_stat(attr):
+    def collect():
+        from node_pool import all_nodes
+        values = {}
+        for node in all_nodes():
+            stats = getattr(node, "stats", None)
+            if stats is not None:
+                values[node.identifier] = getattr(stats, attr, None)
+        return values
+    return collect
+
+def _node_penalties():
+    from node_pool import all_nodes, node_penalty
+    return {node.identifier: node_penalty(node) for node in all_nodes()}
+
+def _node_available():
+    from node_pool import all_nodes, node_is_available
+    return {node.identifier: int(node_is_available(node)) for node in all_nodes()}
+
+def _node_players():
+    from node_pool import all_nodes, node_players
+    return {node.identifier: len(node_players(node)) for node in all_nodes()}
+
+def _extraction_stat(name):
+    def collect():
+        # extraction importa questo modulo: si legge il servizio solo se gia' creato
+        service = getattr(sys.modules.get("extraction"), "_service", None)
+        return service.stats()[name] if service is not None else None
+    return collect
+
+Gauge("sonora_players", "Player collegati a un canale vocale.",
+      function=lambda: len(_players()))
+Gauge("sonora_queue_tracks", "Brani in coda su tutti i player.",
+      function=lambda: sum(len(getattr(p, "queue", ())) for p in _players()))
+Gauge("sonora_pending_tracks", "Brani di playlist ancora in risoluzione.",
+      function=lambda: sum(getattr(p, "pending_tracks", 0) for p in _players()))
+Gauge("sonora_max_queue_tracks", "Coda piu' lunga tra i player.",
+      function=lambda: max((len(getattr(p, "queue", ())) for p in _players()), default=0))
+Gauge("sonora_node_available", "1 se il nodo Lavalink e' connesso.", ["node"], _node_available)
+Gauge("sonora_node_players", "Player assegnati al nodo Lavalink.", ["node"], _node_players)
+Gauge("sonora_node_penalty", "Penalita' di carico usata per scegliere il nodo.", ["node"], _node_penalties)
+Gauge("sonora_node_system_load", "Carico CPU di sistema riportato dal nodo.", ["node"], _node_stat("system_load"))
+Gauge("sonora_node_lavalink_load", "Carico CPU di Lavalink riportato dal nodo.", ["node"], _node_stat("lavalink_load"))
+Gauge("sonora_node_frames_deficit", "Frame audio mancanti riportati dal nodo.", ["node"], _node_stat("frames_deficit"))
+Gauge("sonora_node_frames_nulled", "Frame audio nulli riportati dal nodo.", ["node"], _node_stat("frames_nulled"))
+Gauge("sonora_extraction_queue_depth", "Richieste yt-dlp in attesa.", function=_extraction_stat("queue_depth"))
+Gauge("sonora_extraction_running", "Estrazioni yt-dlp in corso.", function=_extraction_stat("running"))
+
+##############################################
+# ENDPOINT HTTP
+##############################################
+_runner = None
+
+async def start_metrics_server(host: str = METRICS_HOST, port: int = METRICS_PORT):
+    global _runner
+    if not ENABLED or _runner is not None:
+        return None
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=render(), content_type="text/plain", charset="utf-8")
+
+    app = web.Application()
+    app.router.add_get("/metrics", handle)
+    _runner = web.AppRunner(app, access_log=None)
+    await _runner.setup()
+    await web.TCPSite(_runner, host, port).start()
+    print(f"📈 Metriche disponibili su http://{host}:{port}/metrics")
+    return _runner
+
+async def stop_metrics_server():
+    global _runner
+    if _runner is not None:
+        await _runner.cleanup()
+        _runner = None
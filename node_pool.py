@@ -0,0 +1,187 @@
+import asyncio
+import datetime
+import os
+import time
+import wavelink
+
+NODE_CHECK_INTERVAL = float(os.getenv("NODE_CHECK_INTERVAL", "5"))
+
+##############################################
+# CONFIGURAZIONE DEI NODI LAVALINK
+##############################################
+# LAVALINK_NODES="host:porta:password,host2:porta2:password2" permette di
+# usare piu' nodi; se manca si usa il singolo nodo LAVALINK_HOST/PORT/PASSWORD.
+
+def load_node_configs() -> list[dict]:
+    configs = []
+    raw = os.getenv("LAVALINK_NODES", "").strip()
+    if raw:
+        for index, entry in enumerate(e.strip() for e in raw.split(",")):
+            if not entry:
+                continue
+            host, port, password = entry.split(":", 2)
+            configs.append({
+                "identifier": f"nodo-{index + 1}",
+                "host": host,
+                "port": int(port),
+                "password": password
+            })
+    elif os.getenv("LAVALINK_HOST"):
+        configs.append({
+            "identifier": "nodo-1",
+            "host": os.getenv("LAVALINK_HOST"),
+            "port": int(os.getenv("LAVALINK_PORT", "2333")),
+            "password": os.getenv("LAVALINK_PASSWORD")
+        })
+    return configs
+
+def all_nodes() -> list:
+    return list(getattr(wavelink.NodePool, "_nodes", {}).values())
+
+async def connect_nodes(bot, configs: list[dict]):
+    existing = {getattr(node, "identifier", None) for node in all_nodes()}
+    for config in configs:
+        if config["identifier"] in existing:
+            continue
+        try:
+            await wavelink.NodePool.create_node(bot=bot, **config)
+            print(f"⌛ Nodo Lavalink {config['identifier']} ({config['host']}:{config['port']}) in creazione…")
+        except Exception as e:
+            print(f"❌ Errore nel creare il nodo Lavalink {config['identifier']}: {e}")
+
+##############################################
+# SCELTA DEL NODO MENO CARICO
+##############################################
+def node_players(node) -> list:
+    players = getattr(node, "_players", None)
+    if players is None:
+        players = getattr(node, "players", [])
+    return list(players.values()) if isinstance(players, dict) else list(players)
+
+def node_is_available(node) -> bool:
+    is_connected = getattr(node, "is_connected", None)
+    if callable(is_connected):
+        return bool(is_connected())
+    ws = getattr(node, "_websocket", None)
+    return ws is not None and ws.is_connected()
+
+def node_penalty(node) -> float:
+    # Stesso criterio dei client Lavalink ufficiali: player attivi,
+    # carico della CPU e frame audio mancanti/nulli negli ultimi minuti.
+    penalty = float(len(node_players(node)))
+    stats = getattr(node, "stats", None)
+    if stats is None:
+        return penalty
+    system_load = getattr(stats, "system_load", 0) or 0
+    penalty += 1.05 ** (100 * system_load) * 10 - 10
+    deficit = getattr(stats, "frames_deficit", None)
+    nulled = getattr(stats, "frames_nulled", None)
+    if deficit is not None:
+        penalty += 1.03 ** (500 * (deficit / 3000)) * 600 - 600
+    if nulled is not None:
+        penalty += (1.03 ** (500 * (nulled / 3000)) * 300 - 300) * 2
+    return penalty
+
+def pick_node(exclude=()):
+    candidates = [node for node in all_nodes() if node not in exclude and node_is_available(node)]
+    if not candidates:
+        raise wavelink.ZeroConnectedNodes("Nessun nodo Lavalink disponibile.")
+    return min(candidates, key=node_penalty)
+
+def player_factory(cls, node):
+    return lambda client, channel: cls(client, channel, node=node)
+
+def player_position(player) -> float:
+    # wavelink 1.0.1: dopo play() last_update resta all'epoch fino al primo
+    # playerUpdate di Lavalink (~5s) e player.position vale l'intera durata.
+    # In quella finestra si stima la posizione dall'avvio registrato dal player.
+    if not player.is_playing():
+        return 0.0
+    last_update = getattr(player, "last_update", None)
+    if isinstance(last_update, datetime.datetime) and last_update.timestamp() > 0:
+        return float(player.position or 0)
+    started = getattr(player, "track_started", None)
+    if started is None:
+        return 0.0
+    at, offset = started
+    if player.is_paused():
+        return offset
+    length = float(getattr(player.source, "length", 0) or 0)
+    position = offset + time.monotonic() - at
+    return min(position, length) if length else position
+
+def find_player(guild):
+    if guild is None:
+        return None
+    voice = guild.voice_client
+    if isinstance(voice, wavelink.Player):
+        return voice
+    for node in all_nodes():
+        for player in node_players(node):
+            if player.guild == guild:
+                return player
+    return None
+
+##############################################
+# MIGRAZIONE DEI PLAYER E FAILOVER
+##############################################
+def _detach(player, node):
+    players = getattr(node, "_players", None)
+    if isinstance(players, dict):
+        players.pop(player.guild.id, None)
+    elif isinstance(players, list) and player in players:
+        players.remove(player)
+
+def _attach(player, node):
+    players = getattr(node, "_players", None)
+    if isinstance(players, dict):
+        players[player.guild.id] = player
+    elif isinstance(players, list) and player not in players:
+        players.append(player)
+
+async def migrate_player(player, node):
+    old_node = player.node
+    track = getattr(player, "current", None) or getattr(player, "source", None)
+    position = player_position(player)
+    volume = player.volume
+    paused = player.is_paused()
+
+    _detach(player, old_node)
+    _attach(player, node)
+    player.node = node
+
+    voice_state = getattr(player, "_voice_state", None)
+    if voice_state and hasattr(player, "_dispatch_voice_update"):
+        await player._dispatch_voice_update(voice_state)
+
+    if track is not None:
+        await player.play(track, start=int(position * 1000))
+        if paused:
+            await player.set_pause(True)
+    await player.set_volume(volume)
+
+    restore = getattr(player, "restore_filters", None)
+    if restore is not None:
+        await restore()
+
+    print(f"🔀 Player della gilda {player.guild.id} spostato da {old_node.identifier} a {node.identifier}.")
+
+async def failover_players(node):
+    for player in node_players(node):
+        try:
+            target = pick_node(exclude=(node,))
+        except wavelink.ZeroConnectedNodes:
+            print("❌ Nessun nodo Lavalink disponibile per il failover.")
+            return
+        try:
+            await migrate_player(player, target)
+        except Exception as e:
+            print(f"Errore nello spostamento del player della gilda {player.guild.id}: {e}")
+
+async def monitor_nodes():
+    while True:
+        await asyncio.sleep(NODE_CHECK_INTERVAL)
+        for node in all_nodes():
+            if not node_is_available(node) and node_players(node):
+                print(f"⚠️ Nodo Lavalink {node.identifier} non raggiungibile, sposto i suoi player.")
+                await failover_players(node)
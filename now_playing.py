@@ -0,0 +1,206 @@
+import asyncio
+import json
+import os
+import discord
+from metrics import CONTROL_EDIT_SECONDS, ERRORS
+from track_cache import LRUCache
+from track_resolver import extract_video_id
+
+CONTROL_EDIT_INTERVAL = float(os.getenv("CONTROL_EDIT_INTERVAL", "1.5"))
+CONTROL_EDIT_WINDOW = float(os.getenv("CONTROL_EDIT_WINDOW", "0.3"))
+TEMPLATE_CACHE_SIZE = int(os.getenv("NOW_PLAYING_CACHE_SIZE", "512"))
+
+PLACEHOLDER_THUMBNAIL = "https://via.placeholder.com/150"
+NOW_PLAYING_TITLE = "🎶 Ora in riproduzione"
+DURATION_FIELD = "⏱ Durata"
+VOLUME_FIELD = "🔊 Volume"
+QUEUE_FIELD = "📑 Brani in coda"
+
+##############################################
+# EMBED "ORA IN RIPRODUZIONE"
+##############################################
+# Le parti che dipendono solo dal brano (link, miniatura, durata) vengono
+# calcolate una volta e tenute in cache per ID del brano. Ogni player ha una
+# NowPlayingCard: al cambio di brano costruisce l'embed, per volume e coda
+# modifica solo il campo interessato dell'embed esistente.
+
+def track_thumbnail(track) -> str:
+    thumbnail = getattr(track, "thumbnail", None)
+    if thumbnail:
+        return thumbnail
+    video_id = extract_video_id(getattr(track, "uri", None) or "")
+    if video_id:
+        return f"https://img.youtube.com/vi/{video_id}/0.jpg"
+    return PLACEHOLDER_THUMBNAIL
+
+def format_duration(seconds) -> str:
+    m, s = divmod(int(seconds), 60)
+    return f"{m}:{s:02d}"
+
+class TrackTemplate:
+    __slots__ = ("description", "thumbnail", "duration")
+
+    def __init__(self, track):
+        self.description = f"[{track.title}]({track.uri})"
+        self.thumbnail = track_thumbnail(track)
+        self.duration = format_duration(track.length)
+
+_templates = LRUCache(TEMPLATE_CACHE_SIZE, float("inf"))
+
+def track_template(track) -> TrackTemplate:
+    key = getattr(track, "id", None) or getattr(track, "uri", None) or id(track)
+    template = _templates.get(key)
+    if template is None:
+        template = TrackTemplate(track)
+        _templates.set(key, template)
+    return template
+
+class NowPlayingCard:
+    def __init__(self):
+        self.embed = None
+        self.track = None
+        self.title = None
+        self._volume_index = None
+        self._queue_index = None
+
+    def render(self, track, volume, *, title: str | None = None, queue: str | None = None) -> discord.Embed:
+        # senza titolo esplicito lo stesso brano conserva il suo (es. "Playlist: ...")
+        if title is None:
+            title = self.title if track is self.track and self.title else NOW_PLAYING_TITLE
+        if (self.embed is None or track is not self.track or title != self.title
+                or (queue is not None and self._queue_index is None)):
+            self._build(track, title, queue is not None)
+        self.set_volume(volume)
+        if queue is not None:
+            self.set_queue(queue)
+        return self.embed
+
+    def _build(self, track, title, with_queue):
+        template = track_template(track)
+        embed = discord.Embed(title=title, description=template.description, color=discord.Color.green())
+        embed.set_thumbnail(url=template.thumbnail)
+        embed.add_field(name=DURATION_FIELD, value=template.duration, inline=True)
+        embed.add_field(name=VOLUME_FIELD, value="", inline=True)
+        self._volume_index = 1
+        self._queue_index = None
+        if with_queue:
+            embed.add_field(name=QUEUE_FIELD, value="", inline=True)
+            self._queue_index = 2
+        requester = getattr(track, "requester", None)
+        if requester is not None:
+            embed.set_footer(text=f"Richiesto da {requester}", icon_url=requester.display_avatar.url)
+        self.embed = embed
+        self.track = track
+        self.title = title
+
+    def set_volume(self, volume) -> bool:
+        if self.embed is None:
+            return False
+        self.embed.set_field_at(self._volume_index, name=VOLUME_FIELD, value=f"{volume}%", inline=True)
+        return True
+
+    def set_queue(self, text: str) -> bool:
+        # solo le card create con il contatore della coda (playlist)
+        if self.embed is None or self._queue_index is None:
+            return False
+        self.embed.set_field_at(self._queue_index, name=QUEUE_FIELD, value=text, inline=True)
+        return True
+
+    def reset(self):
+        self.embed = None
+        self.track = None
+        self.title = None
+
+##############################################
+# AGGIORNAMENTO DEL MESSAGGIO DI CONTROLLO
+##############################################
+# Ogni player tiene lo stato desiderato del suo messaggio "Ora in
+# riproduzione": le modifiche ravvicinate vengono unite, si fa al massimo una
+# edit ogni CONTROL_EDIT_INTERVAL secondi e non si invia nulla se il
+# risultato e' identico a quello gia' mostrato.
+
+def _render_key(name, value):
+    if value is None:
+        return None
+    if name == "embed":
+        return json.dumps(value.to_dict(), sort_keys=True, default=str)
+    if name == "view":
+        return json.dumps(value.to_components(), sort_keys=True, default=str)
+    return repr(value)
+
+class ControlMessageRenderer:
+    def __init__(self, player, interval: float = CONTROL_EDIT_INTERVAL, window: float = CONTROL_EDIT_WINDOW):
+        self.player = player
+        self.interval = interval
+        self.window = window
+        self._pending = {}
+        self._shown = {}
+        self._message_id = None
+        self._last_edit = 0.0
+        self._task = None
+        self.embed = None
+
+    def attach(self, message, embed=None, view=None):
+        # chiamato quando viene inviato un nuovo messaggio di controllo
+        self.cancel()
+        self._message_id = getattr(message, "id", None)
+        self._shown = {"embed": _render_key("embed", embed), "view": _render_key("view", view)}
+        self.embed = embed
+
+    def update(self, **fields):
+        # fields: embed e/o view, come per Message.edit
+        if fields.get("embed") is not None:
+            self.embed = fields["embed"]
+        self._pending.update(fields)
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._flush_later())
+
+    def cancel(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._pending.clear()
+
+    def reset(self):
+        self.cancel()
+        self._shown.clear()
+        self._message_id = None
+        self.embed = None
+
+    async def _flush_later(self):
+        loop = asyncio.get_running_loop()
+        while self._pending:
+            delay = max(self.window, self._last_edit + self.interval - loop.time())
+            await asyncio.sleep(delay)
+            await self.flush()
+
+    async def flush(self):
+        message = self.player.control_message
+        fields, self._pending = self._pending, {}
+        if not message or not fields:
+            return False
+
+        if message.id != self._message_id:
+            self._shown.clear()
+            self._message_id = message.id
+
+        changes = {}
+        keys = {}
+        for name, value in fields.items():
+            key = _render_key(name, value)
+            if self._shown.get(name) != key:
+                changes[name] = value
+                keys[name] = key
+        if not changes:
+            return False
+
+        self._last_edit = asyncio.get_running_loop().time()
+        try:
+            with CONTROL_EDIT_SECONDS.time():
+                await message.edit(**changes)
+        except discord.HTTPException as e:
+            ERRORS.inc(source="control_edit")
+            print(f"Errore nell'aggiornamento del messaggio di controllo: {e}")
+            return False
+        self._shown.update(keys)
+        return True
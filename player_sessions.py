@@ -0,0 +1,169 @@
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from node_pool import player_position
+from track_cache import build_track
+from track_queue import requester_id
+
+PLAYER_SESSIONS_DB = os.getenv("PLAYER_SESSIONS_DB", "player_sessions.db")
+PLAYER_SNAPSHOT_INTERVAL = float(os.getenv("PLAYER_SNAPSHOT_INTERVAL", "15"))
+PLAYER_SESSION_MAX_AGE = float(os.getenv("PLAYER_SESSION_MAX_AGE", "3600"))
+
+##############################################
+# SNAPSHOT DELLE SESSIONI DEI PLAYER
+##############################################
+# Ogni PLAYER_SNAPSHOT_INTERVAL secondi lo stato di ogni player (brano
+# corrente e posizione, coda, volume, loop, pausa, equalizzatore, messaggio
+# di controllo) viene salvato su SQLite, una riga per gilda. I brani sono
+# salvati come stringa codificata di Lavalink con le sue info: al riavvio si
+# ricostruiscono in locale, senza nessuna ricerca. Si scrivono solo le righe
+# cambiate dall'ultimo snapshot.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    guild_id INTEGER PRIMARY KEY,
+    data TEXT NOT NULL,
+    saved_at REAL NOT NULL
+);
+"""
+
+def _pack_track(track) -> list:
+    return [track.id, dict(track.info), requester_id(track)]
+
+def unpack_track(entry, guild=None):
+    encoded, info, user_id = entry
+    track = build_track(encoded, info)
+    # senza l'intent dei membri l'utente puo' mancare: la card resta senza footer
+    member = guild.get_member(user_id) if guild is not None and user_id else None
+    if member is not None:
+        track.requester = member
+    return track
+
+def _pack_filters(player) -> dict | None:
+    filters = getattr(player, "filters", None)
+    if filters is None or filters.state.is_neutral():
+        return None
+    return filters.state.to_dict()
+
+def snapshot_player(player) -> dict | None:
+    current = getattr(player, "current", None)
+    channel = getattr(player, "channel", None)
+    if current is None or channel is None or getattr(player, "stopped", False):
+        return None
+    message = getattr(player, "control_message", None)
+    return {
+        "channel_id": channel.id,
+        "node": getattr(player.node, "identifier", None),
+        "current": _pack_track(current),
+        "position": player_position(player),
+        "queue": [_pack_track(track) for track in player.queue],
+        "volume": player.volume,
+        "loop": bool(getattr(player, "loop", False)),
+        "paused": bool(getattr(player, "_custom_paused", False)),
+        "filters": _pack_filters(player),
+        "message": [message.channel.id, message.id] if message is not None else None
+    }
+
+class SessionStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._written = {}
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="player-sessions")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    async def save(self, snapshots: dict):
+        # snapshots: guild_id -> stato; le gilde assenti non hanno piu' un player
+        rows = []
+        for guild_id, data in snapshots.items():
+            encoded = json.dumps(data, separators=(",", ":"))
+            if self._written.get(guild_id) != encoded:
+                rows.append((guild_id, encoded))
+        gone = [guild_id for guild_id in self._written if guild_id not in snapshots]
+        if not rows and not gone:
+            return
+        await self.run(self._write, rows, gone, time.time())
+        for guild_id, encoded in rows:
+            self._written[guild_id] = encoded
+        for guild_id in gone:
+            self._written.pop(guild_id, None)
+
+    async def forget(self, guild_id: int):
+        self._written.pop(guild_id, None)
+        await self.run(self._write, [], [guild_id], time.time())
+
+    async def load(self, max_age: float = PLAYER_SESSION_MAX_AGE, owns=None) -> dict:
+        # owns(guild_id): con piu' processi ognuno riprende solo le gilde dei suoi shard
+        sessions = {}
+        for guild_id, encoded in await self.run(self._read, time.time() - max_age):
+            if owns is not None and not owns(guild_id):
+                continue
+            try:
+                sessions[guild_id] = json.loads(encoded)
+            except ValueError:
+                continue
+            self._written[guild_id] = encoded
+        return sessions
+
+    def _write(self, rows, gone, now):
+        try:
+            with self._conn:
+                self._conn.execute("BEGIN")
+                self._conn.executemany(
+                    "INSERT OR REPLACE INTO sessions (guild_id, data, saved_at) VALUES (?, ?, ?)",
+                    [(guild_id, data, now) for guild_id, data in rows]
+                )
+                self._conn.executemany("DELETE FROM sessions WHERE guild_id = ?", [(g,) for g in gone])
+        except sqlite3.Error as e:
+            print(f"Errore nel salvataggio delle sessioni dei player: {e}")
+
+    def _read(self, oldest):
+        self._conn.execute("DELETE FROM sessions WHERE saved_at < ?", (oldest,))
+        return self._conn.execute("SELECT guild_id, data FROM sessions").fetchall()
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_session_store() -> SessionStore:
+    # creato da init_session_store in un thread: vedi playlist_manager.get_store
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = SessionStore(PLAYER_SESSIONS_DB)
+    return _store
+
+async def init_session_store() -> SessionStore:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, get_session_store)
+
+async def snapshot_loop(collect_players, is_closed, interval: float = PLAYER_SNAPSHOT_INTERVAL):
+    store = get_session_store()
+    while True:
+        await asyncio.sleep(interval)
+        if is_closed():
+            # in chiusura i player vengono disconnessi: lo snapshot resta quello di prima
+            continue
+        snapshots = {}
+        for player in collect_players():
+            try:
+                data = snapshot_player(player)
+            except Exception as e:
+                print(f"Errore nello snapshot del player della gilda {player.guild.id}: {e}")
+                continue
+            if data is not None:
+                snapshots[player.guild.id] = data
+        await store.save(snapshots)
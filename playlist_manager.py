@@ -1,93 +1,203 @@
-import json
 import os
 import asyncio
-import yt_dlp as youtube_dl
-import wavelink
+import threading
+from extraction import EXTRACT_TIMEOUT, get_extraction_service
+from metrics import PLAYLIST_SAVE_SECONDS, timed
+from track_resolver import iter_resolved, iter_saved_tracks, resolve_all
+from playlist_store import (
+    JsonPlaylistStore,
+    SqlitePlaylistStore,
+    read_json_file,
+    write_json_file
+)
 
 FILE = "playlists.json"
+DB_FILE = os.getenv("PLAYLIST_DB", "playlists.db")
+BACKEND = os.getenv("PLAYLIST_BACKEND", "sqlite").lower()
+FLUSH_INTERVAL = float(os.getenv("PLAYLIST_FLUSH_INTERVAL", "5"))
+BACKFILL_BATCH = int(os.getenv("PLAYLIST_BACKFILL_BATCH", "20"))
+BACKFILL_DELAY = float(os.getenv("PLAYLIST_BACKFILL_DELAY", "1"))
 
-def load_playlists():
-    if not os.path.exists(FILE):
-        return {}
-    with open(FILE, "r") as f:
-        return json.load(f)
-
-def save_playlists(data):
-    with open(FILE, "w") as f:
-        json.dump(data, f, indent=4)
-
-def get_user_playlists(user_id):
-    data = load_playlists()
-    return data.get(str(user_id), [])
-
-def add_track_to_playlist(user_id, playlist_name, track, is_public=False, create_if_missing=False):
-    data = load_playlists()
-    user_key = str(user_id)
-
-    if user_key not in data:
-        data[user_key] = []
-
-    for pl in data[user_key]:
-        if pl["name"].lower() == playlist_name.lower():
-            for song in pl.get("tracks", []):
-                if song.get("url") == track.get("url"):
-                    return "duplicate"
-            pl["tracks"].append(track)
-            pl["is_public"] = is_public
-            save_playlists(data)
-            return "added"
-
-    if create_if_missing:
-        new_playlist = {
-            "name": playlist_name,
-            "owner_id": user_id,
-            "is_public": is_public,
-            "tracks": [track],
-            "loop": False  
-        }
-        data[user_key].append(new_playlist)
-        save_playlists(data)
-        return "created"
-
-    return "not_found"
-
-def get_available_playlists(user_id):
-    data = load_playlists()
-    available = []
-    for owner_id, playlists in data.items():
-        for pl in playlists:
-            if pl.get("is_public", False) or int(pl.get("owner_id", 0)) == user_id:
-                available.append(pl)
-    return available
-
-def get_user_playlists_full(user_id):
-
-    data = load_playlists()
-    return data.get(str(user_id), [])
-
-async def get_playlist_tracks(query: str):
-
-    ydl_opts = {
-        'extract_flat': True,
-        'skip_download': True,
-        'quiet': True,
-    }
-    loop = asyncio.get_event_loop()
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    # init_store la crea in un thread mentre i comandi possono gia' arrivare:
+    # il lock evita due store (e due migrazioni da playlists.json)
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if BACKEND == "json":
+                    store = JsonPlaylistStore(FILE, flush_interval=FLUSH_INTERVAL)
+                else:
+                    store = SqlitePlaylistStore(DB_FILE)
+                    store.migrate_from_json(FILE)
+                _store = store
+    return _store
+
+async def init_store():
+    loop = asyncio.get_running_loop()
+    store = await loop.run_in_executor(None, get_store)
+    await store.start()
+    return store
+
+# playlists.json resta il formato di import/export (vedi main in fondo)
+@timed(PLAYLIST_SAVE_SECONDS, op="export")
+async def export_playlists(path=FILE):
+    store = get_store()
+    data = await store.run(store.export_data)
+    await store.run(write_json_file, path, data)
+    return data
+
+async def import_playlists(path=FILE):
+    store = get_store()
+    data = await store.run(read_json_file, path)
+    await store.run(store.import_data, data)
+    return data
+
+async def get_user_playlists(user_id):
+    store = get_store()
+    return await store.run(store.get_user_playlists, user_id)
+
+async def get_playlist(owner_id, playlist_name):
+    store = get_store()
+    return await store.run(store.get_playlist, owner_id, playlist_name)
+
+async def add_track_to_playlist(user_id, playlist_name, track, is_public=False, create_if_missing=False):
+    store = get_store()
+    return await store.run(store.add_track, user_id, playlist_name, track, is_public, create_if_missing)
+
+async def clear_playlist(owner_id, playlist_name):
+    store = get_store()
+    return await store.run(store.clear_playlist, owner_id, playlist_name)
+
+async def rename_playlist(owner_id, old_name, new_name):
+    store = get_store()
+    return await store.run(store.rename_playlist, owner_id, old_name, new_name)
+
+async def delete_playlist(owner_id, playlist_name):
+    store = get_store()
+    return await store.run(store.delete_playlist, owner_id, playlist_name)
+
+async def remove_track_from_playlist(owner_id, playlist_name, url):
+    store = get_store()
+    return await store.run(store.remove_track, owner_id, playlist_name, url)
+
+async def record_playlist_play(owner_id, playlist_name):
+    store = get_store()
+    return await store.run(store.record_play, owner_id, playlist_name)
+
+async def get_available_playlists(user_id):
+    store = get_store()
+    return await store.run(store.get_available_playlists, user_id)
+
+async def list_user_playlists(user_id, query=None, offset=0, limit=10, sort=None):
+    store = get_store()
+    return await store.run(store.list_user_playlists, user_id, query, offset, limit, sort)
+
+async def list_available_playlists(user_id, query=None, offset=0, limit=10, sort=None):
+    store = get_store()
+    return await store.run(store.list_available_playlists, user_id, query, offset, limit, sort)
+
+async def list_playlist_tracks(owner_id, playlist_name, query=None, offset=0, limit=10):
+    store = get_store()
+    return await store.run(store.list_playlist_tracks, owner_id, playlist_name, query, offset, limit)
+
+def song_from_track(track) -> dict:
+    # formato dei brani salvati: la stringa encoded evita di ricercarli su Lavalink
+    return {"title": track.title, "url": track.uri, "encoded": track.id}
+
+async def set_playlist_encoded(owner_id, playlist_name, encoded):
+    store = get_store()
+    return await store.run(store.set_encoded, owner_id, playlist_name, encoded)
+
+async def iter_playlist_tracks(playlist, **kwargs):
+    # brani di una playlist salvata, nell'ordine; quelli cercati vengono salvati con la loro stringa
+    songs = [song for song in playlist.get("tracks", []) if song.get("url")]
+    learned = {}
     try:
-        with youtube_dl.YoutubeDL(ydl_opts) as ydl:
-            info = await loop.run_in_executor(None, lambda: ydl.extract_info(query, download=False))
+        async for item in iter_saved_tracks(songs, learned=learned, **kwargs):
+            yield item
+    finally:
+        if learned:
+            await set_playlist_encoded(playlist["owner_id"], playlist["name"], learned)
+
+async def backfill_encoded_tracks(batch: int = BACKFILL_BATCH, delay: float = BACKFILL_DELAY):
+    # job in background per i brani salvati prima che si memorizzasse la stringa encoded
+    store = get_store()
+    missing = await store.run(store.list_missing_encoded)
+    if not missing:
+        return 0
+    print(f"🔧 Salvataggio della traccia codificata per {len(missing)} brani delle playlist…")
+    saved = 0
+    for start in range(0, len(missing), batch):
+        chunk = missing[start:start + batch]
+        updates = {}
+        async for index, url, track, error in iter_resolved([url for _, _, url in chunk]):
+            if track is not None:
+                owner_id, name, _ = chunk[index]
+                updates.setdefault((owner_id, name), {})[url] = track.id
+        for (owner_id, name), encoded in updates.items():
+            saved += await store.run(store.set_encoded, owner_id, name, encoded)
+        await asyncio.sleep(delay)
+    print(f"✅ Traccia codificata salvata per {saved}/{len(missing)} brani.")
+    return saved
+
+async def extract_playlist_entries(query: str, guild_id=None, timeout: float = EXTRACT_TIMEOUT):
+    try:
+        info = await get_extraction_service().extract(query, guild_id, timeout=timeout)
+    except asyncio.TimeoutError:
+        print("Errore nell'estrazione della playlist: tempo scaduto")
+        return None
     except Exception as e:
         print(f"Errore nell'estrazione della playlist: {e}")
         return None
 
     if info.get('_type') == 'playlist':
-        entries = info.get('entries', [])
-        tracks = []
-        for entry in entries:
-            video_url = f"https://www.youtube.com/watch?v={entry['id']}"
-            track = await wavelink.YouTubeTrack.search(video_url, return_first=True)
-            if track:
-                tracks.append(track)
-        return tracks
+        return [
+            f"https://www.youtube.com/watch?v={entry['id']}"
+            for entry in info.get('entries', [])
+            if entry and entry.get('id')
+        ]
     else:
         return None
+
+async def get_playlist_tracks(query: str, guild_id=None):
+    urls = await extract_playlist_entries(query, guild_id)
+    if urls is None:
+        return None
+    report = await resolve_all(urls)
+    if report.failed:
+        print(f"⚠️ {len(report.failed)}/{report.total} brani della playlist non risolti.")
+    return report.tracks
+
+##############################################
+# IMPORT/EXPORT DA RIGA DI COMANDO
+##############################################
+# python playlist_manager.py export backup.json  -> tutte le playlist in JSON
+# python playlist_manager.py import backup.json  -> con SQLite aggiunge le
+# playlist del file (quelle gia' presenti con lo stesso nome restano
+# invariate); con PLAYLIST_BACKEND=json il file le sostituisce tutte
+
+async def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Import/export delle playlist in formato JSON")
+    parser.add_argument("action", choices=("export", "import"))
+    parser.add_argument("path", help="file JSON nel formato di playlists.json")
+    args = parser.parse_args(argv)
+
+    store = await init_store()
+    try:
+        if args.action == "export":
+            data = await export_playlists(args.path)
+        else:
+            data = await import_playlists(args.path)
+    finally:
+        store.close()
+    count = sum(len(playlists) for playlists in data.values())
+    verb = "esportate in" if args.action == "export" else "importate da"
+    print(f"✅ {count} playlist {verb} {args.path}")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,780 @@
+import asyncio
+import json
+import os
+import sqlite3
+import time
+from abc import ABC, abstractmethod
+from concurrent.futures import ThreadPoolExecutor
+from metrics import PLAYLIST_SAVE_SECONDS, PLAYLIST_STORE_SECONDS
+
+##############################################
+# BACKEND DI SALVATAGGIO DELLE PLAYLIST
+##############################################
+# Tutte le operazioni sono sincrone e vengono eseguite su un unico thread
+# dedicato (run), cosi' l'I/O su disco non blocca mai l'event loop. I metodi
+# astratti vanno implementati da ogni backend: se ne manca uno lo store non
+# si puo' nemmeno creare.
+
+class PlaylistStore(ABC):
+    backend = None
+
+    def __init__(self):
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="playlist-store")
+
+    async def run(self, func, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        with PLAYLIST_STORE_SECONDS.time(backend=self.backend, op=getattr(func, "__name__", "call")):
+            return await loop.run_in_executor(self._executor, lambda: func(*args, **kwargs))
+
+    async def start(self):
+        pass
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+
+    @abstractmethod
+    def get_user_playlists(self, user_id):
+        ...
+
+    @abstractmethod
+    def get_playlist(self, owner_id, name):
+        ...
+
+    @abstractmethod
+    def get_available_playlists(self, user_id):
+        ...
+
+    # Letture paginate: restituiscono (elementi della pagina, totale).
+    # sort: None (ordine di creazione), "name", "recent" o "popular".
+    @abstractmethod
+    def list_user_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        ...
+
+    @abstractmethod
+    def list_available_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        ...
+
+    @abstractmethod
+    def list_playlist_tracks(self, owner_id, name, query=None, offset=0, limit=10):
+        ...
+
+    @abstractmethod
+    def add_track(self, user_id, playlist_name, track, is_public=False, create_if_missing=False):
+        ...
+
+    @abstractmethod
+    def clear_playlist(self, owner_id, name):
+        ...
+
+    @abstractmethod
+    def rename_playlist(self, owner_id, old_name, new_name):
+        ...
+
+    @abstractmethod
+    def delete_playlist(self, owner_id, name):
+        ...
+
+    @abstractmethod
+    def remove_track(self, owner_id, name, url):
+        ...
+
+    # Restituisce il nuovo play_count, o None se la playlist non esiste.
+    @abstractmethod
+    def record_play(self, owner_id, name):
+        ...
+
+    # Stringhe "encoded" di Lavalink salvate accanto all'url dei brani:
+    # missing elenca (owner_id, nome playlist, url) dei brani che ne sono privi,
+    # set_encoded le salva per una playlist ({url: encoded}).
+    @abstractmethod
+    def list_missing_encoded(self):
+        ...
+
+    @abstractmethod
+    def set_encoded(self, owner_id, name, encoded):
+        ...
+
+    @abstractmethod
+    def import_data(self, data):
+        ...
+
+    @abstractmethod
+    def export_data(self):
+        ...
+
+
+def read_json_file(path):
+    if not os.path.exists(path):
+        return {}
+    with open(path, "r") as f:
+        return json.load(f)
+
+def write_json_file(path, data):
+    with open(path, "w") as f:
+        json.dump(data, f, indent=4)
+
+def _summary(pl):
+    return {
+        "name": pl["name"],
+        "owner_id": pl.get("owner_id"),
+        "is_public": pl.get("is_public", False),
+        "loop": pl.get("loop", False),
+        "track_count": len(pl.get("tracks", [])),
+        "play_count": pl.get("play_count", 0),
+        "updated_at": pl.get("updated_at", 0)
+    }
+
+SORT_KEYS = {
+    "name": lambda pl: pl["name"].lower(),
+    "recent": lambda pl: -pl.get("updated_at", 0),
+    "popular": lambda pl: -pl.get("play_count", 0)
+}
+
+def _sorted(playlists, sort):
+    # sort stabile: a parita' resta l'ordine di creazione
+    if sort is None:
+        return playlists
+    return sorted(playlists, key=SORT_KEYS[sort])
+
+def _matches(text, query):
+    return not query or query.lower() in (text or "").lower()
+
+def _find(playlists, name):
+    key = name.lower()
+    for pl in playlists:
+        if pl["name"].lower() == key:
+            return pl
+    return None
+
+##############################################
+# BACKEND JSON (formato storico di playlists.json)
+##############################################
+# I dati restano in memoria; ogni modifica viene scritta subito nel journal
+# (append-only) e il file completo viene riscritto solo dal flush periodico,
+# in modo atomico (file temporaneo + rename). All'avvio il journal viene
+# riapplicato, quindi un crash tra due flush non perde modifiche.
+# Le playlist pubbliche sono tenute anche in un indice separato, aggiornato
+# a ogni modifica, cosi' elencarle non richiede di scorrere tutti gli utenti.
+
+def _copy_playlist(pl):
+    copy = dict(pl)
+    copy["tracks"] = list(pl.get("tracks", []))
+    return copy
+
+class JsonPlaylistStore(PlaylistStore):
+    backend = "json"
+
+    def __init__(self, path, flush_interval=5.0):
+        super().__init__()
+        self.path = path
+        self.journal_path = path + ".journal"
+        self.flush_interval = flush_interval
+        self.dirty_users = set()
+        self._flush_task = None
+        self._data = read_json_file(path)
+        self._public = {}
+        self._now = time.time()
+        self._rebuild_index()
+        replayed = self._replay_journal()
+        self._journal = open(self.journal_path, "a", encoding="utf-8")
+        if replayed:
+            print(f"♻️ Riapplicate {replayed} modifiche dal journal delle playlist.")
+            self.flush()
+
+    async def start(self):
+        if self._flush_task is None:
+            self._flush_task = asyncio.create_task(self._flush_loop())
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            if self.dirty_users:
+                try:
+                    await self.run(self.flush)
+                except Exception as e:
+                    print(f"Errore nel salvataggio delle playlist: {e}")
+
+    def close(self):
+        if self._flush_task is not None:
+            self._flush_task.cancel()
+            self._flush_task = None
+        self._executor.submit(self.flush).result()
+        self._journal.close()
+        super().close()
+
+    def flush(self):
+        if not self.dirty_users and os.path.exists(self.path):
+            return False
+        tmp_path = self.path + ".tmp"
+        with PLAYLIST_SAVE_SECONDS.time(op="flush"):
+            with open(tmp_path, "w") as f:
+                json.dump(self._data, f, indent=4)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp_path, self.path)
+        self._journal.seek(0)
+        self._journal.truncate()
+        self.dirty_users.clear()
+        return True
+
+    def _replay_journal(self):
+        if not os.path.exists(self.journal_path):
+            return 0
+        count = 0
+        with open(self.journal_path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # riga troncata da un crash durante la scrittura
+                    break
+                self._now = entry.get("ts", self._now)
+                getattr(self, "_op_" + entry["op"])(*entry["args"])
+                self.dirty_users.add(str(entry["args"][0]))
+                count += 1
+        return count
+
+    def _apply(self, op, *args):
+        # l'orario viene salvato nel journal, cosi' il replay da' lo stesso updated_at
+        self._now = time.time()
+        result = getattr(self, "_op_" + op)(*args)
+        if result not in (False, None, "duplicate", "not_found", "exists"):
+            with PLAYLIST_SAVE_SECONDS.time(op="journal"):
+                self._journal.write(json.dumps({"op": op, "args": args, "ts": self._now}) + "\n")
+                self._journal.flush()
+                os.fsync(self._journal.fileno())
+            self.dirty_users.add(str(args[0]))
+        return result
+
+    def _rebuild_index(self):
+        self._public = {}
+        for owner_key, playlists in self._data.items():
+            for pl in playlists:
+                self._index(owner_key, pl)
+
+    def _index(self, owner_key, pl):
+        key = (owner_key, pl["name"].lower())
+        if pl.get("is_public", False):
+            self._public.setdefault(key, pl)
+        else:
+            self._public.pop(key, None)
+
+    def _unindex(self, owner_key, name):
+        self._public.pop((owner_key, name.lower()), None)
+
+    def _available(self, user_id):
+        # pubbliche (dall'indice) + private dell'utente
+        own = [pl for pl in self._data.get(str(user_id), []) if not pl.get("is_public", False)]
+        return list(self._public.values()) + own
+
+    def get_user_playlists(self, user_id):
+        return [_copy_playlist(pl) for pl in self._data.get(str(user_id), [])]
+
+    def get_playlist(self, owner_id, name):
+        pl = _find(self._data.get(str(owner_id), []), name)
+        return _copy_playlist(pl) if pl is not None else None
+
+    def get_available_playlists(self, user_id):
+        return [_copy_playlist(pl) for pl in self._available(user_id)]
+
+    def list_user_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        found = [pl for pl in self._data.get(str(user_id), []) if _matches(pl["name"], query)]
+        found = _sorted(found, sort)
+        return [_summary(pl) for pl in found[offset:offset + limit]], len(found)
+
+    def list_available_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        found = [pl for pl in self._available(user_id) if _matches(pl["name"], query)]
+        found = _sorted(found, sort)
+        return [_summary(pl) for pl in found[offset:offset + limit]], len(found)
+
+    def list_playlist_tracks(self, owner_id, name, query=None, offset=0, limit=10):
+        pl = _find(self._data.get(str(owner_id), []), name)
+        if pl is None:
+            return [], 0
+        found = [
+            dict(song, index=index)
+            for index, song in enumerate(pl.get("tracks", []))
+            if _matches(song.get("title"), query)
+        ]
+        return found[offset:offset + limit], len(found)
+
+    def add_track(self, user_id, playlist_name, track, is_public=False, create_if_missing=False):
+        return self._apply("add_track", user_id, playlist_name, track, is_public, create_if_missing)
+
+    def clear_playlist(self, owner_id, name):
+        return self._apply("clear_playlist", owner_id, name)
+
+    def rename_playlist(self, owner_id, old_name, new_name):
+        return self._apply("rename_playlist", owner_id, old_name, new_name)
+
+    def delete_playlist(self, owner_id, name):
+        return self._apply("delete_playlist", owner_id, name)
+
+    def remove_track(self, owner_id, name, url):
+        return self._apply("remove_track", owner_id, name, url)
+
+    def record_play(self, owner_id, name):
+        return self._apply("record_play", owner_id, name)
+
+    def list_missing_encoded(self):
+        return [
+            (pl.get("owner_id", owner_key), pl["name"], song["url"])
+            for owner_key, playlists in self._data.items()
+            for pl in playlists
+            for song in pl.get("tracks", [])
+            if song.get("url") and not song.get("encoded")
+        ]
+
+    def set_encoded(self, owner_id, name, encoded):
+        return self._apply("set_encoded", owner_id, name, encoded)
+
+    def import_data(self, data):
+        self._data = data
+        self._rebuild_index()
+        self.dirty_users.update(data.keys())
+        self.flush()
+
+    def export_data(self):
+        return {key: [_copy_playlist(pl) for pl in playlists] for key, playlists in self._data.items()}
+
+    def _op_add_track(self, user_id, playlist_name, track, is_public, create_if_missing):
+        owner_key = str(user_id)
+        user_playlists = self._data.setdefault(owner_key, [])
+
+        pl = _find(user_playlists, playlist_name)
+        if pl is not None:
+            for song in pl.get("tracks", []):
+                if song.get("url") == track.get("url"):
+                    return "duplicate"
+            pl.setdefault("tracks", []).append(track)
+            pl["is_public"] = is_public
+            pl["updated_at"] = self._now
+            self._index(owner_key, pl)
+            return "added"
+
+        if create_if_missing:
+            pl = {
+                "name": playlist_name,
+                "owner_id": user_id,
+                "is_public": is_public,
+                "tracks": [track],
+                "loop": False,
+                "play_count": 0,
+                "updated_at": self._now
+            }
+            user_playlists.append(pl)
+            self._index(owner_key, pl)
+            return "created"
+
+        return "not_found"
+
+    def _op_clear_playlist(self, owner_id, name):
+        pl = _find(self._data.get(str(owner_id), []), name)
+        if pl is None:
+            return False
+        pl["tracks"] = []
+        pl["updated_at"] = self._now
+        return True
+
+    def _op_rename_playlist(self, owner_id, old_name, new_name):
+        user_playlists = self._data.get(str(owner_id), [])
+        pl = _find(user_playlists, old_name)
+        if pl is None:
+            return "not_found"
+        other = _find(user_playlists, new_name)
+        if other is not None and other is not pl:
+            return "exists"
+        self._unindex(str(owner_id), pl["name"])
+        pl["name"] = new_name
+        pl["updated_at"] = self._now
+        self._index(str(owner_id), pl)
+        return "renamed"
+
+    def _op_delete_playlist(self, owner_id, name):
+        owner_key = str(owner_id)
+        user_playlists = self._data.get(owner_key, [])
+        remaining = [pl for pl in user_playlists if pl["name"].lower() != name.lower()]
+        if len(remaining) == len(user_playlists):
+            return False
+        self._data[owner_key] = remaining
+        self._unindex(owner_key, name)
+        return True
+
+    def _op_remove_track(self, owner_id, name, url):
+        pl = _find(self._data.get(str(owner_id), []), name)
+        if pl is None:
+            return None
+        for index, song in enumerate(pl.get("tracks", [])):
+            if song.get("url") == url:
+                pl["updated_at"] = self._now
+                return pl["tracks"].pop(index)
+        return None
+
+    def _op_record_play(self, owner_id, name):
+        pl = _find(self._data.get(str(owner_id), []), name)
+        if pl is None:
+            return None
+        pl["play_count"] = pl.get("play_count", 0) + 1
+        return pl["play_count"]
+
+    def _op_set_encoded(self, owner_id, name, encoded):
+        # non cambia updated_at: non e' una modifica dell'utente
+        pl = _find(self._data.get(str(owner_id), []), name)
+        if pl is None:
+            return 0
+        updated = 0
+        for song in pl.get("tracks", []):
+            value = encoded.get(song.get("url"))
+            if value and song.get("encoded") != value:
+                song["encoded"] = value
+                updated += 1
+        return updated
+
+##############################################
+# BACKEND SQLITE (indicizzato, aggiornamenti per singola riga)
+##############################################
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS playlists (
+    id INTEGER PRIMARY KEY,
+    owner_id INTEGER NOT NULL,
+    name TEXT NOT NULL,
+    name_key TEXT NOT NULL,
+    is_public INTEGER NOT NULL DEFAULT 0,
+    loop INTEGER NOT NULL DEFAULT 0,
+    play_count INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL NOT NULL DEFAULT 0,
+    UNIQUE (owner_id, name_key)
+);
+CREATE TABLE IF NOT EXISTS tracks (
+    id INTEGER PRIMARY KEY,
+    playlist_id INTEGER NOT NULL REFERENCES playlists (id) ON DELETE CASCADE,
+    position INTEGER NOT NULL,
+    title TEXT,
+    url TEXT NOT NULL,
+    encoded TEXT,
+    UNIQUE (playlist_id, url)
+);
+CREATE INDEX IF NOT EXISTS idx_tracks_playlist ON tracks (playlist_id, position);
+"""
+
+# Indici creati dopo le eventuali migrazioni delle colonne
+INDEXES = """
+CREATE INDEX IF NOT EXISTS idx_playlists_public ON playlists (is_public);
+CREATE INDEX IF NOT EXISTS idx_playlists_public_recent ON playlists (is_public, updated_at DESC);
+CREATE INDEX IF NOT EXISTS idx_playlists_public_popular ON playlists (is_public, play_count DESC);
+"""
+
+SQL_ORDER = {
+    None: "id",
+    "name": "name_key, id",
+    "recent": "updated_at DESC, id",
+    "popular": "play_count DESC, id"
+}
+
+class SqlitePlaylistStore(PlaylistStore):
+    backend = "sqlite"
+
+    def __init__(self, path):
+        super().__init__()
+        self.path = path
+        # La connessione viene usata solo dal thread dello store.
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA foreign_keys=ON")
+        self._conn.executescript(SCHEMA)
+        self._migrate_columns()
+        self._conn.executescript(INDEXES)
+
+    def _migrate_columns(self):
+        # database creati prima di play_count/updated_at/encoded
+        self._add_column("playlists", "play_count", "INTEGER NOT NULL DEFAULT 0")
+        self._add_column("playlists", "updated_at", "REAL NOT NULL DEFAULT 0")
+        self._add_column("tracks", "encoded", "TEXT")
+
+    def _add_column(self, table, column, definition):
+        columns = {row["name"] for row in self._conn.execute(f"PRAGMA table_info({table})")}
+        if column in columns:
+            return
+        try:
+            self._conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {definition}")
+        except sqlite3.OperationalError as e:
+            # con piu' processi (launcher.py) un altro puo' averla appena aggiunta
+            if "duplicate column" not in str(e):
+                raise
+
+    def close(self):
+        super().close()
+        self._conn.close()
+
+    def _transaction(self):
+        return _Transaction(self._conn)
+
+    def _playlist_row(self, owner_id, name):
+        return self._conn.execute(
+            "SELECT * FROM playlists WHERE owner_id = ? AND name_key = ?",
+            (int(owner_id), name.lower())
+        ).fetchone()
+
+    def _build_playlists(self, rows):
+        if not rows:
+            return []
+        ids = [row["id"] for row in rows]
+        tracks = {pid: [] for pid in ids}
+        placeholders = ",".join("?" * len(ids))
+        for t in self._conn.execute(
+            f"SELECT playlist_id, title, url, encoded FROM tracks WHERE playlist_id IN ({placeholders}) "
+            "ORDER BY playlist_id, position",
+            ids
+        ):
+            tracks[t["playlist_id"]].append(_song(t))
+        return [
+            {
+                "name": row["name"],
+                "owner_id": row["owner_id"],
+                "is_public": bool(row["is_public"]),
+                "tracks": tracks[row["id"]],
+                "loop": bool(row["loop"]),
+                "play_count": row["play_count"],
+                "updated_at": row["updated_at"]
+            }
+            for row in rows
+        ]
+
+    def get_user_playlists(self, user_id):
+        rows = self._conn.execute(
+            "SELECT * FROM playlists WHERE owner_id = ? ORDER BY id", (int(user_id),)
+        ).fetchall()
+        return self._build_playlists(rows)
+
+    def get_playlist(self, owner_id, name):
+        row = self._playlist_row(owner_id, name)
+        if row is None:
+            return None
+        return self._build_playlists([row])[0]
+
+    def get_available_playlists(self, user_id):
+        rows = self._conn.execute(
+            "SELECT * FROM playlists WHERE is_public = 1 OR owner_id = ? ORDER BY id", (int(user_id),)
+        ).fetchall()
+        return self._build_playlists(rows)
+
+    def _page(self, where, params, query, offset, limit, sort=None):
+        if query:
+            where += " AND name_key LIKE ? ESCAPE '\\'"
+            params = params + (_like_pattern(query),)
+        total = self._conn.execute(f"SELECT COUNT(*) FROM playlists WHERE {where}", params).fetchone()[0]
+        rows = self._conn.execute(
+            "SELECT p.*, (SELECT COUNT(*) FROM tracks t WHERE t.playlist_id = p.id) AS track_count "
+            f"FROM playlists p WHERE {where} ORDER BY {SQL_ORDER[sort]} LIMIT ? OFFSET ?",
+            params + (limit, offset)
+        ).fetchall()
+        return [
+            {
+                "name": row["name"],
+                "owner_id": row["owner_id"],
+                "is_public": bool(row["is_public"]),
+                "loop": bool(row["loop"]),
+                "track_count": row["track_count"],
+                "play_count": row["play_count"],
+                "updated_at": row["updated_at"]
+            }
+            for row in rows
+        ], total
+
+    def list_user_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        return self._page("owner_id = ?", (int(user_id),), query, offset, limit, sort)
+
+    def list_available_playlists(self, user_id, query=None, offset=0, limit=10, sort=None):
+        return self._page("(is_public = 1 OR owner_id = ?)", (int(user_id),), query, offset, limit, sort)
+
+    def list_playlist_tracks(self, owner_id, name, query=None, offset=0, limit=10):
+        row = self._playlist_row(owner_id, name)
+        if row is None:
+            return [], 0
+        # l'indice e' la posizione ordinale nella playlist completa
+        where = "playlist_id = ?"
+        params = (row["id"],)
+        if query:
+            where += " AND title LIKE ? ESCAPE '\\'"
+            params += (_like_pattern(query),)
+        total = self._conn.execute(f"SELECT COUNT(*) FROM tracks WHERE {where}", params).fetchone()[0]
+        songs = self._conn.execute(
+            "SELECT title, url, (SELECT COUNT(*) FROM tracks o WHERE o.playlist_id = t.playlist_id "
+            "AND o.position < t.position) AS idx "
+            f"FROM tracks t WHERE {where} ORDER BY position LIMIT ? OFFSET ?",
+            params + (limit, offset)
+        ).fetchall()
+        return [{"title": t["title"], "url": t["url"], "index": t["idx"]} for t in songs], total
+
+    def add_track(self, user_id, playlist_name, track, is_public=False, create_if_missing=False):
+        with self._transaction():
+            row = self._playlist_row(user_id, playlist_name)
+            if row is None:
+                if not create_if_missing:
+                    return "not_found"
+                cur = self._conn.execute(
+                    "INSERT INTO playlists (owner_id, name, name_key, is_public, updated_at) VALUES (?, ?, ?, ?, ?)",
+                    (int(user_id), playlist_name, playlist_name.lower(), int(is_public), time.time())
+                )
+                self._insert_track(cur.lastrowid, track)
+                return "created"
+
+            cur = self._insert_track(row["id"], track)
+            if cur.rowcount == 0:
+                return "duplicate"
+            self._conn.execute(
+                "UPDATE playlists SET is_public = ?, updated_at = ? WHERE id = ?",
+                (int(is_public), time.time(), row["id"])
+            )
+            return "added"
+
+    def _insert_track(self, playlist_id, track):
+        return self._conn.execute(
+            "INSERT OR IGNORE INTO tracks (playlist_id, position, title, url, encoded) "
+            "SELECT ?, COALESCE(MAX(position), -1) + 1, ?, ?, ? FROM tracks WHERE playlist_id = ?",
+            (playlist_id, track.get("title"), track.get("url"), track.get("encoded"), playlist_id)
+        )
+
+    def clear_playlist(self, owner_id, name):
+        with self._transaction():
+            row = self._playlist_row(owner_id, name)
+            if row is None:
+                return False
+            self._conn.execute("DELETE FROM tracks WHERE playlist_id = ?", (row["id"],))
+            self._touch(row["id"])
+            return True
+
+    def rename_playlist(self, owner_id, old_name, new_name):
+        with self._transaction():
+            row = self._playlist_row(owner_id, old_name)
+            if row is None:
+                return "not_found"
+            other = self._playlist_row(owner_id, new_name)
+            if other is not None and other["id"] != row["id"]:
+                return "exists"
+            self._conn.execute(
+                "UPDATE playlists SET name = ?, name_key = ?, updated_at = ? WHERE id = ?",
+                (new_name, new_name.lower(), time.time(), row["id"])
+            )
+            return "renamed"
+
+    def delete_playlist(self, owner_id, name):
+        cur = self._conn.execute(
+            "DELETE FROM playlists WHERE owner_id = ? AND name_key = ?", (int(owner_id), name.lower())
+        )
+        return cur.rowcount > 0
+
+    def remove_track(self, owner_id, name, url):
+        with self._transaction():
+            row = self._playlist_row(owner_id, name)
+            if row is None:
+                return None
+            song = self._conn.execute(
+                "SELECT id, title, url FROM tracks WHERE playlist_id = ? AND url = ?", (row["id"], url)
+            ).fetchone()
+            if song is None:
+                return None
+            self._conn.execute("DELETE FROM tracks WHERE id = ?", (song["id"],))
+            self._touch(row["id"])
+            return {"title": song["title"], "url": song["url"]}
+
+    def _touch(self, playlist_id):
+        self._conn.execute("UPDATE playlists SET updated_at = ? WHERE id = ?", (time.time(), playlist_id))
+
+    def record_play(self, owner_id, name):
+        with self._transaction():
+            row = self._playlist_row(owner_id, name)
+            if row is None:
+                return None
+            self._conn.execute("UPDATE playlists SET play_count = play_count + 1 WHERE id = ?", (row["id"],))
+            return row["play_count"] + 1
+
+    def list_missing_encoded(self):
+        return [
+            (row["owner_id"], row["name"], row["url"])
+            for row in self._conn.execute(
+                "SELECT p.owner_id, p.name, t.url FROM tracks t JOIN playlists p ON p.id = t.playlist_id "
+                "WHERE t.encoded IS NULL ORDER BY t.id"
+            )
+        ]
+
+    def set_encoded(self, owner_id, name, encoded):
+        with self._transaction():
+            row = self._playlist_row(owner_id, name)
+            if row is None:
+                return 0
+            cur = self._conn.executemany(
+                "UPDATE tracks SET encoded = ? WHERE playlist_id = ? AND url = ?",
+                [(value, row["id"], url) for url, value in encoded.items() if value]
+            )
+            return cur.rowcount
+
+    def import_data(self, data):
+        with self._transaction():
+            for user_key, playlists in data.items():
+                for pl in playlists:
+                    owner_id = int(pl.get("owner_id", user_key))
+                    name = pl["name"]
+                    cur = self._conn.execute(
+                        "INSERT OR IGNORE INTO playlists (owner_id, name, name_key, is_public, loop, play_count, updated_at) "
+                        "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                        (owner_id, name, name.lower(), int(pl.get("is_public", False)), int(pl.get("loop", False)),
+                         int(pl.get("play_count", 0)), float(pl.get("updated_at", 0)))
+                    )
+                    if cur.rowcount == 0:
+                        continue
+                    for position, song in enumerate(pl.get("tracks", [])):
+                        self._conn.execute(
+                            "INSERT OR IGNORE INTO tracks (playlist_id, position, title, url, encoded) VALUES (?, ?, ?, ?, ?)",
+                            (cur.lastrowid, position, song.get("title"), song.get("url"), song.get("encoded"))
+                        )
+
+    def export_data(self):
+        rows = self._conn.execute("SELECT * FROM playlists ORDER BY id").fetchall()
+        data = {}
+        for pl in self._build_playlists(rows):
+            data.setdefault(str(pl["owner_id"]), []).append(pl)
+        return data
+
+    def migrate_from_json(self, json_path):
+        # Al primo avvio importa il vecchio playlists.json una sola volta.
+        done = self._conn.execute("SELECT value FROM meta WHERE key = 'json_imported'").fetchone()
+        if done is not None:
+            return False
+        data = read_json_file(json_path)
+        if data:
+            self.import_data(data)
+            print(f"📦 Importate le playlist da {json_path} nel database {self.path}.")
+        self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES ('json_imported', '1')")
+        return True
+
+
+def _song(row):
+    song = {"title": row["title"], "url": row["url"]}
+    if row["encoded"]:
+        song["encoded"] = row["encoded"]
+    return song
+
+def _like_pattern(query):
+    escaped = query.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+class _Transaction:
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+        return False
@@ -75,13 +75,17 @@ def main():
             else:
                 print("ℹ️ Salto aggiornamento e avvio diretto di bot.py.\n")
 
-    print("▶️ Avvio di bot.py...\n")
+    # con SHARD_WORKERS > 1 gli shard vengono divisi su piu' processi da launcher.py
+    workers = os.getenv("SHARD_WORKERS") or leggi_env_iniziale("SHARD_WORKERS") or "1"
+    script = "launcher.py" if int(workers) > 1 else "bot.py"
+
+    print(f"▶️ Avvio di {script}...\n")
     try:
-        subprocess.run([sys.executable, "bot.py"])
+        subprocess.run([sys.executable, script])
     except FileNotFoundError:
-        print("❌ Errore: non ho trovato il file bot.py nella cartella corrente.")
+        print(f"❌ Errore: non ho trovato il file {script} nella cartella corrente.")
     except Exception as e:
-        print(f"❌ Errore durante l’avvio di bot.py: {e}")
+        print(f"❌ Errore durante l’avvio di {script}: {e}")
 
 if __name__ == "__main__":
     main()
@@ -0,0 +1,51 @@
+import os
+
+##############################################
+# SHARD DEL GATEWAY DI DISCORD
+##############################################
+# SHARD_COUNT = numero totale di shard, SHARD_IDS = shard gestiti da questo
+# processo ("0,1,2" oppure intervalli "0-3"). Senza SHARD_COUNT il bot resta
+# una singola connessione non shardata. Il launcher (launcher.py) divide gli
+# shard tra piu' processi impostando queste variabili per ciascuno.
+
+def parse_shard_ids(raw: str) -> list[int] | None:
+    raw = (raw or "").strip()
+    if not raw:
+        return None
+    ids = []
+    for part in raw.split(","):
+        part = part.strip()
+        if "-" in part:
+            start, end = part.split("-", 1)
+            ids.extend(range(int(start), int(end) + 1))
+        elif part:
+            ids.append(int(part))
+    return sorted(set(ids))
+
+def format_shard_ids(ids) -> str:
+    return ",".join(str(i) for i in ids)
+
+SHARD_COUNT = int(os.getenv("SHARD_COUNT", "0")) or None
+SHARD_IDS = parse_shard_ids(os.getenv("SHARD_IDS", ""))
+
+def shard_for(guild_id: int, shard_count: int) -> int:
+    # stessa formula di Discord
+    return (guild_id >> 22) % shard_count
+
+def owns_guild(guild_id: int, shard_count: int | None = SHARD_COUNT, shard_ids=SHARD_IDS) -> bool:
+    # ogni gilda (e quindi il suo player) appartiene a un solo processo
+    if not shard_count or shard_ids is None:
+        return True
+    return shard_for(guild_id, shard_count) in shard_ids
+
+def shard_ranges(shard_count: int, workers: int) -> list[list[int]]:
+    # intervalli contigui e il piu' possibile uguali, uno per processo
+    workers = max(1, min(workers, shard_count))
+    return [
+        list(range(i * shard_count // workers, (i + 1) * shard_count // workers))
+        for i in range(workers)
+    ]
+
+def is_primary() -> bool:
+    # un solo processo sincronizza i comandi slash: quello con lo shard 0
+    return SHARD_IDS is None or 0 in SHARD_IDS
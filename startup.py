@@ -0,0 +1,93 @@
+import asyncio
+import hashlib
+import json
+import os
+import time
+from contextlib import contextmanager
+
+COMMAND_SYNC_FILE = os.getenv("COMMAND_SYNC_FILE", "command_tree.json")
+FORCE_COMMAND_SYNC = os.getenv("FORCE_COMMAND_SYNC", "0") == "1"
+
+##############################################
+# TEMPI DI AVVIO
+##############################################
+# Importato per primo da bot.py. mark() chiude una tappa in sequenza (import,
+# login, gateway) misurandola dalla tappa precedente; phase() misura un passo
+# che puo' girare in parallelo agli altri (store, cache, nodi, comandi). Il
+# riepilogo viene stampato una volta sola, quando il bot e' pronto.
+
+class StartupTimer:
+    def __init__(self):
+        self.started = time.perf_counter()
+        self._last = self.started
+        self.phases = []
+        self.reported = False
+
+    def elapsed(self) -> float:
+        return time.perf_counter() - self.started
+
+    def mark(self, name: str):
+        now = time.perf_counter()
+        self.phases.append((name, now - self._last, now - self.started))
+        self._last = now
+
+    @contextmanager
+    def phase(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            self.phases.append((name, end - start, end - self.started))
+
+    def report(self):
+        if self.reported:
+            return
+        self.reported = True
+        width = max((len(name) for name, _, _ in self.phases), default=0)
+        lines = [
+            f"   {name.ljust(width)}  {seconds:7.3f}s  (a {at:.2f}s)"
+            for name, seconds, at in sorted(self.phases, key=lambda p: p[2])
+        ]
+        print(f"⏱️ Avvio completato in {self.elapsed():.2f}s:\n" + "\n".join(lines))
+
+startup_timer = StartupTimer()
+
+##############################################
+# SINCRONIZZAZIONE CONDIZIONALE DEI COMANDI SLASH
+##############################################
+# tree.sync() ha un rate limit stretto e non serve se i comandi non sono
+# cambiati: si salva l'hash della definizione dell'albero (lo stesso payload
+# che sync invierebbe) per ogni applicazione e si sincronizza solo quando
+# cambia. FORCE_COMMAND_SYNC=1 forza la sincronizzazione.
+
+def command_tree_hash(tree) -> str:
+    payload = sorted((command.to_dict(tree) for command in tree.get_commands()), key=lambda c: (c.get("type", 1), c["name"]))
+    return hashlib.sha256(json.dumps(payload, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+def _read_hashes(path):
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def _write_hashes(path, hashes):
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(hashes, f, indent=4)
+    os.replace(tmp_path, path)
+
+async def sync_command_tree(tree, application_id, path: str = COMMAND_SYNC_FILE, force: bool = FORCE_COMMAND_SYNC) -> bool:
+    loop = asyncio.get_running_loop()
+    digest = command_tree_hash(tree)
+    hashes = await loop.run_in_executor(None, _read_hashes, path)
+    key = str(application_id)
+    if not force and hashes.get(key) == digest:
+        print("✅ Comandi slash invariati: sincronizzazione saltata.")
+        return False
+    await tree.sync()
+    hashes[key] = digest
+    await loop.run_in_executor(None, _write_hashes, path, hashes)
+    print(f"🔄 Comandi slash sincronizzati ({len(tree.get_commands())} comandi).")
+    return True
@@ -0,0 +1,147 @@
+import asyncio
+import json
+import os
+import time
+from functools import wraps
+import discord
+from metrics import INTERACTION_FIRST_RESPONSE_SECONDS, INTERACTION_LATE
+
+SLOW_INTERACTION_THRESHOLD = float(os.getenv("SLOW_INTERACTION_THRESHOLD", "1.0"))
+SLOW_INTERACTION_LOG = os.getenv("SLOW_INTERACTION_LOG", "slow_interactions.jsonl")
+INTERACTION_DEADLINE = 3.0
+
+RESPONSE_METHODS = ("defer", "send_message", "edit_message", "send_modal", "pong", "autocomplete")
+
+##############################################
+# TRACCIAMENTO DELLE INTERAZIONI
+##############################################
+# @traced avvolge comandi e callback dei componenti: misura quanto passa tra
+# la creazione dell'interazione (interaction.created_at, lo stesso orologio
+# della scadenza di 3 secondi di Discord, quindi compresi gateway e attesa
+# nell'event loop) e la prima risposta (defer, send_message, ...) andata a
+# buon fine, misurata al ritorno della chiamata a Discord. Il tempo
+# misurato dall'avvio dell'handler resta in un campo a parte. Le interazioni piu' lente
+# di SLOW_INTERACTION_THRESHOLD finiscono, una per riga, in
+# SLOW_INTERACTION_LOG.
+
+_active = {}
+_hooked_classes = set()
+
+class InteractionSpan:
+    __slots__ = (
+        "name", "guild_id", "channel_id", "user_id", "created_at", "start", "queued",
+        "first_response", "handler_first_response", "response_kind", "error"
+    )
+
+    def __init__(self, name, interaction):
+        self.name = name
+        self.guild_id = interaction.guild_id
+        self.channel_id = interaction.channel_id
+        self.user_id = getattr(interaction.user, "id", None)
+        self.created_at = getattr(interaction, "created_at", None)
+        self.start = time.monotonic()
+        # ritardo tra la creazione su Discord e l'avvio dell'handler
+        self.queued = self.age()
+        self.first_response = None
+        self.handler_first_response = None
+        self.response_kind = None
+        self.error = None
+
+    def age(self) -> float:
+        # secondi dalla creazione dell'interazione, come li conta Discord
+        if self.created_at is None:
+            return time.monotonic() - self.start
+        return max(0.0, (discord.utils.utcnow() - self.created_at).total_seconds())
+
+    def responded(self, kind):
+        if self.first_response is None:
+            self.first_response = self.age()
+            self.handler_first_response = time.monotonic() - self.start
+            self.response_kind = kind
+
+    def finish(self):
+        duration = time.monotonic() - self.start
+        waited = self.first_response if self.first_response is not None else self.age()
+        INTERACTION_FIRST_RESPONSE_SECONDS.observe(waited, command=self.name)
+        if waited > INTERACTION_DEADLINE:
+            INTERACTION_LATE.inc(command=self.name)
+        if waited > SLOW_INTERACTION_THRESHOLD:
+            _log_slow({
+                "ts": time.time(),
+                "name": self.name,
+                "guild_id": self.guild_id,
+                "channel_id": self.channel_id,
+                "user_id": self.user_id,
+                "first_response": self.first_response,
+                "handler_first_response": self.handler_first_response,
+                "queued": self.queued,
+                "response": self.response_kind,
+                "duration": duration,
+                "deadline_missed": waited > INTERACTION_DEADLINE,
+                "error": self.error
+            })
+
+def _append_line(path, line):
+    with open(path, "a", encoding="utf-8") as f:
+        f.write(line + "\n")
+
+def _log_slow(entry):
+    print(f"🐢 Interazione lenta: {entry['name']} (gilda {entry['guild_id']}) ha risposto dopo {entry['first_response'] or entry['duration']:.2f}s")
+    line = json.dumps(entry)
+    asyncio.get_running_loop().run_in_executor(None, _append_line, SLOW_INTERACTION_LOG, line)
+
+def _span_name(func, interaction):
+    command = interaction.command
+    if command is not None:
+        return "/" + command.qualified_name
+    return func.__qualname__
+
+def _find_interaction(args):
+    for arg in args:
+        if isinstance(arg, discord.Interaction):
+            return arg
+    return None
+
+def traced(func):
+    @wraps(func)
+    async def wrapper(*args, **kwargs):
+        interaction = _find_interaction(args)
+        if interaction is None or interaction.id in _active:
+            return await func(*args, **kwargs)
+        span = InteractionSpan(_span_name(func, interaction), interaction)
+        _active[interaction.id] = span
+        try:
+            return await func(*args, **kwargs)
+        except Exception as e:
+            span.error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            _active.pop(interaction.id, None)
+            span.finish()
+    return wrapper
+
+def _hook(method, kind):
+    @wraps(method)
+    async def hooked(self, *args, **kwargs):
+        # la risposta conta solo quando Discord l'ha accettata
+        span = _active.get(getattr(self._parent, "id", None))
+        try:
+            result = await method(self, *args, **kwargs)
+        except Exception as e:
+            if span is not None:
+                span.error = f"{kind}: {type(e).__name__}: {e}"
+            raise
+        if span is not None:
+            span.responded(kind)
+        return result
+    return hooked
+
+def install_response_hooks(cls=discord.InteractionResponse):
+    # patch a livello di classe: vale per ogni interazione, qualunque handler risponda
+    if cls in _hooked_classes:
+        return
+    for name in RESPONSE_METHODS:
+        method = getattr(cls, name, None)
+        if method is not None:
+            setattr(cls, name, _hook(method, name))
+    _hooked_classes.add(cls)
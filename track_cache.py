@@ -0,0 +1,219 @@
+import asyncio
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import wavelink
+
+TRACK_CACHE_DB = os.getenv("TRACK_CACHE_DB", "track_cache.db")
+TRACK_CACHE_SIZE = int(os.getenv("TRACK_CACHE_SIZE", "2048"))
+TRACK_CACHE_TTL = float(os.getenv("TRACK_CACHE_TTL", str(7 * 24 * 3600)))
+QUERY_CACHE_SIZE = int(os.getenv("QUERY_CACHE_SIZE", "1024"))
+QUERY_CACHE_TTL = float(os.getenv("QUERY_CACHE_TTL", str(6 * 3600)))
+QUERY_CACHE_NEGATIVE_TTL = float(os.getenv("QUERY_CACHE_NEGATIVE_TTL", "600"))
+
+_MISSING = object()
+
+##############################################
+# CACHE LRU IN MEMORIA CON SCADENZA
+##############################################
+class LRUCache:
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key, default=None):
+        item = self._data.get(key, _MISSING)
+        if item is _MISSING:
+            return default
+        value, expires = item
+        if expires < time.monotonic():
+            del self._data[key]
+            return default
+        self._data.move_to_end(key)
+        return value
+
+    def set(self, key, value, ttl: float | None = None):
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (value, expires)
+        self._data.move_to_end(key)
+        while len(self._data) > self.maxsize:
+            self._data.popitem(last=False)
+
+    def pop(self, key, default=None):
+        item = self._data.pop(key, _MISSING)
+        return default if item is _MISSING else item[0]
+
+    def clear(self):
+        self._data.clear()
+
+##############################################
+# CACHE DEI BRANI RISOLTI (ID VIDEO -> TRACCIA LAVALINK)
+##############################################
+# Primo livello in memoria, secondo livello su SQLite. Si salvano la stringa
+# codificata di Lavalink e le sue info, cosi' la traccia si ricostruisce in
+# locale senza nessuna richiesta a Lavalink.
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS tracks (
+    video_id TEXT PRIMARY KEY,
+    encoded TEXT NOT NULL,
+    info TEXT NOT NULL,
+    title TEXT,
+    length INTEGER,
+    thumbnail TEXT,
+    cached_at REAL NOT NULL
+);
+"""
+
+def build_track(encoded: str, info: dict) -> wavelink.YouTubeTrack:
+    return wavelink.YouTubeTrack(encoded, dict(info))
+
+class TrackCache:
+    def __init__(self, path: str, maxsize: int = TRACK_CACHE_SIZE, ttl: float = TRACK_CACHE_TTL):
+        self.path = path
+        self.ttl = ttl
+        self.memory = LRUCache(maxsize, ttl)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="track-cache")
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(SCHEMA)
+
+    async def run(self, func, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, func, *args)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self._conn.close()
+
+    async def get(self, video_id: str) -> wavelink.YouTubeTrack | None:
+        entry = self.memory.get(video_id)
+        if entry is None:
+            entry = await self.run(self._disk_get, video_id)
+            if entry is None:
+                return None
+            self.memory.set(video_id, entry)
+        return build_track(*entry)
+
+    def put(self, video_id: str, track: wavelink.Track):
+        entry = (track.id, dict(track.info))
+        self.memory.set(video_id, entry)
+        # la scrittura su disco non viene attesa
+        self._executor.submit(self._disk_put, video_id, entry, getattr(track, "thumbnail", None))
+
+    def _disk_get(self, video_id):
+        row = self._conn.execute(
+            "SELECT encoded, info, cached_at FROM tracks WHERE video_id = ?", (video_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        if row[2] + self.ttl < time.time():
+            self._conn.execute("DELETE FROM tracks WHERE video_id = ?", (video_id,))
+            return None
+        return row[0], json.loads(row[1])
+
+    def _disk_put(self, video_id, entry, thumbnail):
+        encoded, info = entry
+        try:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO tracks (video_id, encoded, info, title, length, thumbnail, cached_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (video_id, encoded, json.dumps(info), info.get("title"), info.get("length"), thumbnail, time.time())
+            )
+        except sqlite3.Error as e:
+            print(f"Errore nel salvataggio della cache dei brani: {e}")
+
+    def purge_expired(self):
+        cur = self._conn.execute("DELETE FROM tracks WHERE cached_at < ?", (time.time() - self.ttl,))
+        return cur.rowcount
+
+##############################################
+# CACHE DELLE RICERCHE TESTUALI (/play <nome>)
+##############################################
+# La query normalizzata punta all'ID del video; il brano vero e proprio
+# resta nella TrackCache. Le ricerche senza risultato vengono ricordate
+# per un tempo piu' breve (cache negativa).
+
+NO_RESULT = ""
+_PUNCTUATION_REGEX = re.compile(r"[\W_]+")
+
+def normalize_query(query: str) -> str:
+    query = unicodedata.normalize("NFKC", query).casefold()
+    return " ".join(_PUNCTUATION_REGEX.sub(" ", query).split())
+
+class QueryCache:
+    def __init__(self, maxsize: int = QUERY_CACHE_SIZE, ttl: float = QUERY_CACHE_TTL,
+                 negative_ttl: float = QUERY_CACHE_NEGATIVE_TTL):
+        self.negative_ttl = negative_ttl
+        self.memory = LRUCache(maxsize, ttl)
+        self.hits = 0
+        self.negative_hits = 0
+        self.misses = 0
+
+    def get(self, query: str):
+        # None = mai cercata, NO_RESULT = nessun risultato, altrimenti ID video
+        video_id = self.memory.get(normalize_query(query))
+        if video_id is None:
+            self.misses += 1
+        elif video_id == NO_RESULT:
+            self.negative_hits += 1
+        else:
+            self.hits += 1
+        return video_id
+
+    def set(self, query: str, video_id: str | None):
+        key = normalize_query(query)
+        if video_id:
+            self.memory.set(key, video_id)
+        else:
+            self.memory.set(key, NO_RESULT, ttl=self.negative_ttl)
+
+    def invalidate(self, query: str):
+        self.memory.pop(normalize_query(query))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.negative_hits + self.misses
+        return {
+            "size": len(self.memory),
+            "hits": self.hits,
+            "negative_hits": self.negative_hits,
+            "misses": self.misses,
+            "hit_ratio": (self.hits + self.negative_hits) / lookups if lookups else 0.0
+        }
+
+_track_cache = None
+_track_cache_lock = threading.Lock()
+_query_cache = None
+
+def get_track_cache() -> TrackCache:
+    # creata da init_track_cache in un thread: vedi playlist_manager.get_store
+    global _track_cache
+    if _track_cache is None:
+        with _track_cache_lock:
+            if _track_cache is None:
+                _track_cache = TrackCache(TRACK_CACHE_DB)
+    return _track_cache
+
+def get_query_cache() -> QueryCache:
+    global _query_cache
+    if _query_cache is None:
+        _query_cache = QueryCache()
+    return _query_cache
+
+async def init_track_cache() -> TrackCache:
+    loop = asyncio.get_running_loop()
+    cache = await loop.run_in_executor(None, get_track_cache)
+    purged = await cache.run(cache.purge_expired)
+    if purged:
+        print(f"🧹 Rimossi {purged} brani scaduti dalla cache.")
+    return cache
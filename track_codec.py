@@ -0,0 +1,115 @@
+import base64
+import struct
+
+##############################################
+# CODIFICA DELLE TRACCE LAVALINK (v3 / lavaplayer)
+##############################################
+# La stringa "encoded" di Lavalink e' il messaggio binario di lavaplayer in
+# base64: intestazione (flag << 30 | lunghezza), versione, poi titolo, autore,
+# durata, identificativo, stream, uri (da v2), artwork e isrc (da v3),
+# sorgente e posizione. Le stringhe sono in formato DataOutput.writeUTF di
+# Java. Decodificarla qui evita una chiamata REST a /decodetrack per brano.
+
+TRACK_INFO_VERSIONED = 1
+
+class TrackDecodeError(ValueError):
+    pass
+
+class _Reader:
+    def __init__(self, data: bytes):
+        self.data = data
+        self.pos = 0
+
+    def take(self, size: int) -> bytes:
+        if self.pos + size > len(self.data):
+            raise TrackDecodeError("traccia codificata troncata")
+        chunk = self.data[self.pos:self.pos + size]
+        self.pos += size
+        return chunk
+
+    def byte(self) -> int:
+        return self.take(1)[0]
+
+    def boolean(self) -> bool:
+        return self.byte() != 0
+
+    def long(self) -> int:
+        return struct.unpack(">q", self.take(8))[0]
+
+    def utf(self) -> str:
+        size = struct.unpack(">H", self.take(2))[0]
+        # UTF-8 "modificato" di Java: NUL su due byte e caratteri fuori dal BMP come coppie surrogate
+        raw = self.take(size).replace(b"\xc0\x80", b"\x00")
+        text = raw.decode("utf-8", "surrogatepass")
+        return text.encode("utf-16", "surrogatepass").decode("utf-16")
+
+    def nullable_utf(self) -> str | None:
+        return self.utf() if self.boolean() else None
+
+def decode_track(encoded: str) -> dict:
+    # restituisce le info nello stesso formato di /decodetrack
+    try:
+        reader = _Reader(base64.b64decode(encoded, validate=True))
+    except (ValueError, TypeError) as e:
+        raise TrackDecodeError(f"base64 non valido: {e}") from e
+    try:
+        header = struct.unpack(">I", reader.take(4))[0]
+        flags = (header & 0xC0000000) >> 30
+        version = reader.byte() if flags & TRACK_INFO_VERSIONED else 1
+        title = reader.utf()
+        author = reader.utf()
+        length = reader.long()
+        identifier = reader.utf()
+        is_stream = reader.boolean()
+        uri = reader.nullable_utf() if version >= 2 else None
+        if version >= 3:
+            reader.nullable_utf()  # artworkUrl
+            reader.nullable_utf()  # isrc
+        source = reader.utf()
+        if source in ("http", "local"):
+            reader.utf()  # contenitore/formato del probe
+        position = reader.long()
+    except UnicodeError as e:
+        raise TrackDecodeError(f"testo non valido: {e}") from e
+    return {
+        "identifier": identifier,
+        "isSeekable": not is_stream,
+        "author": author,
+        "length": length,
+        "isStream": is_stream,
+        "position": position,
+        "title": title,
+        "uri": uri,
+        "sourceName": source
+    }
+
+def _utf(text: str) -> bytes:
+    raw = bytearray()
+    for char in text:
+        code = ord(char)
+        if code > 0xFFFF:
+            code -= 0x10000
+            raw += chr(0xD800 + (code >> 10)).encode("utf-8", "surrogatepass")
+            raw += chr(0xDC00 + (code & 0x3FF)).encode("utf-8", "surrogatepass")
+        elif code == 0:
+            raw += b"\xc0\x80"
+        else:
+            raw += char.encode("utf-8", "surrogatepass")
+    return struct.pack(">H", len(raw)) + bytes(raw)
+
+def encode_track(info: dict, version: int = 2) -> str:
+    # inverso di decode_track (usato dal nodo finto dei benchmark)
+    body = bytes([version])
+    body += _utf(info["title"]) + _utf(info["author"])
+    body += struct.pack(">q", int(info["length"]))
+    body += _utf(info["identifier"])
+    body += bytes([bool(info.get("isStream"))])
+    if version >= 2:
+        uri = info.get("uri")
+        body += bytes([uri is not None]) + (_utf(uri) if uri is not None else b"")
+    if version >= 3:
+        body += b"\x00\x00"
+    body += _utf(info.get("sourceName", "youtube"))
+    body += struct.pack(">q", int(info.get("position", 0)))
+    header = struct.pack(">I", (TRACK_INFO_VERSIONED << 30) | len(body))
+    return base64.b64encode(header + body).decode("ascii")
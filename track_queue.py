@@ -0,0 +1,139 @@
+import random
+from collections import Counter, deque
+from itertools import islice
+
+##############################################
+# CODA DEI BRANI DI UNA GILDA
+##############################################
+# Inserimento e prelievo in testa/coda in O(1) grazie alla deque. Niente
+# indice posizionale separato: la deque e' fatta di blocchi da 64 elementi e
+# l'accesso per posizione parte dal lato piu' vicino, quindi costa
+# O(min(i, n - i) / 64), lo stesso vale per insert/remove in mezzo. Con code
+# di qualche migliaio di brani un albero bilanciato non vale la complessita'.
+# Lo slice (coda[a:b]) copia solo gli elementi richiesti. Il contatore degli
+# identificativi permette di sapere in O(1) se un brano e' gia' in coda.
+# Le operazioni di riordino sono esposte dal comando /coda in bot.py.
+
+def track_key(track):
+    return getattr(track, "identifier", None) or getattr(track, "uri", None) or id(track)
+
+def requester_id(track):
+    return getattr(getattr(track, "requester", None), "id", None)
+
+class TrackQueue:
+    def __init__(self, tracks=()):
+        self._items = deque()
+        self._keys = Counter()
+        self.extend(tracks)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __bool__(self):
+        return bool(self._items)
+
+    def __iter__(self):
+        return iter(self._items)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            start, stop, step = index.indices(len(self._items))
+            if step < 0:
+                return list(self._items)[index]
+            return list(islice(self._items, start, stop, step))
+        return self._items[index]
+
+    def __contains__(self, track):
+        return self._keys[track_key(track)] > 0
+
+    def _added(self, track):
+        self._keys[track_key(track)] += 1
+
+    def _removed(self, track):
+        key = track_key(track)
+        self._keys[key] -= 1
+        if self._keys[key] <= 0:
+            del self._keys[key]
+
+    def push(self, track):
+        self._items.append(track)
+        self._added(track)
+
+    def push_front(self, track):
+        self._items.appendleft(track)
+        self._added(track)
+
+    def pop(self):
+        track = self._items.popleft()
+        self._removed(track)
+        return track
+
+    def peek(self):
+        return self._items[0] if self._items else None
+
+    def extend(self, tracks):
+        for track in tracks:
+            self.push(track)
+
+    def insert(self, index, track):
+        self._items.insert(index, track)
+        self._added(track)
+
+    def remove(self, index):
+        track = self._items[index]
+        del self._items[index]
+        self._removed(track)
+        return track
+
+    def remove_range(self, start, stop):
+        start, stop, _ = slice(start, stop).indices(len(self._items))
+        if start >= stop:
+            return []
+        self._items.rotate(-start)
+        removed = [self._items.popleft() for _ in range(stop - start)]
+        self._items.rotate(start)
+        for track in removed:
+            self._removed(track)
+        return removed
+
+    def move(self, src, dst):
+        track = self._items[src]
+        del self._items[src]
+        self._items.insert(dst, track)
+        return track
+
+    def shuffle(self):
+        items = list(self._items)
+        random.shuffle(items)
+        self._items = deque(items)
+
+    def remove_by_requester(self, user_id):
+        kept = deque()
+        removed = []
+        for track in self._items:
+            if requester_id(track) == user_id:
+                removed.append(track)
+                self._removed(track)
+            else:
+                kept.append(track)
+        self._items = kept
+        return removed
+
+    def dedupe(self):
+        if len(self._keys) == len(self._items):
+            return 0
+        seen = set()
+        kept = deque()
+        for track in self._items:
+            key = track_key(track)
+            if key not in seen:
+                seen.add(key)
+                kept.append(track)
+        removed = len(self._items) - len(kept)
+        self._items = kept
+        self._keys = Counter({key: 1 for key in seen})
+        return removed
+
+    def clear(self):
+        self._items.clear()
+        self._keys.clear()
@@ -0,0 +1,170 @@
+import asyncio
+import os
+import re
+import wavelink
+from track_cache import NO_RESULT, build_track, get_query_cache, get_track_cache
+from track_codec import TrackDecodeError, decode_track
+from node_pool import pick_node
+from metrics import ERRORS
+
+RESOLVE_CONCURRENCY = int(os.getenv("RESOLVE_CONCURRENCY", "8"))
+RESOLVE_TIMEOUT = float(os.getenv("RESOLVE_TIMEOUT", "10"))
+
+VIDEO_ID_REGEX = re.compile(r"(?:v=|youtu\.be/)([A-Za-z0-9_-]{11})")
+
+##############################################
+# RISOLUZIONE DEI BRANI SU LAVALINK
+##############################################
+def extract_video_id(url: str) -> str | None:
+    match = VIDEO_ID_REGEX.search(url)
+    return match.group(1) if match else None
+
+async def resolve_url(url: str) -> wavelink.YouTubeTrack | None:
+    video_id = extract_video_id(url)
+    if video_id is None:
+        return await wavelink.YouTubeTrack.search(url, return_first=True)
+
+    cache = get_track_cache()
+    track = await cache.get(video_id)
+    if track is not None:
+        return track
+
+    track = await wavelink.YouTubeTrack.search(f"https://www.youtube.com/watch?v={video_id}", return_first=True)
+    if track:
+        cache.put(video_id, track)
+    return track
+
+async def resolve_query(query: str) -> wavelink.YouTubeTrack | None:
+    queries = get_query_cache()
+    video_id = queries.get(query)
+    if video_id == NO_RESULT:
+        return None
+    if video_id is not None:
+        track = await get_track_cache().get(video_id)
+        if track is not None:
+            return track
+
+    track = await wavelink.YouTubeTrack.search(query, return_first=True)
+    if not track:
+        queries.set(query, None)
+        return None
+    video_id = track.info.get("identifier") or extract_video_id(track.uri or "")
+    if video_id:
+        queries.set(query, video_id)
+        get_track_cache().put(video_id, track)
+    return track
+
+class ResolveReport:
+    def __init__(self):
+        self.tracks = []
+        self.failed = []
+
+    def add(self, index, url, track, error):
+        if track is not None:
+            self.tracks.append(track)
+        else:
+            self.failed.append((index, url, error))
+
+    @property
+    def total(self):
+        return len(self.tracks) + len(self.failed)
+
+async def iter_resolved(urls, *, concurrency: int = RESOLVE_CONCURRENCY, timeout: float = RESOLVE_TIMEOUT):
+    # Risolve fino a `concurrency` brani alla volta ma restituisce i risultati
+    # nell'ordine originale: (indice, url, traccia o None, errore o None).
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def resolve(url):
+        async with semaphore:
+            return await asyncio.wait_for(resolve_url(url), timeout=timeout)
+
+    tasks = [asyncio.create_task(resolve(url)) for url in urls]
+    try:
+        for index, (url, task) in enumerate(zip(urls, tasks)):
+            try:
+                track = await task
+            except asyncio.TimeoutError:
+                ERRORS.inc(source="resolve_timeout")
+                yield index, url, None, "timeout"
+                continue
+            except Exception as e:
+                ERRORS.inc(source="resolve")
+                yield index, url, None, str(e) or type(e).__name__
+                continue
+            if track:
+                yield index, url, track, None
+            else:
+                yield index, url, None, "nessun risultato"
+    finally:
+        for task in tasks:
+            if task.done():
+                if not task.cancelled():
+                    task.exception()
+            else:
+                task.cancel()
+
+async def resolve_all(urls, **kwargs) -> ResolveReport:
+    report = ResolveReport()
+    async for index, url, track, error in iter_resolved(urls, **kwargs):
+        report.add(index, url, track, error)
+    return report
+
+##############################################
+# CARICAMENTO DELLE PLAYLIST SALVATE
+##############################################
+# I brani salvati con la loro stringa "encoded" si ricostruiscono in locale;
+# quelli che non si riescono a decodificare passano tutti insieme in una sola
+# POST /decodetracks e solo i brani senza stringa vengono cercati su Lavalink.
+# Avviare una playlist gia' completa costa quindi zero richieste (o una).
+
+async def decode_remote(encoded: list[str]) -> list[dict | None]:
+    # stessa sessione HTTP e stesso indirizzo REST che wavelink usa per /loadtracks
+    node = pick_node()
+    websocket = node._websocket
+    async with websocket.session.post(
+        f"{websocket.host}/decodetracks", json=encoded, headers={"Authorization": node._password}
+    ) as response:
+        response.raise_for_status()
+        data = await response.json()
+    infos = {item["track"]: item["info"] for item in data}
+    return [infos.get(value) for value in encoded]
+
+async def iter_saved_tracks(songs, *, learned: dict | None = None, **kwargs):
+    # Stesso formato di iter_resolved: (indice, url, traccia o None, errore o None).
+    # In learned finiscono {url: encoded} dei brani che e' stato necessario cercare.
+    tracks = [None] * len(songs)
+    undecoded = []
+    for index, song in enumerate(songs):
+        encoded = song.get("encoded")
+        if not encoded:
+            continue
+        try:
+            tracks[index] = build_track(encoded, decode_track(encoded))
+        except TrackDecodeError:
+            undecoded.append(index)
+
+    if undecoded:
+        try:
+            infos = await decode_remote([songs[i]["encoded"] for i in undecoded])
+        except Exception as e:
+            ERRORS.inc(source="decode")
+            print(f"Errore nella decodifica dei brani su Lavalink: {e}")
+            infos = [None] * len(undecoded)
+        for index, info in zip(undecoded, infos):
+            if info is not None:
+                tracks[index] = build_track(songs[index]["encoded"], info)
+
+    missing = [song["url"] for song, track in zip(songs, tracks) if track is None]
+    resolved = iter_resolved(missing, **kwargs) if missing else None
+    try:
+        for index, (song, track) in enumerate(zip(songs, tracks)):
+            if track is not None:
+                yield index, song["url"], track, None
+                continue
+            _, url, track, error = await resolved.__anext__()
+            if track is not None and learned is not None:
+                learned[url] = track.id
+            yield index, url, track, error
+    finally:
+        if resolved is not None:
+            await resolved.aclose()
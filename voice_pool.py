@@ -0,0 +1,80 @@
+import os
+from collections import OrderedDict
+from idle_reaper import VOICE_KEEPALIVE, listener_count
+from metrics import ERRORS, VOICE_CONNECTIONS
+
+VOICE_POOL_SIZE = int(os.getenv("VOICE_POOL_SIZE", "100"))
+
+##############################################
+# CONNESSIONI VOCALI RIUTILIZZABILI
+##############################################
+# Quando la musica finisce (Stop o coda vuota) il player non lascia il canale
+# ma viene "parcheggiato": riproduzione ferma, coda svuotata, connessione
+# vocale e player Lavalink ancora attivi. Il /play successivo lo riprende
+# senza rifare l'handshake vocale; se l'utente e' in un altro canale il
+# player viene spostato con move_to invece di disconnettersi e riconnettersi.
+# La scadenza dei parcheggi (VOICE_KEEPALIVE) la gestisce l'IdleReaper;
+# oltre VOICE_POOL_SIZE player parcheggiati si chiude il piu' vecchio.
+# VOICE_KEEPALIVE=0 disattiva il pool (disconnessione immediata come prima).
+
+class VoicePool:
+    def __init__(self, connect, keepalive: float = VOICE_KEEPALIVE, size: int = VOICE_POOL_SIZE):
+        # connect(channel): coroutine che crea e connette un nuovo player
+        self.connect = connect
+        self.keepalive = keepalive
+        self.size = size
+        self._parked = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.keepalive > 0
+
+    def __len__(self):
+        return len(self._parked)
+
+    async def acquire(self, channel, player=None):
+        # player: quello gia' presente nella gilda, se c'e'
+        if player is None:
+            VOICE_CONNECTIONS.inc(result="new")
+            return await self.connect(channel)
+
+        parked = self._unpark(player)
+        if not player.is_connected():
+            player.channel = channel
+            await player.connect(timeout=60.0, reconnect=True)
+            result = "reconnected"
+        elif player.channel != channel and (parked or player.current is None or listener_count(player) == 0):
+            # nessuno sta ascoltando nel vecchio canale: il player segue l'utente
+            await player.move_to(channel)
+            result = "moved"
+        else:
+            result = "reused" if parked else "active"
+        VOICE_CONNECTIONS.inc(result=result)
+        return player
+
+    async def park(self, player) -> bool:
+        if not self.enabled or not player.is_connected():
+            return False
+        await player.park()
+        guild_id = player.guild.id
+        self._parked[guild_id] = player
+        self._parked.move_to_end(guild_id)
+        VOICE_CONNECTIONS.inc(result="parked")
+        while len(self._parked) > self.size:
+            _, oldest = self._parked.popitem(last=False)
+            VOICE_CONNECTIONS.inc(result="evicted")
+            try:
+                await oldest.disconnect(force=True)
+            except Exception as e:
+                ERRORS.inc(source="voice_pool")
+                print(f"Errore nella chiusura della connessione vocale della gilda {oldest.guild.id}: {e}")
+        return True
+
+    def forget(self, guild_id: int):
+        self._parked.pop(guild_id, None)
+
+    def _unpark(self, player) -> bool:
+        if self._parked.pop(player.guild.id, None) is None and not getattr(player, "parked", False):
+            return False
+        player.unpark()
+        return True